@@ -3,7 +3,8 @@ const cors = require('cors');
 const http = require('http');
 const WebSocket = require('ws');
 const axios = require('axios');
-const { exec } = require('child_process');
+const { spawn } = require('child_process');
+const readline = require('readline');
 
 const app = express();
 const server = http.createServer(app);
@@ -32,30 +33,70 @@ async function callPythonBackend(endpoint, method = 'GET', data = null) {
   }
 }
 
-// Special function to call python commands scan_ports & auto_connect parsing only last line JSON
-function executePython(command) {
+// drone_controller.py runs as one long-lived daemon speaking JSON lines, so
+// scans and auto-connects skip interpreter start-up and keep controller state.
+const DRONE_CONTROLLER_PATH = 'C:\\Users\\ASUS\\UTMS-MVP\\python-core\\drone_controller.py';
+const CONTROLLER_TIMEOUT_MS = 60000;
+let controllerProcess = null;
+let nextControllerId = 1;
+const pendingControllerCalls = new Map();
+
+function startController() {
+  const proc = spawn('python', [DRONE_CONTROLLER_PATH, 'daemon']);
+  const lines = readline.createInterface({ input: proc.stdout });
+  lines.on('line', (line) => {
+    let response;
+    try {
+      response = JSON.parse(line);
+    } catch (e) {
+      return;
+    }
+    const call = pendingControllerCalls.get(response.id);
+    if (!call) return;
+    pendingControllerCalls.delete(response.id);
+    clearTimeout(call.timer);
+    if (response.error) {
+      call.reject(new Error(response.error));
+    } else {
+      call.resolve(response.result);
+    }
+  });
+  proc.stderr.on('data', (data) => process.stderr.write(data));
+  proc.on('exit', () => controllerGone(proc, 'drone_controller exited'));
+  // A failed spawn or a write to a dead child: forget the process so the next call starts a new one
+  proc.on('error', (error) => {
+    console.error('drone_controller error:', error.message);
+    controllerGone(proc, 'drone_controller error: ' + error.message);
+  });
+  proc.stdin.on('error', (error) => controllerGone(proc, 'drone_controller stdin error: ' + error.message));
+  controllerProcess = proc;
+}
+
+function controllerGone(proc, reason) {
+  if (controllerProcess === proc) controllerProcess = null;
+  pendingControllerCalls.forEach((call, id) => {
+    if (call.proc !== proc) return;
+    clearTimeout(call.timer);
+    pendingControllerCalls.delete(id);
+    call.reject(new Error(reason));
+  });
+}
+
+function executePython(command, args = {}) {
   return new Promise((resolve, reject) => {
-    const cmd = `python "C:\\Users\\ASUS\\UTMS-MVP\\python-core\\drone_controller.py" ${command}`;
-    exec(cmd, (error, stdout, stderr) => {
-      if (error) {
-        reject(stderr || error);
-        return;
-      }
-      try {
-        // Parse only last line for JSON
-        const lines = stdout.trim().split('\n');
-        const lastLine = lines[lines.length - 1];
-        const result = JSON.parse(lastLine);
-        resolve(result);
-      } catch (e) {
-        reject(e);
-      }
-    });
+    if (!controllerProcess) startController();
+    const id = nextControllerId++;
+    const timer = setTimeout(() => {
+      pendingControllerCalls.delete(id);
+      reject(new Error(`${command} timed out`));
+    }, CONTROLLER_TIMEOUT_MS);
+    pendingControllerCalls.set(id, { resolve, reject, timer, proc: controllerProcess });
+    controllerProcess.stdin.write(JSON.stringify({ id, command, args }) + '\n');
   });
 }
 
 
-// Port Scan routed via direct Python script call due to output formatting
+// Port Scan routed via the drone_controller daemon
 app.get('/api/ports/scan', async (req, res) => {
   try {
     const result = await executePython('scan_ports');
@@ -65,7 +106,17 @@ app.get('/api/ports/scan', async (req, res) => {
   }
 });
 
-// Auto-connect routed via direct Python script call due to output formatting
+// Ports plugged in, removed or probed since ?since=<version>, from the daemon's port inventory
+app.get('/api/ports/events', async (req, res) => {
+  try {
+    const result = await executePython('port_events', { since: parseInt(req.query.since, 10) || 0 });
+    res.json(result);
+  } catch (error) {
+    res.status(500).json({ success: false, message: 'Port events failed: ' + error.message });
+  }
+});
+
+// Auto-connect routed via the drone_controller daemon
 app.post('/api/auto-connect', async (req, res) => {
   try {
     const result = await executePython('auto_connect');
@@ -162,25 +213,124 @@ app.post('/api/goto', async (req, res) => {
 });
 
 
+// Fleet APIs: /api/vehicles and /api/vehicles/:id/* map 1:1 onto the Python backend
+app.get('/api/vehicles', async (req, res) => {
+  try {
+    const result = await callPythonBackend('/vehicles');
+    res.json(result);
+  } catch (error) {
+    res.status(500).json({ success: false, message: error.message });
+  }
+});
+
+app.all('/api/vehicles/:vehicleId/*', async (req, res) => {
+  try {
+    const endpoint = req.originalUrl.replace(/^\/api/, '');
+    const body = req.method === 'GET' ? null : req.body;
+    const result = await callPythonBackend(endpoint, req.method, body);
+    res.json(result);
+  } catch (error) {
+    res.status(500).json({ success: false, message: error.message });
+  }
+});
+
+
 // WebSocket telemetry streaming
+// A single upstream SSE subscription to the Python backend is shared by all
+// WebSocket clients; delta frames are merged into the latest state and the
+// merged object is broadcast, so N tabs no longer cost N pollers.
+const TELEMETRY_STREAM_RATE = 2;
+let telemetryState = { connected: false };
+let telemetrySeq = null;
+let telemetryUpstream = null;
+
+function broadcastTelemetry() {
+  const message = JSON.stringify(telemetryState);
+  wss.clients.forEach((client) => {
+    if (client.readyState === WebSocket.OPEN) {
+      client.send(message);
+    }
+  });
+}
+
+function handleTelemetryFrame(frame) {
+  if (frame.full) {
+    // Replaces the state outright: after a disconnect the full frame drops fields a delta can't remove
+    telemetryState = frame.data;
+  } else if (frame.prev === telemetrySeq) {
+    telemetryState = { ...telemetryState, ...frame.delta };
+  } else {
+    // Missed a frame: drop the stream and resync with a fresh full frame
+    stopTelemetryUpstream();
+    startTelemetryUpstream();
+    return;
+  }
+  telemetrySeq = frame.seq;
+  broadcastTelemetry();
+}
+
+function startTelemetryUpstream() {
+  if (telemetryUpstream || wss.clients.size === 0) return;
+  telemetrySeq = null;
+  const url = `${PYTHON_BACKEND_URL}/telemetry/stream?rate=${TELEMETRY_STREAM_RATE}`;
+  const req = http.get(url, (res) => {
+    let buffer = '';
+    res.setEncoding('utf8');
+    res.on('data', (chunk) => {
+      buffer += chunk;
+      let boundary;
+      while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+        const event = buffer.slice(0, boundary);
+        buffer = buffer.slice(boundary + 2);
+        const data = event.split('\n').filter((line) => line.startsWith('data: '));
+        if (data.length === 0) continue;
+        try {
+          handleTelemetryFrame(JSON.parse(data.map((line) => line.slice(6)).join('\n')));
+        } catch (e) {
+          console.error('Telemetry frame error:', e.message);
+        }
+      }
+    });
+    res.on('end', () => {
+      if (telemetryUpstream === req) retryTelemetryUpstream();
+    });
+  });
+  req.on('error', (error) => {
+    console.error('Telemetry stream error:', error.message);
+    telemetryState = { connected: false };
+    broadcastTelemetry();
+    retryTelemetryUpstream();
+  });
+  telemetryUpstream = req;
+}
+
+function stopTelemetryUpstream() {
+  if (telemetryUpstream) {
+    const req = telemetryUpstream;
+    telemetryUpstream = null;
+    req.removeAllListeners('error');
+    req.on('error', () => {});
+    req.destroy();
+  }
+}
+
+function retryTelemetryUpstream() {
+  stopTelemetryUpstream();
+  setTimeout(startTelemetryUpstream, 1000);
+}
+
 wss.on('connection', (ws) => {
   console.log('✅ WebSocket client connected');
 
-  const telemetryInterval = setInterval(async () => {
-    try {
-      const telemetry = await callPythonBackend('/telemetry');
-      if (ws.readyState === WebSocket.OPEN) {
-        ws.send(JSON.stringify(telemetry));
-      }
-    } catch (error) {
-      if (ws.readyState === WebSocket.OPEN) {
-        ws.send(JSON.stringify({ error: 'Telemetry error' }));
-      }
-    }
-  }, 500);
+  if (telemetrySeq !== null) {
+    ws.send(JSON.stringify(telemetryState));
+  }
+  startTelemetryUpstream();
 
   ws.on('close', () => {
-    clearInterval(telemetryInterval);
+    if (wss.clients.size === 0) {
+      stopTelemetryUpstream();
+    }
     console.log('❌ WebSocket client disconnected');
   });
 
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Cold start and auto-connect probe timing for python-core/drone_controller.py
+
+Cold start runs the one-shot CLI (``python drone_controller.py <command>``)
+the way the Node backend used to, once per sample, next to a bare
+interpreter start for reference. The probe benchmark runs port_probe
+against a fake autopilot on a pseudo-terminal that sends HEARTBEAT at 1 Hz,
+with optional silent decoy ports; it needs a POSIX pty and pymavlink.
+
+    python benchmarks/bench_controller.py --runs 10 --probe-runs 5 --decoys 2
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+
+from bench_server import ROOT, percentiles
+
+CORE = os.path.join(ROOT, 'python-core')
+CONTROLLER = os.path.join(CORE, 'drone_controller.py')
+COLD_START_COMMANDS = ('scan_ports', 'telemetry', 'auto_connect')
+# USB VID/PID the fake autopilot's port reports (a CubePilot board)
+AUTOPILOT_USB = (0x2DAE, 0x1016)
+
+
+def time_process(argv, runs):
+    """Wall time of ``runs`` sequential runs of argv, plus the last run's exit code and parsed stdout"""
+    samples = []
+    output = None
+    returncode = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = subprocess.run(argv, cwd=CORE, capture_output=True, text=True)
+        samples.append(time.perf_counter() - start)
+        output = result.stdout.strip()
+        returncode = result.returncode
+    try:
+        output = json.loads(output.splitlines()[-1]) if output else None
+    except ValueError:
+        pass
+    return samples, returncode, output
+
+
+def cold_start(runs=10, commands=COLD_START_COMMANDS):
+    baseline, _, _ = time_process([sys.executable, '-c', 'pass'], runs)
+    results = {"interpreter": percentiles(baseline)}
+    for command in commands:
+        samples, returncode, output = time_process([sys.executable, CONTROLLER, command], runs)
+        results[command] = dict(percentiles(samples), exit_code=returncode,
+                                success=output.get("success") if isinstance(output, dict) else None)
+    return results
+
+
+class FakeAutopilot:
+    """Writes a HEARTBEAT to a pty once per ``period`` seconds, starting at a random phase.
+
+    Like a real serial link, nothing readable arrives unless the reader has
+    set the port to ``baud``; a silent decoy is one with ``period=None``.
+    """
+
+    def __init__(self, baud=115200, period=1.0):
+        import pty
+        import termios
+        from pymavlink.dialects.v20 import ardupilotmega as mavlink
+
+        self.master, slave = pty.openpty()
+        self.device = os.ttyname(slave)
+        self._slave = slave
+        self.period = period
+        self._speed = getattr(termios, f'B{baud}')
+        self._tcgetattr = termios.tcgetattr
+        self._mav = mavlink.MAVLink(None, srcSystem=1, srcComponent=1)
+        self._heartbeat = self._mav.heartbeat_encode(
+            mavlink.MAV_TYPE_QUADROTOR, mavlink.MAV_AUTOPILOT_ARDUPILOTMEGA, 0, 0, mavlink.MAV_STATE_STANDBY)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        if self.period:
+            self._thread.start()
+        return self
+
+    def _run(self):
+        self._stop.wait(random.uniform(0, self.period))
+        while not self._stop.is_set():
+            try:
+                if self._tcgetattr(self._slave)[5] == self._speed:
+                    os.write(self.master, self._heartbeat.pack(self._mav))
+            except Exception:
+                return
+            self._stop.wait(self.period)
+
+    def drain(self):
+        # Nothing reads the master side's input; keep the pty buffer from filling
+        import select
+        while select.select([self.master], [], [], 0)[0]:
+            try:
+                os.read(self.master, 4096)
+            except OSError:
+                return
+
+    def close(self):
+        self._stop.set()
+        for fd in (self.master, self._slave):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+
+def probe(runs=5, decoys=2):
+    """Time probe_ports finding the fake autopilot among ``decoys`` silent ports.
+
+    The autopilot runs at 115200, second in BAUD_RATES, so an uncached probe
+    first listens at 57600 in vain; a cached one goes straight to 115200.
+    """
+    try:
+        import pty  # noqa: F401
+        import pymavlink  # noqa: F401
+    except ImportError as e:
+        return {"skipped": f"needs a POSIX pty and pymavlink: {e}"}
+    sys.path.insert(0, CORE)
+    from port_probe import PortCache, probe_ports
+
+    results = {}
+    with tempfile.TemporaryDirectory(prefix='utms-bench-') as directory:
+        cache = PortCache(os.path.join(directory, 'port_cache.json'))
+        cache.remember(SimpleNamespace(device='', vid=AUTOPILOT_USB[0], pid=AUTOPILOT_USB[1]), 115200)
+        for label, use_cache in (('uncached', None), ('cached', cache)):
+            samples = []
+            found = 0
+            for _ in range(runs):
+                autopilot = FakeAutopilot().start()
+                silent = [FakeAutopilot(period=None) for _ in range(decoys)]
+                ports = [SimpleNamespace(device=autopilot.device, vid=AUTOPILOT_USB[0], pid=AUTOPILOT_USB[1])] + \
+                        [SimpleNamespace(device=d.device, vid=None, pid=None) for d in silent]
+                random.shuffle(ports)
+                try:
+                    start = time.perf_counter()
+                    result = probe_ports(ports, use_cache)
+                    samples.append(time.perf_counter() - start)
+                    found += result is not None and result[0].device == autopilot.device
+                finally:
+                    for fake in [autopilot] + silent:
+                        fake.drain()
+                        fake.close()
+            results[label] = dict(percentiles(samples), found=found, runs=runs)
+    results["decoys"] = decoys
+    return results
+
+
+def add_arguments(parser):
+    parser.add_argument('--runs', type=int, default=10, help='cold start samples per command')
+    parser.add_argument('--commands', default=','.join(COLD_START_COMMANDS), help='comma-separated CLI commands')
+    parser.add_argument('--probe-runs', type=int, default=5, help='auto-connect probe samples')
+    parser.add_argument('--decoys', type=int, default=2, help='silent ports probed beside the autopilot')
+
+
+def run_from_args(args):
+    return {
+        "cold_start": cold_start(args.runs, [c for c in args.commands.split(',') if c]),
+        "probe": probe(args.probe_runs, args.decoys)
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    add_arguments(parser)
+    print(json.dumps(run_from_args(parser.parse_args()), indent=2))
@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+"""
+Load benchmark for persistent_server.py against a simulated fleet
+
+Starts the server on a free local port with its flight logs in a temporary
+directory, registers simulated vehicles through /sim/fleet, then runs
+telemetry pollers, command submitters and SSE subscribers side by side for
+a fixed duration. Samples taken during the warm-up are discarded.
+
+    python benchmarks/bench_server.py --vehicles 10 --pollers 8 --commanders 2 --subscribers 4
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVER = os.path.join(ROOT, 'python-backend', 'persistent_server.py')
+STARTUP_TIMEOUT = 30
+
+
+def percentiles(samples):
+    """count, mean, p50, p95, p99 and max of a list of seconds, in milliseconds"""
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def rank(p):
+        # Nearest-rank percentile
+        return ordered[min(len(ordered) - 1, max(0, int(round(p / 100.0 * len(ordered))) - 1))]
+
+    return {
+        "count": len(ordered),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 3),
+        "p50_ms": round(rank(50) * 1000, 3),
+        "p95_ms": round(rank(95) * 1000, 3),
+        "p99_ms": round(rank(99) * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3)
+    }
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class ServerProcess:
+    """persistent_server.py in a child process, stopped on exit from the with block"""
+
+    def __init__(self, port=None, extra_args=(), log=None):
+        self.port = port or free_port()
+        self.extra_args = list(extra_args)
+        self.log = log
+        self.process = None
+        self.startup_seconds = None
+        self._logdir = None
+
+    def __enter__(self):
+        self._logdir = tempfile.TemporaryDirectory(prefix='utms-bench-')
+        env = dict(os.environ, UTMS_FLIGHTLOG_DIR=self._logdir.name, PYTHONUNBUFFERED='1')
+        env.pop('UTMS_GEOFENCE_FILE', None)
+        started = time.monotonic()
+        self.process = subprocess.Popen(
+            [sys.executable, SERVER, '--host', '127.0.0.1', '--port', str(self.port)] + self.extra_args,
+            cwd=os.path.dirname(SERVER), env=env,
+            stdout=self.log or subprocess.DEVNULL, stderr=subprocess.STDOUT)
+        while time.monotonic() - started < STARTUP_TIMEOUT:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"Server exited with code {self.process.returncode} during startup")
+            try:
+                status, _, _ = Client('127.0.0.1', self.port).request('GET', '/health')
+                if status == 200:
+                    self.startup_seconds = round(time.monotonic() - started, 3)
+                    return self
+            except OSError:
+                pass
+            time.sleep(0.05)
+        self.__exit__()
+        raise RuntimeError(f"Server did not answer /health within {STARTUP_TIMEOUT}s")
+
+    def __exit__(self, *exc):
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        if self._logdir:
+            self._logdir.cleanup()
+
+
+class Client:
+    """One keep-alive HTTP connection; reconnects after an error"""
+
+    def __init__(self, host, port, timeout=10):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self._conn = None
+
+    def request(self, method, path, body=None):
+        """Returns (status, body bytes, seconds)"""
+        if self._conn is None:
+            self._conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        payload = json.dumps(body).encode() if body is not None else None
+        headers = {'Content-Type': 'application/json'} if payload is not None else {}
+        start = time.perf_counter()
+        try:
+            self._conn.request(method, path, payload, headers)
+            response = self._conn.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException):
+            self.close()
+            raise
+        elapsed = time.perf_counter() - start
+        if response.will_close:
+            self.close()
+        return response.status, data, elapsed
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+class Recorder:
+    """Latency samples and status counts per operation, ignoring the warm-up"""
+
+    def __init__(self, measure_from):
+        self.measure_from = measure_from
+        self._lock = threading.Lock()
+        self.samples = {}
+        self.statuses = {}
+        self.errors = {}
+
+    def measuring(self):
+        return time.monotonic() >= self.measure_from
+
+    def add(self, operation, status, seconds):
+        if not self.measuring():
+            return
+        with self._lock:
+            self.samples.setdefault(operation, []).append(seconds)
+            counts = self.statuses.setdefault(operation, {})
+            counts[str(status)] = counts.get(str(status), 0) + 1
+
+    def error(self, operation, exc):
+        if not self.measuring():
+            return
+        with self._lock:
+            counts = self.errors.setdefault(operation, {})
+            name = type(exc).__name__
+            counts[name] = counts.get(name, 0) + 1
+
+
+def poller(client, vehicle_ids, stop, recorder, interval):
+    while not stop.is_set():
+        vehicle_id = random.choice(vehicle_ids)
+        try:
+            status, _, seconds = client.request('GET', f'/vehicles/{vehicle_id}/telemetry')
+            recorder.add('telemetry', status, seconds)
+        except Exception as e:
+            recorder.error('telemetry', e)
+        if interval:
+            stop.wait(interval)
+    client.close()
+
+
+def commander(client, vehicle_ids, stop, recorder, interval, origin):
+    """Mostly gotos near the fleet, with a mode change every tenth command"""
+    count = 0
+    while not stop.is_set():
+        vehicle_id = random.choice(vehicle_ids)
+        count += 1
+        if count % 10 == 0:
+            kind, path, body = 'mode', f'/vehicles/{vehicle_id}/mode', {"mode": "GUIDED"}
+        else:
+            kind, path = 'goto', f'/vehicles/{vehicle_id}/goto'
+            body = {"lat": origin[0] + random.uniform(-0.002, 0.002),
+                    "lon": origin[1] + random.uniform(-0.002, 0.002), "alt": random.uniform(10, 40)}
+        try:
+            status, _, seconds = client.request('POST', path, body)
+            recorder.add(kind, status, seconds)
+        except Exception as e:
+            recorder.error(kind, e)
+        if interval:
+            stop.wait(interval)
+    client.close()
+
+
+def subscriber(host, port, vehicle_id, stop, recorder, rate, fields, results):
+    """Reads one SSE stream, timing the first frame and the gaps between frames"""
+    path = f'/vehicles/{vehicle_id}/telemetry/stream?rate={rate}'
+    if fields:
+        path += f'&fields={fields}'
+    stats = {"frames": 0, "bytes": 0, "gaps": [], "first_frame": None, "error": None}
+    results.append(stats)
+    conn = http.client.HTTPConnection(host, port, timeout=2)
+    try:
+        start = time.perf_counter()
+        conn.request('GET', path)
+        response = conn.getresponse()
+        last = None
+        while not stop.is_set():
+            try:
+                line = response.fp.readline()
+            except socket.timeout:
+                continue
+            if not line:
+                stats["error"] = "stream closed by server"
+                break
+            if not line.startswith(b'data:'):
+                continue
+            now = time.perf_counter()
+            if stats["first_frame"] is None:
+                stats["first_frame"] = now - start
+            if recorder.measuring():
+                stats["frames"] += 1
+                stats["bytes"] += len(line)
+                if last is not None:
+                    stats["gaps"].append(now - last)
+            last = now
+    except Exception as e:
+        stats["error"] = str(e)
+    finally:
+        conn.close()
+
+
+def setup_fleet(client, count):
+    """Register ``count`` simulated vehicles, arm them in GUIDED so gotos are flown"""
+    status, data, _ = client.request('POST', '/sim/fleet', {"count": count, "prefix": "bench"})
+    if status != 200:
+        raise RuntimeError(f"/sim/fleet answered {status}: {data[:200]}")
+    vehicle_ids = json.loads(data)["vehicle_ids"]
+    for vehicle_id in vehicle_ids:
+        client.request('POST', f'/vehicles/{vehicle_id}/mode', {"mode": "GUIDED"})
+        client.request('POST', f'/vehicles/{vehicle_id}/arm')
+    return vehicle_ids
+
+
+def run(vehicles=10, pollers=8, commanders=2, subscribers=4, duration=10.0, warmup=2.0,
+        poll_interval=0.0, command_interval=0.05, stream_rate=10, stream_fields=None, server_args=(), log=None):
+    """Run one mix against a fresh server and return the results as a dict"""
+    with ServerProcess(extra_args=server_args, log=log) as server:
+        host, port = '127.0.0.1', server.port
+        control = Client(host, port, timeout=60)
+        vehicle_ids = setup_fleet(control, vehicles)
+        _, data, _ = control.request('GET', f'/vehicles/{vehicle_ids[0]}/telemetry')
+        first = json.loads(data)
+        origin = (first.get('lat') or 28.6139, first.get('lon') or 77.2090)
+
+        stop = threading.Event()
+        started = time.monotonic()
+        recorder = Recorder(started + warmup)
+        streams = []
+        threads = []
+        for _ in range(pollers):
+            threads.append(threading.Thread(target=poller, args=(
+                Client(host, port), vehicle_ids, stop, recorder, poll_interval)))
+        for _ in range(commanders):
+            threads.append(threading.Thread(target=commander, args=(
+                Client(host, port), vehicle_ids, stop, recorder, command_interval, origin)))
+        for i in range(subscribers):
+            threads.append(threading.Thread(target=subscriber, args=(
+                host, port, vehicle_ids[i % len(vehicle_ids)], stop, recorder, stream_rate, stream_fields, streams)))
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        time.sleep(warmup + duration)
+        stop.set()
+        measured = time.monotonic() - recorder.measure_from
+        for thread in threads:
+            thread.join(5)
+
+        try:
+            _, data, _ = control.request('GET', f'/vehicles/{vehicle_ids[0]}/commands')
+            dispatcher = json.loads(data)
+        except Exception:
+            dispatcher = None
+        control.close()
+
+    operations = {}
+    for operation, samples in recorder.samples.items():
+        operations[operation] = dict(percentiles(samples),
+                                     throughput_per_second=round(len(samples) / measured, 1),
+                                     statuses=recorder.statuses.get(operation, {}),
+                                     errors=recorder.errors.get(operation, {}))
+    frames = sum(s["frames"] for s in streams)
+    return {
+        "config": {"vehicles": vehicles, "pollers": pollers, "commanders": commanders,
+                   "subscribers": subscribers, "duration": duration, "warmup": warmup,
+                   "poll_interval": poll_interval, "command_interval": command_interval,
+                   "stream_rate": stream_rate, "stream_fields": stream_fields, "server_args": list(server_args)},
+        "server_startup_seconds": server.startup_seconds,
+        "measured_seconds": round(measured, 3),
+        "operations": operations,
+        "stream": {
+            "subscribers": len(streams),
+            "frames": frames,
+            "frames_per_second": round(frames / measured, 1),
+            "bytes_per_second": round(sum(s["bytes"] for s in streams) / measured, 1),
+            "first_frame": percentiles([s["first_frame"] for s in streams if s["first_frame"] is not None]),
+            "frame_gap": percentiles([gap for s in streams for gap in s["gaps"]]),
+            "errors": [s["error"] for s in streams if s["error"]]
+        },
+        "dispatcher_sample": dispatcher
+    }
+
+
+def add_arguments(parser):
+    parser.add_argument('--vehicles', type=int, default=10)
+    parser.add_argument('--pollers', type=int, default=8, help='concurrent /telemetry pollers')
+    parser.add_argument('--commanders', type=int, default=2, help='concurrent command submitters')
+    parser.add_argument('--subscribers', type=int, default=4, help='concurrent /telemetry/stream readers')
+    parser.add_argument('--duration', type=float, default=10.0, help='measured seconds')
+    parser.add_argument('--warmup', type=float, default=2.0, help='seconds discarded before measuring')
+    parser.add_argument('--poll-interval', type=float, default=0.0, help='pause between polls (0 = closed loop)')
+    parser.add_argument('--command-interval', type=float, default=0.05, help='pause between commands')
+    parser.add_argument('--stream-rate', type=float, default=10)
+    parser.add_argument('--stream-fields', help='comma-separated ?fields= for subscribers')
+    parser.add_argument('--server-arg', action='append', default=[], help='extra argument for persistent_server.py')
+
+
+def run_from_args(args, log=None):
+    return run(args.vehicles, args.pollers, args.commanders, args.subscribers, args.duration, args.warmup,
+               args.poll_interval, args.command_interval, args.stream_rate, args.stream_fields,
+               args.server_arg, log)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    add_arguments(parser)
+    print(json.dumps(run_from_args(parser.parse_args(), log=sys.stderr), indent=2))
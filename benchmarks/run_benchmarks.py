@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Run the server and DroneController benchmarks and write one JSON result file
+
+The file records the git commit, Python version and platform beside the
+numbers. With --baseline, every p95 that got worse than the baseline's by
+more than --tolerance is listed under "regressions" and the exit code is 1.
+
+    python benchmarks/run_benchmarks.py --output results.json
+    python benchmarks/run_benchmarks.py --baseline results.json --tolerance 0.25
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import bench_controller
+import bench_server
+
+# Percentiles below this are too noisy to call a regression on
+MIN_REGRESSION_MS = 1.0
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=bench_server.ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def p95s(results, prefix=''):
+    """Flatten every "p95_ms" in a result tree to {"path.to.metric": value}"""
+    found = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            if 'p95_ms' in value:
+                found[prefix + key] = value['p95_ms']
+            found.update(p95s(value, prefix + key + '.'))
+    return found
+
+
+def compare(results, baseline, tolerance):
+    current = p95s(results)
+    regressions = []
+    for name, before in p95s(baseline).items():
+        after = current.get(name)
+        if after is None or after < MIN_REGRESSION_MS:
+            continue
+        if after > before * (1 + tolerance):
+            regressions.append({"metric": name, "baseline_p95_ms": before, "p95_ms": after,
+                                "change": round(after / before - 1, 3) if before else None})
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    bench_server.add_arguments(parser)
+    bench_controller.add_arguments(parser)
+    parser.add_argument('--skip-server', action='store_true')
+    parser.add_argument('--skip-controller', action='store_true')
+    parser.add_argument('--output', help='result file (default: stdout)')
+    parser.add_argument('--baseline', help='earlier result file to compare p95 latencies against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed p95 slowdown, 0.2 = 20%%')
+    args = parser.parse_args()
+
+    results = {
+        "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        "commit": git_commit(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpus": os.cpu_count()
+    }
+    if not args.skip_server:
+        print("Running server benchmark...", file=sys.stderr)
+        results["server"] = bench_server.run_from_args(args)
+    if not args.skip_controller:
+        print("Running DroneController benchmark...", file=sys.stderr)
+        results["controller"] = bench_controller.run_from_args(args)
+
+    status = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        results["baseline"] = {"file": args.baseline, "commit": baseline.get("commit"),
+                               "tolerance": args.tolerance}
+        before = baseline.get("server", {}).get("config")
+        after = results.get("server", {}).get("config")
+        if before and after and before != after:
+            print("⚠️ Baseline was run with a different server mix; compare with care", file=sys.stderr)
+            results["baseline"]["config_mismatch"] = True
+        results["regressions"] = compare(results, baseline, args.tolerance)
+        for regression in results["regressions"]:
+            print(f"Regression: {regression['metric']} p95 {regression['baseline_p95_ms']}ms -> "
+                  f"{regression['p95_ms']}ms", file=sys.stderr)
+        status = 1 if results["regressions"] else 0
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+        print(f"Results written to {args.output}", file=sys.stderr)
+    else:
+        print(text)
+    sys.exit(status)
@@ -0,0 +1,343 @@
+"""
+Single-process asyncio HTTP server for the Flask app, with SSE streams served on the event loop
+"""
+import asyncio
+import io
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl, unquote_to_bytes
+
+from werkzeug.datastructures import MultiDict
+from werkzeug.exceptions import HTTPException
+from werkzeug.routing import RequestRedirect
+
+from metrics import REQUEST_SECONDS
+from telemetry import TelemetryStream, sse_event
+
+MAX_HEADER_BYTES = 65536
+MAX_BODY_BYTES = 16 * 1024 * 1024
+IDLE_TIMEOUT = 75
+WORKERS = 32
+
+STREAM_HEADERS = (b'HTTP/1.1 200 OK\r\n'
+                  b'Content-Type: text/event-stream\r\n'
+                  b'Cache-Control: no-cache\r\n'
+                  b'X-Accel-Buffering: no\r\n'
+                  b'Access-Control-Allow-Origin: *\r\n'
+                  b'Connection: close\r\n\r\n')
+
+
+class SnapshotWatch:
+    """Wakes every stream reading one TelemetrySnapshot when it changes.
+
+    The snapshot gets a single subscriber however many streams read it, and
+    its writer thread schedules at most one wake-up on the loop until that
+    wake-up has run, so a busy vehicle costs one call_soon_threadsafe per
+    loop iteration rather than one per change per client.
+    """
+
+    def __init__(self, loop, snapshot):
+        self.loop = loop
+        self.snapshot = snapshot
+        self.events = set()
+        self._pending = False
+        snapshot.subscribe(self._changed)
+
+    def _changed(self, snapshot):
+        if not self._pending:
+            self._pending = True
+            self.loop.call_soon_threadsafe(self._wake)
+
+    def _wake(self):
+        self._pending = False
+        for event in self.events:
+            event.set()
+
+    def close(self):
+        self.snapshot.unsubscribe(self._changed)
+
+
+class AsyncServer:
+    """HTTP/1.1 on asyncio in front of a WSGI app, all in one process.
+
+    Connections, keep-alive and request parsing live on the event loop, so an
+    idle client costs a socket and a coroutine rather than a thread. Each
+    request is handed to the Flask app on a pool of ``workers`` threads,
+    which keeps blocking dronekit calls off the loop. Endpoints registered
+    with ``stream`` skip the app: their opener returns a TelemetryStream and a
+    context manager held for the life of the stream, and frames are written
+    from the loop as the snapshot changes, so thousands of subscribers need
+    no threads at all.
+    """
+
+    def __init__(self, app, host='0.0.0.0', port=5555, workers=WORKERS):
+        self.app = app
+        self.host = host
+        self.port = port
+        self.streams = {}
+        self.connections = 0
+        self.active_streams = 0
+        self.requests = 0
+        self._watches = {}
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix='wsgi')
+        self._urls = None
+        self._loop = None
+
+    def stream(self, endpoint, opener):
+        """Serve ``endpoint`` natively: ``opener(args, **view_args)`` returns (TelemetryStream, hold),
+        or None to leave the request to the app"""
+        self.streams[endpoint] = opener
+
+    def run(self):
+        raise_file_limit()
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._executor.shutdown(wait=False)
+
+    async def serve(self):
+        self._loop = asyncio.get_running_loop()
+        self._urls = self.app.url_map.bind(self.host)
+        server = await asyncio.start_server(self._connection, self.host, self.port,
+                                            limit=MAX_HEADER_BYTES, backlog=1024)
+        async with server:
+            await server.serve_forever()
+
+    def stats(self):
+        return {"connections": self.connections, "streams": self.active_streams,
+                "watched_snapshots": len(self._watches), "requests": self.requests}
+
+    # ----- connections -----
+    async def _connection(self, reader, writer):
+        self.connections += 1
+        peer = writer.get_extra_info('peername') or ('', 0)
+        try:
+            while await self._request(reader, writer, peer):
+                pass
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    async def _request(self, reader, writer, peer):
+        """Serve one request; returns whether the connection stays open"""
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), IDLE_TIMEOUT)
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError):
+            return False
+        except asyncio.LimitOverrunError:
+            await self._error(writer, '431 Request Header Fields Too Large')
+            return False
+        try:
+            method, target, version, headers = parse_head(head)
+            length = int(headers.get('content-length', 0))
+        except ValueError:
+            await self._error(writer, '400 Bad Request')
+            return False
+        if 'chunked' in headers.get('transfer-encoding', '').lower():
+            await self._error(writer, '411 Length Required')
+            return False
+        if length > MAX_BODY_BYTES:
+            await self._error(writer, '413 Payload Too Large')
+            return False
+        if length and headers.get('expect', '').lower() == '100-continue':
+            writer.write(b'HTTP/1.1 100 Continue\r\n\r\n')
+        body = await reader.readexactly(length) if length else b''
+        self.requests += 1
+
+        connection = headers.get('connection', '').lower()
+        keep_alive = connection != 'close' if version == 'HTTP/1.1' else connection == 'keep-alive'
+        path, _, query = target.partition('?')
+        path = unquote_to_bytes(path).decode('latin-1')
+
+        native = self._match_stream(path, method)
+        if native and await self._serve_stream(writer, method, query, *native):
+            return False
+        environ = self._environ(method, path, query, version, headers, body, peer)
+        return await self._serve_app(writer, environ, version, keep_alive)
+
+    async def _error(self, writer, status):
+        writer.write(f'HTTP/1.1 {status}\r\nContent-Length: 0\r\nConnection: close\r\n\r\n'.encode())
+        await writer.drain()
+
+    # ----- WSGI -----
+    def _environ(self, method, path, query, version, headers, body, peer):
+        environ = {
+            'REQUEST_METHOD': method,
+            'SCRIPT_NAME': '',
+            'PATH_INFO': path,
+            'QUERY_STRING': query,
+            'SERVER_NAME': self.host,
+            'SERVER_PORT': str(self.port),
+            'SERVER_PROTOCOL': version,
+            'REMOTE_ADDR': peer[0],
+            'REMOTE_PORT': str(peer[1]),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http',
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        for name, value in headers.items():
+            key = name.upper().replace('-', '_')
+            if key in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+                environ[key] = value
+            else:
+                environ['HTTP_' + key] = value
+        return environ
+
+    def _call_app(self, environ):
+        """Runs on a worker: returns (status, headers, body chunks, iterator still to stream or None)"""
+        started = []
+        written = []
+
+        def start_response(status, headers, exc_info=None):
+            started[:] = [status, headers]
+            return written.append
+
+        result = self.app(environ, start_response)
+        status, headers = started
+        sized = environ['REQUEST_METHOD'] == 'HEAD' or status[:3] in ('204', '304') or \
+            any(name.lower() == 'content-length' for name, _ in headers)
+        if not sized:
+            return status, headers, written, iter(result)
+        try:
+            return status, headers, written + list(result), None
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+
+    async def _serve_app(self, writer, environ, version, keep_alive):
+        loop = self._loop
+        try:
+            status, headers, chunks, iterator = await loop.run_in_executor(self._executor, self._call_app, environ)
+        except Exception as e:
+            print(f"❌ {environ['REQUEST_METHOD']} {environ['PATH_INFO']} failed: {e}")
+            await self._error(writer, '500 Internal Server Error')
+            return False
+        chunked = iterator is not None and version == 'HTTP/1.1'
+        keep_alive = keep_alive and (iterator is None or chunked)
+        lines = [f'HTTP/1.1 {status}'] + [f'{name}: {value}' for name, value in headers]
+        if chunked:
+            lines.append('Transfer-Encoding: chunked')
+        lines.append('Connection: keep-alive' if keep_alive else 'Connection: close')
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+        if iterator is None:
+            writer.writelines(chunks)
+            await writer.drain()
+            return keep_alive
+
+        # A streamed body from the app: each chunk is pulled on a worker, since it may block
+        try:
+            for chunk in chunks:
+                writer.write(frame_chunk(chunk) if chunked else chunk)
+            while True:
+                chunk = await loop.run_in_executor(self._executor, next, iterator, None)
+                if chunk is None:
+                    break
+                if chunk:
+                    writer.write(frame_chunk(chunk) if chunked else chunk)
+                    await writer.drain()
+            if chunked:
+                writer.write(b'0\r\n\r\n')
+            await writer.drain()
+        finally:
+            if hasattr(iterator, 'close'):
+                await loop.run_in_executor(self._executor, iterator.close)
+        return keep_alive
+
+    # ----- native streams -----
+    def _match_stream(self, path, method):
+        if not self.streams:
+            return None
+        try:
+            rule, view_args = self._urls.match(path, method, return_rule=True)
+        except (HTTPException, RequestRedirect):
+            return None
+        opener = self.streams.get(rule.endpoint)
+        return (rule, opener, view_args) if opener else None
+
+    async def _serve_stream(self, writer, method, query, rule, opener, view_args):
+        started = time.perf_counter()
+        try:
+            opened = opener(MultiDict(parse_qsl(query, keep_blank_values=True)), **view_args)
+        except Exception as e:
+            print(f"❌ Could not open stream {rule.rule}: {e}")
+            await self._error(writer, '500 Internal Server Error')
+            return True
+        if opened is None:
+            return False
+        stream, hold = opened
+        writer.write(STREAM_HEADERS)
+        await writer.drain()
+        REQUEST_SECONDS.observe(time.perf_counter() - started, rule.rule, method, '200')
+
+        watch = self._watches.get(id(stream.snapshot))
+        if watch is None:
+            watch = self._watches[id(stream.snapshot)] = SnapshotWatch(self._loop, stream.snapshot)
+        event = asyncio.Event()
+        watch.events.add(event)
+        self.active_streams += 1
+        try:
+            with hold:
+                next_send = 0
+                while True:
+                    delay = next_send - self._loop.time()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                    # Cleared before polling, so a change landing in between still wakes us
+                    event.clear()
+                    frame = stream.poll_frame()
+                    if frame is None:
+                        try:
+                            await asyncio.wait_for(event.wait(), TelemetryStream.KEEPALIVE)
+                        except asyncio.TimeoutError:
+                            writer.write(b': keepalive\n\n')
+                            await writer.drain()
+                        continue
+                    writer.write(sse_event(*frame))
+                    await writer.drain()
+                    next_send = self._loop.time() + stream.min_interval
+        finally:
+            self.active_streams -= 1
+            watch.events.discard(event)
+            if not watch.events:
+                watch.close()
+                del self._watches[id(stream.snapshot)]
+        return True
+
+
+def parse_head(head):
+    """(method, target, version, headers) from the request line and headers; raises ValueError"""
+    lines = head[:-4].decode('latin-1').split('\r\n')
+    method, target, version = lines[0].split(' ')
+    if not version.startswith('HTTP/1.'):
+        raise ValueError(f"Unsupported protocol {version}")
+    headers = {}
+    for line in lines[1:]:
+        name, _, value = line.partition(':')
+        name = name.strip().lower()
+        value = value.strip()
+        headers[name] = f"{headers[name]}, {value}" if name in headers else value
+    return method, target, version, headers
+
+
+def frame_chunk(data):
+    return b'%x\r\n%s\r\n' % (len(data), data)
+
+
+def raise_file_limit():
+    """Lift the soft open-file limit to the hard one so thousands of clients can connect"""
+    try:
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if soft < hard:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    except (ImportError, ValueError, OSError):
+        pass
@@ -0,0 +1,185 @@
+"""
+Fleet-wide telemetry in one response: field selection and JSON, MessagePack or packed columnar encodings
+"""
+import json
+import struct
+import time
+
+import numpy as np
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON = 'application/json'
+MSGPACK = 'application/msgpack'
+COLUMNAR = 'application/vnd.utms.columnar'
+FORMATS = {'json': JSON, 'msgpack': MSGPACK, 'columnar': COLUMNAR}
+ACCEPTED = {JSON: JSON, MSGPACK: MSGPACK, 'application/x-msgpack': MSGPACK, COLUMNAR: COLUMNAR,
+            'application/octet-stream': COLUMNAR}
+
+# Column type per telemetry field. lat/lon stay float64: float32 is only good to ~1 m there
+FIELD_TYPES = {
+    "connected": "bool",
+    "stale": "bool",
+    "armed": "bool",
+    "mode": "str",
+    "lat": "<f8",
+    "lon": "<f8",
+    "alt": "<f4",
+    "groundspeed": "<f4",
+    "airspeed": "<f4",
+    "heading": "<f4",
+    "battery_voltage": "<f4",
+    "battery_remaining": "<i4",
+    "gps_fix": "<i4",
+    "satellites": "<i4",
+    "roll": "<f4",
+    "pitch": "<f4",
+    "yaw": "<f4",
+}
+FIELDS = tuple(FIELD_TYPES)
+
+MAGIC = b'UTMC'
+INT_MISSING = -2 ** 31
+BOOL_MISSING = 255
+CODE_MISSING = 0xFFFF
+
+
+def negotiate(accept, requested=None):
+    """Content type for ``?format=`` if given, else the first acceptable entry of the Accept header.
+
+    Returns None when nothing offered is acceptable, or when MessagePack is
+    asked for but not installed.
+    """
+    if requested:
+        content_type = FORMATS.get(requested)
+    else:
+        content_type = JSON
+        ranked = []
+        for position, part in enumerate((accept or '').split(',')):
+            # Media types and parameter names are case-insensitive
+            media, _, params = part.lower().partition(';')
+            media = media.strip()
+            quality = 1.0
+            for param in params.split(';'):
+                name, _, value = param.strip().partition('=')
+                if name == 'q':
+                    try:
+                        quality = float(value)
+                    except ValueError:
+                        quality = 0.0
+            if quality > 0 and (media in ACCEPTED or media in ('*/*', 'application/*')):
+                ranked.append((-quality, position, ACCEPTED.get(media, JSON)))
+        if ranked:
+            content_type = min(ranked)[2]
+        elif accept and accept.strip():
+            content_type = None
+    if content_type == MSGPACK and msgpack is None:
+        return None
+    return content_type
+
+
+def collect(entries, fields):
+    """(vehicle ids, snapshot versions, rows) with only ``fields`` in each row"""
+    ids, versions, rows = [], [], []
+    for entry in entries:
+        version, values = entry.telemetry.fields()
+        ids.append(entry.vehicle_id)
+        versions.append(version)
+        rows.append({name: values.get(name) for name in fields})
+    return ids, versions, rows
+
+
+def encode_json(ids, versions, rows, fields):
+    return json.dumps(_document(ids, versions, rows, fields)).encode()
+
+
+def encode_msgpack(ids, versions, rows, fields):
+    return msgpack.packb(_document(ids, versions, rows, fields), use_bin_type=True)
+
+
+def _document(ids, versions, rows, fields):
+    return {
+        "time": time.time(),
+        "count": len(ids),
+        "fields": list(fields),
+        "vehicles": [dict(row, vehicle_id=vehicle_id, seq=version)
+                     for vehicle_id, version, row in zip(ids, versions, rows)]
+    }
+
+
+def encode_columnar(ids, versions, rows, fields):
+    """Pack the rows column by column, little-endian.
+
+    Layout::
+
+        "UTMC" | u32 header length | JSON header, space-padded | columns
+
+    The header is padded so the columns start on an 8-byte boundary, and
+    each column is padded to a multiple of 8 bytes, so a client can view
+    them in place (a Float64Array over the same buffer). The header lists
+    the vehicle ids in row order and, per column, its name, dtype (numpy
+    notation), byte offset from the end of the header and missing value;
+    string columns are dictionary-encoded as <u2 codes into ``values``.
+    The ``seq`` column carries each vehicle's snapshot version.
+    """
+    count = len(ids)
+    columns = [("seq", np.asarray(versions, dtype='<u4'), None, None)]
+    for name in fields:
+        values = [row[name] for row in rows]
+        kind = FIELD_TYPES.get(name, "<f8")
+        if kind == "bool":
+            data = np.array([BOOL_MISSING if v is None else bool(v) for v in values], dtype='u1')
+            columns.append((name, data, BOOL_MISSING, None))
+        elif kind == "str":
+            dictionary = sorted({v for v in values if v is not None})
+            codes = {v: i for i, v in enumerate(dictionary)}
+            data = np.array([CODE_MISSING if v is None else codes[v] for v in values], dtype='<u2')
+            columns.append((name, data, CODE_MISSING, dictionary))
+        elif kind == "<i4":
+            data = np.array([INT_MISSING if v is None else int(v) for v in values], dtype='<i4')
+            columns.append((name, data, INT_MISSING, None))
+        else:
+            data = np.array([np.nan if v is None else v for v in values], dtype=kind)
+            columns.append((name, data, "nan", None))
+
+    descriptors = []
+    offset = 0
+    for name, data, missing, dictionary in columns:
+        descriptor = {"name": name, "dtype": data.dtype.str, "offset": offset}
+        if missing is not None:
+            descriptor["missing"] = missing
+        if dictionary is not None:
+            descriptor["values"] = dictionary
+        descriptors.append(descriptor)
+        offset += _padded(data.nbytes)
+
+    header = json.dumps({"time": time.time(), "count": count, "vehicles": ids, "columns": descriptors}).encode()
+    header += b' ' * (_padded(8 + len(header)) - 8 - len(header))
+
+    parts = [MAGIC, struct.pack('<I', len(header)), header]
+    for _, data, _, _ in columns:
+        parts.append(data.tobytes())
+        parts.append(b'\0' * (_padded(data.nbytes) - data.nbytes))
+    return b''.join(parts)
+
+
+def _padded(size):
+    return (size + 7) & ~7
+
+
+def decode_columnar(frame):
+    """Inverse of encode_columnar: (header, {column name: numpy array})"""
+    if frame[:4] != MAGIC:
+        raise ValueError("Not a columnar telemetry frame")
+    length, = struct.unpack_from('<I', frame, 4)
+    header = json.loads(frame[8:8 + length])
+    columns = {column["name"]: np.frombuffer(frame, dtype=column["dtype"], count=header["count"],
+                                             offset=8 + length + column["offset"])
+               for column in header["columns"]}
+    return header, columns
+
+
+ENCODERS = {JSON: encode_json, MSGPACK: encode_msgpack, COLUMNAR: encode_columnar}
@@ -0,0 +1,265 @@
+"""
+Airspace deconfliction: grid-indexed closest-point-of-approach checks across the fleet
+"""
+import math
+import threading
+import time
+
+import numpy as np
+
+from telemetry import TelemetrySnapshot
+
+METERS_PER_DEGREE = 111319.5
+
+
+def _expand(starts, counts):
+    """Concatenate arange(start, start + count) for every (start, count) pair"""
+    total = int(counts.sum())
+    if total == 0:
+        return np.zeros(0, dtype=np.int64)
+    offsets = np.cumsum(counts) - counts
+    return np.repeat(starts - offsets, counts) + np.arange(total)
+
+
+class ConflictDetector:
+    """Predicts losses of separation between tracked vehicles.
+
+    Each vehicle owns one row in flat position/velocity arrays that
+    ``update`` overwrites in place. ``check`` takes the box each vehicle
+    sweeps over the look-ahead horizon (padded by half the separations),
+    finds the pairs whose boxes overlap with a sweep along x inside strips
+    along y, and computes the closest point of approach, vectorized, only for
+    those. Paths are swept in a frame moving with the fleet's mean velocity:
+    separation only depends on relative motion, and a fleet flying together
+    then sweeps small boxes.
+    """
+
+    def __init__(self, horizontal_separation=50.0, vertical_separation=15.0, horizon=30.0,
+                 max_speed=30.0, capacity=1024):
+        self.horizontal_separation = horizontal_separation
+        self.vertical_separation = vertical_separation
+        self.horizon = horizon
+        self.max_speed = max_speed
+        self._lock = threading.Lock()
+        self._index = {}
+        self._ids = []
+        self._alloc(capacity)
+        self.dirty = False
+
+    def _alloc(self, capacity):
+        def grow(name, dtype):
+            new = np.zeros(capacity, dtype=dtype)
+            old = getattr(self, name, None)
+            if old is not None:
+                new[:len(old)] = old
+            setattr(self, name, new)
+        for name in ('lat', 'lon', 'alt', 'speed', 'heading'):
+            grow(name, np.float64)
+        grow('valid', bool)
+
+    def update(self, vehicle_id, fields):
+        """Overwrite a vehicle's row from telemetry fields (armed/lat/lon/alt/groundspeed/heading)"""
+        with self._lock:
+            row = self._index.get(vehicle_id)
+            if row is None:
+                row = len(self._ids)
+                if row >= len(self.lat):
+                    self._alloc(len(self.lat) * 2)
+                self._index[vehicle_id] = row
+                self._ids.append(vehicle_id)
+            # Only armed aircraft with a position take part; parked ones can't conflict
+            active = bool(fields.get("connected") and fields.get("armed")) and bool(fields.get("lat") or fields.get("lon"))
+            self.valid[row] = active
+            if active:
+                self.lat[row] = fields["lat"]
+                self.lon[row] = fields["lon"]
+                self.alt[row] = fields.get("alt") or 0
+                self.speed[row] = fields.get("groundspeed") or 0
+                self.heading[row] = fields.get("heading") or 0
+            self.dirty = True
+
+    def remove(self, vehicle_id):
+        with self._lock:
+            row = self._index.get(vehicle_id)
+            if row is not None:
+                self.valid[row] = False
+                self.dirty = True
+
+    def positions(self):
+        """(vehicle_ids, lat, lon, alt) for the rows taking part in checks"""
+        with self._lock:
+            rows = np.flatnonzero(self.valid[:len(self._ids)])
+            ids = [self._ids[row] for row in rows.tolist()]
+            return ids, self.lat[rows], self.lon[rows], self.alt[rows]
+
+    def _candidate_pairs(self, x, y, alt, vx, vy):
+        """(i, j) with i < j for every pair whose swept boxes overlap"""
+        # Relative to the mean velocity, capped so one bad speed reading can't flood the grid
+        limit = 2 * self.max_speed
+        u = np.clip(vx - vx.mean(), -limit, limit) * self.horizon
+        w = np.clip(vy - vy.mean(), -limit, limit) * self.horizon
+        pad = self.horizontal_separation / 2
+        lo = np.stack([np.minimum(x, x + u) - pad, np.minimum(y, y + w) - pad, alt - self.vertical_separation / 2])
+        hi = np.stack([np.maximum(x, x + u) + pad, np.maximum(y, y + w) + pad, alt + self.vertical_separation / 2])
+
+        # Boxes go into strips along y about as wide as a typical box, then each strip is
+        # swept along x: sorted by low edge, a box pairs with those starting before it ends
+        width = max(float(np.median(hi[1] - lo[1])), self.horizontal_separation)
+        s0 = np.floor((lo[1] - lo[1].min()) / width).astype(np.int64)
+        s1 = np.floor((hi[1] - lo[1].min()) / width).astype(np.int64)
+        counts = s1 - s0 + 1
+        owner = np.repeat(np.arange(len(x)), counts)
+        strip = s0[owner] + np.arange(int(counts.sum())) - np.repeat(np.cumsum(counts) - counts, counts)
+        # Strips laid end to end on one line, far enough apart that no box spans two
+        stride = float(hi[0].max() - lo[0].min()) + 1.0
+        start = strip * stride + (lo[0][owner] - lo[0].min())
+        end = strip * stride + (hi[0][owner] - lo[0].min())
+        order = np.argsort(start, kind='stable')
+        start, end, owner, strip = start[order], end[order], owner[order], strip[order]
+        positions = np.arange(len(start))
+        counts = np.searchsorted(start, end, side='right') - positions - 1
+        a = np.repeat(positions, counts)
+        i, j = owner[a], owner[_expand(positions + 1, counts)]
+        # A pair sharing several strips is kept in the first of them, and only if the
+        # boxes overlap on every axis
+        keep = (strip[a] == np.maximum(s0[i], s0[j])) & \
+            (np.maximum(lo[:, i], lo[:, j]) <= np.minimum(hi[:, i], hi[:, j])).all(axis=0)
+        i, j = i[keep], j[keep]
+        return np.minimum(i, j), np.maximum(i, j)
+
+    def check(self):
+        """Return (conflicts, stats) for the current state of the fleet"""
+        start = time.perf_counter()
+        with self._lock:
+            rows = np.flatnonzero(self.valid[:len(self._ids)])
+            lat, lon, alt = self.lat[rows], self.lon[rows], self.alt[rows]
+            speed, heading = self.speed[rows], self.heading[rows]
+            ids = self._ids
+            self.dirty = False
+
+        conflicts = []
+        pairs = 0
+        if len(rows) > 1:
+            lat0 = float(lat.mean())
+            x = (lon - float(lon.mean())) * METERS_PER_DEGREE * math.cos(math.radians(lat0))
+            y = (lat - lat0) * METERS_PER_DEGREE
+            heading_rad = np.radians(heading)
+            vx = speed * np.sin(heading_rad)
+            vy = speed * np.cos(heading_rad)
+
+            i, j = self._candidate_pairs(x, y, alt, vx, vy)
+            pairs = len(i)
+
+            dz = np.abs(alt[j] - alt[i])
+            keep = dz < self.vertical_separation
+            i, j, dz = i[keep], j[keep], dz[keep]
+
+            px, py = x[j] - x[i], y[j] - y[i]
+            rvx, rvy = vx[j] - vx[i], vy[j] - vy[i]
+            closing = rvx * rvx + rvy * rvy
+            with np.errstate(invalid='ignore', divide='ignore'):
+                t_cpa = np.where(closing > 1e-9, -(px * rvx + py * rvy) / closing, 0.0)
+            t_cpa = np.clip(t_cpa, 0.0, self.horizon)
+            cpa_x, cpa_y = px + rvx * t_cpa, py + rvy * t_cpa
+            cpa = np.hypot(cpa_x, cpa_y)
+            now = np.hypot(px, py)
+
+            hit = np.flatnonzero(cpa < self.horizontal_separation)
+            loss = now[hit] < self.horizontal_separation
+            t_hit = np.round(t_cpa[hit], 2)
+            # Losses of separation first, then soonest; the sort stays in NumPy
+            hit = hit[np.lexsort((t_hit, ~loss))]
+            # Each pair is reported with its vehicle IDs in sorted order
+            names = [ids[row] for row in rows.tolist()]
+            rank = np.argsort(np.argsort(np.array(names, dtype=object)))
+            a, b = i[hit], j[hit]
+            a, b = np.where(rank[a] < rank[b], a, b), np.where(rank[a] < rank[b], b, a)
+            columns = zip(a.tolist(), b.tolist(), (now[hit] < self.horizontal_separation).tolist(),
+                          np.round(t_cpa[hit], 2).tolist(), np.round(cpa[hit], 1).tolist(),
+                          np.round(now[hit], 1).tolist(), np.round(dz[hit], 1).tolist())
+            conflicts = [{
+                "vehicles": [names[a], names[b]],
+                "loss_of_separation": loss,
+                "time_to_cpa": t,
+                "cpa_distance": distance,
+                "current_distance": current,
+                "vertical_distance": vertical
+            } for a, b, loss, t, distance, current, vertical in columns]
+
+        stats = {
+            "vehicles": len(rows),
+            "candidate_pairs": pairs,
+            "check_ms": round((time.perf_counter() - start) * 1000, 3)
+        }
+        return conflicts, stats
+
+
+class AirspaceMonitor:
+    """Feeds telemetry snapshots into a ConflictDetector and publishes results.
+
+    Results are kept in ``feed``, a TelemetrySnapshot, so they can be served
+    pre-encoded and streamed with the same delta frames as telemetry. With a
+    Geofence, the same pass also flags vehicles inside restricted zones.
+    """
+
+    def __init__(self, detector=None, rate=10, geofence=None):
+        self.detector = detector or ConflictDetector()
+        self.rate = rate
+        self.geofence = geofence
+        self.feed = TelemetrySnapshot()
+        self.feed.replace({"conflicts": [], "incursions": [], "vehicles": 0})
+        self._geofence_version = None
+        self.stats = {}
+        self._tracked = set()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def track(self, vehicle_id, snapshot):
+        if id(snapshot) in self._tracked:
+            return
+        self._tracked.add(id(snapshot))
+
+        def on_change(snapshot):
+            version, fields = snapshot.fields()
+            self.detector.update(vehicle_id, fields)
+
+        snapshot.subscribe(on_change)
+        on_change(snapshot)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="airspace-monitor", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def incursions(self):
+        """Vehicles currently inside a zone's footprint and altitude band"""
+        if self.geofence is None:
+            return []
+        self._geofence_version = self.geofence.version
+        index = self.geofence.index
+        ids, lat, lon, alt = self.detector.positions()
+        points, zones = index.check_points(lat, lon, alt)
+        return [{"vehicle_id": ids[p], "zone": index.zones[z]["id"], "name": index.zones[z]["name"]}
+                for p, z in zip(points.tolist(), zones.tolist())]
+
+    def run_once(self):
+        conflicts, stats = self.detector.check()
+        started = time.perf_counter()
+        incursions = self.incursions()
+        stats["geofence_ms"] = round((time.perf_counter() - started) * 1000, 3)
+        self.feed.update({"conflicts": conflicts, "incursions": incursions, "vehicles": stats["vehicles"]})
+        self.stats = stats
+        return conflicts
+
+    def _run(self):
+        interval = 1.0 / self.rate
+        while not self._stop.wait(interval):
+            reloaded = self.geofence is not None and self.geofence.version != self._geofence_version
+            if self.detector.dirty or reloaded:
+                try:
+                    self.run_once()
+                except Exception as e:
+                    print(f"❌ Conflict check failed: {e}")
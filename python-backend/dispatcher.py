@@ -0,0 +1,195 @@
+"""
+Per-vehicle command dispatcher: a priority queue where safety commands preempt and stale ones coalesce
+"""
+import heapq
+import itertools
+import threading
+import time
+import uuid
+
+SAFETY = 0
+CONTROL = 1
+NAVIGATION = 2
+PRIORITY_NAMES = {SAFETY: 'safety', CONTROL: 'control', NAVIGATION: 'navigation'}
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+SUPERSEDED = 'superseded'
+PREEMPTED = 'preempted'
+
+
+class Command:
+    """One queued vehicle command.
+
+    ``action()`` runs on the dispatcher thread and returns a message (or
+    raises). Commands sharing a ``coalesce`` key replace each other while
+    queued, except that a command never replaces one of higher priority, and
+    are sent at most once per ``min_interval`` seconds.
+    ``on_drop(state, reason)`` is called if the command is superseded or
+    preempted before it runs.
+    """
+
+    def __init__(self, kind, action, priority=CONTROL, coalesce=None, min_interval=0, on_drop=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.action = action
+        self.priority = priority
+        self.coalesce = coalesce
+        self.min_interval = min_interval
+        self.on_drop = on_drop
+        self.state = QUEUED
+        self.message = ''
+        self.enqueued = time.monotonic()
+        self.started = None
+        self.finished = None
+        self._done = threading.Event()
+
+    def resolve(self, state, message):
+        self.state = state
+        self.message = message
+        self.finished = time.monotonic()
+        self._done.set()
+
+    def wait(self, timeout):
+        return self._done.wait(timeout)
+
+    @property
+    def wait_ms(self):
+        end = self.started or self.finished or time.monotonic()
+        return round((end - self.enqueued) * 1000, 1)
+
+    def to_dict(self):
+        return {
+            "command_id": self.id,
+            "kind": self.kind,
+            "priority": PRIORITY_NAMES.get(self.priority, self.priority),
+            "state": self.state,
+            "message": self.message,
+            "wait_ms": self.wait_ms
+        }
+
+
+class CommandDispatcher:
+    """Sends one vehicle's commands in priority order from a single thread.
+
+    Submitting a SAFETY command drops every queued lower-priority command and
+    calls ``preempt(reason)`` (the vehicle's running jobs are cancelled)
+    before it runs. The queue is a heap ordered by (priority, arrival);
+    superseded entries are skipped when they reach the top. The thread is
+    started on the first submit, so idle vehicles cost nothing.
+    """
+
+    def __init__(self, vehicle_id, lock=None, preempt=None):
+        self.vehicle_id = vehicle_id
+        self.lock = lock or threading.Lock()
+        self.preempt = preempt
+        self._cond = threading.Condition()
+        self._heap = []
+        self._order = itertools.count()
+        self._latest = {}
+        self._last_sent = {}
+        self._thread = None
+        self.running = None
+        self.counts = {SUPERSEDED: 0, PREEMPTED: 0, DONE: 0, FAILED: 0}
+        self.waits = {}
+
+    def submit(self, command):
+        with self._cond:
+            if command.priority == SAFETY:
+                for _, _, queued in self._heap:
+                    if queued.state == QUEUED and queued.priority > SAFETY:
+                        self._drop(queued, PREEMPTED, f"Preempted by {command.kind}")
+                self._heap = [item for item in self._heap if item[2].state == QUEUED]
+                heapq.heapify(self._heap)
+            if command.coalesce:
+                previous = self._latest.get(command.coalesce)
+                # A queued LAND through /mode must not be lost to a later ordinary mode change
+                if previous is not None and previous.state == QUEUED and previous.priority >= command.priority:
+                    self._drop(previous, SUPERSEDED, f"Superseded by a newer {command.kind}")
+                self._latest[command.coalesce] = command
+            heapq.heappush(self._heap, (command.priority, next(self._order), command))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=f"dispatch-{self.vehicle_id}", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return command
+
+    def _drop(self, command, state, reason):
+        command.resolve(state, reason)
+        self.counts[state] += 1
+        if command.on_drop:
+            try:
+                command.on_drop(state, reason)
+            except Exception:
+                pass
+
+    def _next(self):
+        """Pop the first runnable command, or return the seconds until one is due"""
+        while self._heap and self._heap[0][2].state != QUEUED:
+            heapq.heappop(self._heap)
+        delay = None
+        for priority, order, command in sorted(self._heap):
+            if command.state != QUEUED:
+                continue
+            due = self._last_sent.get(command.coalesce, 0) + command.min_interval if command.coalesce else 0
+            remaining = due - time.monotonic()
+            if remaining <= 0:
+                self._heap.remove((priority, order, command))
+                heapq.heapify(self._heap)
+                return command, None
+            delay = remaining if delay is None else min(delay, remaining)
+        return None, delay
+
+    def _run(self):
+        while True:
+            with self._cond:
+                command, delay = self._next()
+                while command is None:
+                    self._cond.wait(delay)
+                    command, delay = self._next()
+                command.state = RUNNING
+                command.started = time.monotonic()
+                if command.coalesce:
+                    self._last_sent[command.coalesce] = command.started
+                self.running = command
+            self._execute(command)
+
+    def _execute(self, command):
+        try:
+            if command.priority == SAFETY and self.preempt:
+                self.preempt(f"Preempted by {command.kind}")
+            with self.lock:
+                message = command.action()
+            command.resolve(DONE, message or f"{command.kind} sent")
+        except Exception as e:
+            command.resolve(FAILED, str(e))
+        with self._cond:
+            self.running = None
+            self.counts[command.state] += 1
+            stats = self.waits.setdefault(command.kind, {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+            stats["count"] += 1
+            stats["total_ms"] += command.wait_ms
+            stats["max_ms"] = max(stats["max_ms"], command.wait_ms)
+            stats["last_ms"] = command.wait_ms
+
+    def depth(self):
+        with self._cond:
+            return sum(1 for _, _, command in self._heap if command.state == QUEUED)
+
+    def stats(self):
+        with self._cond:
+            queued = [command.to_dict() for _, _, command in sorted(self._heap) if command.state == QUEUED]
+            running = self.running.to_dict() if self.running else None
+            waits = {kind: {"count": s["count"], "mean_ms": round(s["total_ms"] / s["count"], 1),
+                            "max_ms": s["max_ms"], "last_ms": s["last_ms"]}
+                     for kind, s in self.waits.items()}
+            return {
+                "vehicle_id": self.vehicle_id,
+                "depth": len(queued),
+                "queued": queued,
+                "running": running,
+                "counts": dict(self.counts),
+                "wait_ms": waits
+            }
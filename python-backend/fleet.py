@@ -0,0 +1,101 @@
+"""
+Fleet registry: one connection, lock and telemetry snapshot per vehicle ID
+"""
+import threading
+
+from dispatcher import CommandDispatcher
+from jobs import JobTracker
+from metrics import LinkMetrics, TimedLock
+from mission import MissionClient
+from streamrates import StreamRateController
+from telemetry import TelemetrySnapshot
+
+DEFAULT_VEHICLE_ID = 'default'
+
+
+class VehicleEntry:
+    """Connection state for a single vehicle.
+
+    Commands go through ``commands``, which sends them one at a time in
+    priority order while holding ``lock``; attaching and detaching take the
+    same lock. Telemetry is read from ``telemetry`` and never needs it, and
+    long-running commands are tracked by ``jobs`` instead of holding it.
+    """
+
+    def __init__(self, vehicle_id):
+        self.vehicle_id = vehicle_id
+        self.vehicle = None
+        self.lock = TimedLock('vehicle')
+        self.telemetry = TelemetrySnapshot()
+        self.jobs = JobTracker()
+        self.commands = CommandDispatcher(vehicle_id, lock=self.lock, preempt=self.jobs.cancel_all)
+        self.mission = MissionClient()
+        self.streams = StreamRateController()
+        self.link = LinkMetrics(vehicle_id)
+        self.supervisor = None
+        self.port = None
+        self.baud = None
+
+    def attach(self, vehicle, port=None, baud=None):
+        self.vehicle = vehicle
+        self.port = port
+        self.baud = baud
+        self.telemetry.attach(vehicle)
+        self.jobs.attach(vehicle)
+        self.mission.attach(vehicle)
+        self.streams.attach(vehicle, baud)
+        self.link.attach(vehicle)
+
+    def detach(self, keep_telemetry=False):
+        """Forget the vehicle and return it so the caller can close it"""
+        vehicle, self.vehicle = self.vehicle, None
+        self.link.detach()
+        self.streams.detach()
+        self.mission.detach()
+        self.jobs.detach()
+        self.telemetry.detach(keep=keep_telemetry)
+        return vehicle
+
+    def info(self):
+        return {
+            "vehicle_id": self.vehicle_id,
+            "connected": self.vehicle is not None,
+            "link": self.supervisor.state if self.supervisor else None,
+            "port": self.port,
+            "baud": self.baud
+        }
+
+
+class FleetRegistry:
+    """Thread-safe map of vehicle ID -> VehicleEntry.
+
+    The registry lock only guards the dict itself, so looking up one vehicle
+    never waits on a command running against another.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def get(self, vehicle_id):
+        return self._entries.get(vehicle_id)
+
+    def get_or_create(self, vehicle_id):
+        entry = self._entries.get(vehicle_id)
+        if entry is None:
+            with self._lock:
+                entry = self._entries.get(vehicle_id)
+                if entry is None:
+                    entry = VehicleEntry(vehicle_id)
+                    self._entries[vehicle_id] = entry
+        return entry
+
+    def remove(self, vehicle_id):
+        with self._lock:
+            return self._entries.pop(vehicle_id, None)
+
+    def entries(self):
+        return list(self._entries.values())
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,473 @@
+"""
+Geofence / no-fly-zone index: triangulated polygons bucketed into a lat/lon grid
+
+Zones are polygons with an altitude band (metres above home, like the alt in
+/goto). They are compiled once into flat NumPy arrays of triangles and
+boundary edges plus a grid that maps each cell to the triangles and edges
+overlapping it, so point and segment checks only look at a handful of
+candidates. Compiling happens off the request path and the finished index
+is swapped in with a single reference assignment.
+"""
+import json
+import os
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+DEFAULT_CEILING = 10000.0
+DEFAULT_ZONES_FILE = os.environ.get('UTMS_GEOFENCE_FILE')
+MAX_SEGMENT_CELLS = 4096
+# Edge pairs compared at once when checking a polygon for self-intersection
+INTERSECT_BLOCK = 1 << 18
+# Boundary crossings this close along a segment (as a fraction of it) are one crossing at a vertex
+CROSSING_EPS = 1e-9
+
+
+def parse_zones(data):
+    """Accept a list of zones or a GeoJSON FeatureCollection; return zone dicts.
+
+    Zone: {"id", "name", "polygon": [[lat, lon], ...], "floor": 0, "ceiling": 120}
+    GeoJSON polygons use [lon, lat] order and floor/ceiling/name in properties.
+    """
+    if isinstance(data, dict) and data.get("type") == "FeatureCollection":
+        zones = []
+        for n, feature in enumerate(data.get("features", [])):
+            geometry = feature.get("geometry") or {}
+            props = feature.get("properties") or {}
+            if geometry.get("type") == "Polygon":
+                rings = [geometry["coordinates"][0]]
+            elif geometry.get("type") == "MultiPolygon":
+                rings = [polygon[0] for polygon in geometry["coordinates"]]
+            else:
+                continue
+            for k, ring in enumerate(rings):
+                zones.append({
+                    "id": str(feature.get("id", props.get("id", n))) + (f"-{k}" if len(rings) > 1 else ""),
+                    "name": props.get("name", ""),
+                    "polygon": [[lat, lon] for lon, lat in ring],
+                    "floor": props.get("floor", 0),
+                    "ceiling": props.get("ceiling", DEFAULT_CEILING)
+                })
+        return zones
+    if isinstance(data, dict):
+        data = data.get("zones", [])
+    zones = []
+    for n, zone in enumerate(data):
+        zones.append({
+            "id": str(zone.get("id", n)),
+            "name": zone.get("name", ""),
+            "polygon": zone["polygon"],
+            "floor": zone.get("floor", 0),
+            "ceiling": zone.get("ceiling", DEFAULT_CEILING)
+        })
+    return zones
+
+
+def _signed_area(points):
+    x, y = points[:, 0], points[:, 1]
+    return 0.5 * float(np.dot(x, np.roll(y, -1)) - np.dot(np.roll(x, -1), y))
+
+
+def _clean_ring(points):
+    """Indices of a ring's vertices with repeats and collinear vertices dropped; they add no area"""
+    index = np.arange(len(points))
+    while len(index) >= 3:
+        p = points[index]
+        repeat = np.all(p == np.roll(p, 1, axis=0), axis=1)
+        if repeat.any():
+            index = index[~repeat]
+            continue
+        before, after = p - np.roll(p, 1, axis=0), np.roll(p, -1, axis=0) - p
+        straight = before[:, 0] * after[:, 1] - before[:, 1] * after[:, 0] == 0
+        if not straight.any():
+            break
+        index = index[~straight]
+    return index if len(index) >= 3 else index[:0]
+
+
+def _self_intersects(points):
+    """Whether any two non-adjacent edges of the ring touch or cross.
+
+    Edges are sorted by their left end, so each is only compared with the
+    edges after it that start before it ends, in blocks of INTERSECT_BLOCK
+    pairs.
+    """
+    n = len(points)
+    a, b = points, np.roll(points, -1, axis=0)
+    lo, hi = np.minimum(a, b), np.maximum(a, b)
+    order = np.argsort(lo[:, 0], kind='stable')
+    counts = np.searchsorted(lo[order, 0], hi[order, 0], side='right') - np.arange(n) - 1
+    offsets = np.concatenate([[0], np.cumsum(counts)])
+
+    def side(p, q, r):
+        return (q[:, 0] - p[:, 0]) * (r[:, 1] - p[:, 1]) - (q[:, 1] - p[:, 1]) * (r[:, 0] - p[:, 0])
+
+    first = 0
+    while first < n:
+        last = min(max(first + 1, int(np.searchsorted(offsets, offsets[first] + INTERSECT_BLOCK)) - 1), n)
+        sizes = counts[first:last]
+        k = np.repeat(np.arange(first, last), sizes)
+        m = k + 1 + np.arange(int(sizes.sum())) - np.repeat(offsets[first:last] - offsets[first], sizes)
+        i, j = order[k], order[m]
+        gap = np.abs(i - j)
+        keep = (gap > 1) & (gap < n - 1) & (lo[i, 1] <= hi[j, 1]) & (lo[j, 1] <= hi[i, 1])
+        i, j = i[keep], j[keep]
+        if len(i) and np.any((side(a[i], b[i], a[j]) * side(a[i], b[i], b[j]) <= 0) &
+                             (side(a[j], b[j], a[i]) * side(a[j], b[j], b[i]) <= 0)):
+            return True
+        first = last
+    return False
+
+
+def triangulate(points):
+    """Ear-clip a simple polygon (N x 2 array) into a list of index triples.
+
+    Repeated and collinear vertices are dropped first, and a ring whose
+    edges cross or touch raises ValueError. Only a reflex vertex can lie
+    inside a candidate ear, and clipping an ear changes the status of its
+    two neighbours alone, so each ear test scans the reflex vertices in the
+    ear's x-range and the whole clip is O(n²) at worst.
+    """
+    index = _clean_ring(points)
+    n = len(index)
+    if n < 3:
+        return []
+    if _self_intersects(points[index]):
+        raise ValueError("polygon edges cross each other")
+    if _signed_area(points[index]) < 0:
+        index = index[::-1]
+    xs, ys = points[index, 0].tolist(), points[index, 1].tolist()
+    prev = [n - 1] + list(range(n - 1))
+    after = list(range(1, n)) + [0]
+
+    def turn(i):
+        a, c = prev[i], after[i]
+        return (xs[i] - xs[a]) * (ys[c] - ys[a]) - (ys[i] - ys[a]) * (xs[c] - xs[a])
+
+    reflex = {i for i in range(n) if turn(i) < 0}
+    by_x = sorted(reflex, key=xs.__getitem__)
+    reflex_xs = [xs[r] for r in by_x]
+
+    def is_ear(i):
+        a, c = prev[i], after[i]
+        ax, ay, bx, by, cx, cy = xs[a], ys[a], xs[i], ys[i], xs[c], ys[c]
+        y_lo, y_hi = min(ay, by, cy), max(ay, by, cy)
+        for k in range(bisect_left(reflex_xs, min(ax, bx, cx)), bisect_right(reflex_xs, max(ax, bx, cx))):
+            r = by_x[k]
+            if r == a or r == c or r not in reflex:
+                continue
+            px, py = xs[r], ys[r]
+            if py < y_lo or py > y_hi:
+                continue
+            if ((bx - ax) * (py - ay) - (by - ay) * (px - ax) >= 0 and
+                    (cx - bx) * (py - by) - (cy - by) * (px - bx) >= 0 and
+                    (ax - cx) * (py - cy) - (ay - cy) * (px - cx) >= 0):
+                return False
+        return True
+
+    ears = {i for i in range(n) if i not in reflex and is_ear(i)}
+    triangles = []
+    last = 0
+    for _ in range(n - 3):
+        if not ears:
+            raise ValueError("polygon could not be triangulated")
+        i = ears.pop()
+        a, c = prev[i], after[i]
+        triangles.append((int(index[a]), int(index[i]), int(index[c])))
+        after[a], prev[c] = c, a
+        for v in (a, c):
+            # Clipping only ever turns a reflex neighbour convex, never the reverse
+            if v in reflex and turn(v) >= 0:
+                reflex.discard(v)
+            if v not in reflex and is_ear(v):
+                ears.add(v)
+            else:
+                ears.discard(v)
+        last = c
+    triangles.append((int(index[prev[last]]), int(index[last]), int(index[after[last]])))
+    return triangles
+
+
+class GeofenceIndex:
+    """Immutable compiled form of a zone list"""
+
+    def __init__(self, zones, cell_size=None):
+        started = time.perf_counter()
+        self.zones = zones
+        triangles, tri_zone, edges, edge_zone = [], [], [], []
+        for z, zone in enumerate(zones):
+            ring = np.asarray(zone["polygon"], dtype=np.float64)[:, ::-1]  # (lon, lat)
+            if len(ring) > 1 and np.allclose(ring[0], ring[-1]):
+                ring = ring[:-1]
+            try:
+                triangles_of_zone = triangulate(ring)
+            except ValueError as e:
+                raise ValueError(f"Zone {zone['id']}: {e}") from None
+            for i, j, k in triangles_of_zone:
+                triangles.append((ring[i], ring[j], ring[k]))
+                tri_zone.append(z)
+            for i in range(len(ring)):
+                edges.append((ring[i], ring[(i + 1) % len(ring)]))
+                edge_zone.append(z)
+
+        self.triangles = np.asarray(triangles, dtype=np.float64).reshape(-1, 3, 2)
+        self.tri_zone = np.asarray(tri_zone, dtype=np.int64)
+        self.edges = np.asarray(edges, dtype=np.float64).reshape(-1, 2, 2)
+        self.edge_zone = np.asarray(edge_zone, dtype=np.int64)
+        self.floor = np.asarray([float(zone["floor"]) for zone in zones])
+        self.ceiling = np.asarray([float(zone["ceiling"]) for zone in zones])
+
+        if cell_size is None:
+            if len(zones):
+                extent = np.array([np.ptp(np.asarray(zone["polygon"], dtype=np.float64), axis=0).max()
+                                   for zone in zones])
+                cell_size = float(np.clip(np.median(extent), 0.001, 1.0))
+            else:
+                cell_size = 0.01
+        self.cell_size = cell_size
+        self._tri_cells = self._bucket(self.triangles)
+        self._edge_cells = self._bucket(self.edges)
+        self.compile_ms = (time.perf_counter() - started) * 1000
+
+    # ----- grid -----
+    def _cell(self, lon, lat):
+        return np.floor(lon / self.cell_size).astype(np.int64), np.floor(lat / self.cell_size).astype(np.int64)
+
+    @staticmethod
+    def _key(cx, cy):
+        return (cx << 32) + cy
+
+    def _bucket(self, shapes):
+        """CSR map from cell key to the ids of shapes whose bbox overlaps the cell"""
+        if len(shapes) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        x0, y0 = self._cell(shapes[:, :, 0].min(axis=1), shapes[:, :, 1].min(axis=1))
+        x1, y1 = self._cell(shapes[:, :, 0].max(axis=1), shapes[:, :, 1].max(axis=1))
+        nx, ny = x1 - x0 + 1, y1 - y0 + 1
+        counts = nx * ny
+        ids = np.repeat(np.arange(len(shapes)), counts)
+        local = np.arange(int(counts.sum())) - np.repeat(np.cumsum(counts) - counts, counts)
+        cx = np.repeat(x0, counts) + local // np.repeat(ny, counts)
+        cy = np.repeat(y0, counts) + local % np.repeat(ny, counts)
+        keys = self._key(cx, cy)
+        order = np.argsort(keys, kind='stable')
+        keys, ids = keys[order], ids[order]
+        unique, starts = np.unique(keys, return_index=True)
+        return unique, np.append(starts, len(keys)), ids
+
+    def _lookup(self, buckets, keys):
+        unique, offsets, ids = buckets
+        if len(unique) == 0:
+            return np.zeros(len(keys), dtype=np.int64), np.zeros(len(keys), dtype=bool), offsets, ids
+        pos = np.minimum(np.searchsorted(unique, keys), len(unique) - 1)
+        return pos, unique[pos] == keys, offsets, ids
+
+    def _candidates(self, buckets, count, lon0, lat0, lon1, lat1):
+        """Ids of shapes in any cell of the bbox of two corners; all of them for long paths"""
+        cx0, cy0 = self._cell(min(lon0, lon1), min(lat0, lat1))
+        cx1, cy1 = self._cell(max(lon0, lon1), max(lat0, lat1))
+        ncells = (cx1 - cx0 + 1) * (cy1 - cy0 + 1)
+        if ncells > MAX_SEGMENT_CELLS:
+            return np.arange(count)
+        gx, gy = np.meshgrid(np.arange(cx0, cx1 + 1), np.arange(cy0, cy1 + 1))
+        pos, found, offsets, ids = self._lookup(buckets, self._key(gx.ravel(), gy.ravel()))
+        chunks = [ids[offsets[p]:offsets[p + 1]] for p in pos[found]]
+        if not chunks:
+            return np.zeros(0, dtype=np.int64)
+        return np.unique(np.concatenate(chunks))
+
+    # ----- geometry -----
+    def _in_triangles(self, tri, lon, lat):
+        """Boolean (points x triangles) containment, boundaries count as inside"""
+        a, b, c = tri[:, 0], tri[:, 1], tri[:, 2]
+        px, py = lon[:, None], lat[:, None]
+        d1 = (b[:, 0] - a[:, 0]) * (py - a[:, 1]) - (b[:, 1] - a[:, 1]) * (px - a[:, 0])
+        d2 = (c[:, 0] - b[:, 0]) * (py - b[:, 1]) - (c[:, 1] - b[:, 1]) * (px - b[:, 0])
+        d3 = (a[:, 0] - c[:, 0]) * (py - c[:, 1]) - (a[:, 1] - c[:, 1]) * (px - c[:, 0])
+        return (d1 >= 0) & (d2 >= 0) & (d3 >= 0)
+
+    def _band(self, zone_ids, alt_lo, alt_hi):
+        return (self.floor[zone_ids] <= alt_hi) & (self.ceiling[zone_ids] >= alt_lo)
+
+    def _zone_info(self, zone_ids):
+        return [{"id": self.zones[z]["id"], "name": self.zones[z]["name"]} for z in sorted(set(zone_ids))]
+
+    def check_point(self, lat, lon, alt):
+        """Zones containing the point, as [{"id", "name"}]"""
+        if len(self.zones) == 0:
+            return []
+        cx, cy = self._cell(lon, lat)
+        pos, found, offsets, ids = self._lookup(self._tri_cells, np.array([self._key(cx, cy)]))
+        if not found[0]:
+            return []
+        tris = ids[offsets[pos[0]]:offsets[pos[0] + 1]]
+        inside = self._in_triangles(self.triangles[tris], np.array([lon], float), np.array([lat], float))[0]
+        zones = self.tri_zone[tris[inside]]
+        zones = zones[self._band(zones, alt, alt)]
+        return self._zone_info(zones.tolist())
+
+    def check_segment(self, lat0, lon0, alt0, lat1, lon1, alt1):
+        """Zones the straight path between two points enters, as [{"id", "name"}].
+
+        A zone that already contains the start point only counts if the path
+        ends inside it or re-enters it after leaving, so a vehicle inside one
+        can always be sent somewhere outside it, but not elsewhere within it.
+        """
+        if len(self.zones) == 0:
+            return []
+        alt_lo, alt_hi = min(alt0, alt1), max(alt0, alt1)
+        hits = []
+        start_zones = set()
+        # The far end inside a zone
+        tris = self._candidates(self._tri_cells, len(self.triangles), lon0, lat0, lon1, lat1)
+        if len(tris):
+            inside = self._in_triangles(self.triangles[tris], np.array([lon0, lon1], float),
+                                        np.array([lat0, lat1], float))
+            start = self.tri_zone[tris[inside[0]]]
+            start_zones = set(start[self._band(start, alt0, alt0)].tolist())
+            end = np.unique(self.tri_zone[tris[inside[1]]])
+            # A start zone is left by climbing or descending out of its band, so its end is checked at alt1
+            keep = np.array([z not in start_zones for z in end.tolist()], dtype=bool)
+            hits.extend(end[keep | self._band(end, alt1, alt1)].tolist())
+        # Or the path crosses a zone boundary
+        edges = self._candidates(self._edge_cells, len(self.edges), lon0, lat0, lon1, lat1)
+        if len(edges):
+            e = self.edges[edges]
+            p, r = np.array([lon0, lat0]), np.array([lon1 - lon0, lat1 - lat0])
+            q, s = e[:, 0], e[:, 1] - e[:, 0]
+            denom = r[0] * s[:, 1] - r[1] * s[:, 0]
+            qp = q - p
+            with np.errstate(invalid='ignore', divide='ignore'):
+                t = (qp[:, 0] * s[:, 1] - qp[:, 1] * s[:, 0]) / denom
+                u = (qp[:, 0] * r[1] - qp[:, 1] * r[0]) / denom
+            crosses = (denom != 0) & (t >= 0) & (t <= 1) & (u >= 0) & (u <= 1)
+            crossed, t = self.edge_zone[edges[crosses]], t[crosses]
+            for z in np.unique(crossed).tolist():
+                # Leaving a start zone crosses its boundary once; any later crossing re-enters it
+                at = t[crossed == z]
+                if z not in start_zones or at.max() - at.min() > CROSSING_EPS:
+                    hits.append(z)
+        if not hits:
+            return []
+        zones = np.unique(np.asarray(hits, dtype=np.int64))
+        zones = zones[self._band(zones, alt_lo, alt_hi)]
+        return self._zone_info(zones.tolist())
+
+    def check_points(self, lat, lon, alt):
+        """Vectorized check of many points; returns (point_index, zone_index) arrays"""
+        lat, lon, alt = (np.asarray(a, dtype=np.float64) for a in (lat, lon, alt))
+        empty = np.zeros(0, dtype=np.int64)
+        if len(self.zones) == 0 or len(lat) == 0:
+            return empty, empty
+        cx, cy = self._cell(lon, lat)
+        pos, found, offsets, ids = self._lookup(self._tri_cells, self._key(cx, cy))
+        points = np.flatnonzero(found)
+        if len(points) == 0:
+            return empty, empty
+        out_points, out_zones = [], []
+        cells = pos[points]
+        order = np.argsort(cells, kind='stable')
+        cells, points = cells[order], points[order]
+        unique, starts = np.unique(cells, return_index=True)
+        bounds = np.append(starts, len(cells))
+        for n, cell in enumerate(unique.tolist()):
+            members = points[bounds[n]:bounds[n + 1]]
+            tris = ids[offsets[cell]:offsets[cell + 1]]
+            inside = self._in_triangles(self.triangles[tris], lon[members], lat[members])
+            p, t = np.nonzero(inside)
+            if len(p) == 0:
+                continue
+            zones = self.tri_zone[tris[t]]
+            band = self._band(zones, alt[members[p]], alt[members[p]])
+            out_points.append(members[p[band]])
+            out_zones.append(zones[band])
+        if not out_points:
+            return empty, empty
+        pairs = np.unique(np.stack([np.concatenate(out_points), np.concatenate(out_zones)]), axis=1)
+        return pairs[0], pairs[1]
+
+    def stats(self):
+        return {
+            "zones": len(self.zones),
+            "triangles": len(self.triangles),
+            "edges": len(self.edges),
+            "cell_size": self.cell_size,
+            "compile_ms": round(self.compile_ms, 2)
+        }
+
+
+class Geofence:
+    """Current zone index plus non-blocking reloads.
+
+    Every load takes a generation number when it is requested, and its
+    index is only swapped in if no later load has been requested since, so
+    the newest zones win however long each compile takes.
+    """
+
+    def __init__(self):
+        self.index = GeofenceIndex([])
+        self.version = 0
+        self.loading = False
+        self.error = None
+        self._lock = threading.Lock()
+        self._requested = 0
+        # One compile at a time, in the order they were requested
+        self._loader = ThreadPoolExecutor(max_workers=1, thread_name_prefix="geofence-load")
+
+    def _request(self):
+        with self._lock:
+            self._requested += 1
+            return self._requested
+
+    def load(self, zones, generation=None):
+        """Compile zones and swap the new index in, unless a later load was requested meanwhile"""
+        if generation is None:
+            generation = self._request()
+        index = GeofenceIndex(zones)
+        with self._lock:
+            if generation == self._requested:
+                self.index = index
+                self.version += 1
+        return index
+
+    def load_async(self, zones):
+        """Compile on a background thread; checks keep using the old index meanwhile"""
+        generation = self._request()
+
+        def run():
+            error = None
+            # A load superseded while it waited its turn is skipped without compiling
+            if generation == self._requested:
+                try:
+                    self.load(zones, generation)
+                except Exception as e:
+                    error = str(e)
+                    print(f"❌ Geofence load failed: {e}")
+            with self._lock:
+                if generation == self._requested:
+                    self.error = error
+                    self.loading = False
+
+        self.loading = True
+        self._loader.submit(run)
+
+    def load_file(self, path):
+        with open(path) as f:
+            return self.load(parse_zones(json.load(f)))
+
+    def check_point(self, lat, lon, alt):
+        return self.index.check_point(lat, lon, alt)
+
+    def check_segment(self, lat0, lon0, alt0, lat1, lon1, alt1):
+        return self.index.check_segment(lat0, lon0, alt0, lat1, lon1, alt1)
+
+    def check_points(self, lat, lon, alt):
+        return self.index.check_points(lat, lon, alt)
+
+    def stats(self):
+        stats = self.index.stats()
+        stats.update({"version": self.version, "loading": self.loading, "error": self.error})
+        return stats
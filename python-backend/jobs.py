@@ -0,0 +1,270 @@
+"""
+Asynchronous vehicle commands tracked as jobs and completed from MAVLink events
+"""
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from dronekit import VehicleMode
+from pymavlink import mavutil
+
+MAV_RESULT_ACCEPTED = mavutil.mavlink.MAV_RESULT_ACCEPTED
+MAV_RESULT_IN_PROGRESS = mavutil.mavlink.MAV_RESULT_IN_PROGRESS
+MAV_CMD_COMPONENT_ARM_DISARM = mavutil.mavlink.MAV_CMD_COMPONENT_ARM_DISARM
+MAV_CMD_NAV_TAKEOFF = mavutil.mavlink.MAV_CMD_NAV_TAKEOFF
+# ArduPilot acks SET_MODE with the message ID (11) as the command
+MODE_ACK_COMMANDS = (11, mavutil.mavlink.MAV_CMD_DO_SET_MODE)
+
+PENDING = 'pending'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+TIMEOUT = 'timeout'
+CANCELLED = 'cancelled'
+
+
+class Step:
+    """One stage of a job: send ``action``, then wait until ``done`` holds.
+
+    ``watch`` lists the dronekit attributes whose changes may complete the
+    step; ``ack`` lists the MAV_CMD ids whose rejection fails it. ``failed``,
+    if given, returns an error message once the step can no longer succeed.
+    """
+
+    def __init__(self, description, action, done, watch=(), ack=(), failed=None):
+        self.description = description
+        self.action = action
+        self.done = done
+        self.watch = set(watch)
+        self.ack = set(ack)
+        self.failed = failed
+
+
+class Job:
+    def __init__(self, vehicle_id, kind, steps, timeout=10, params=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.vehicle_id = vehicle_id
+        self.kind = kind
+        self.params = params or {}
+        self.steps = list(steps)
+        self.step_index = 0
+        self.timeout = timeout
+        self.state = PENDING
+        self.message = ''
+        self.created = time.time()
+        self.finished_at = None
+        self._finished = threading.Event()
+
+    @property
+    def step(self):
+        return self.steps[self.step_index]
+
+    @property
+    def finished(self):
+        return self._finished.is_set()
+
+    def finish(self, state, message):
+        self.state = state
+        self.message = message
+        self.finished_at = time.time()
+        self._finished.set()
+
+    def wait(self, timeout):
+        return self._finished.wait(timeout)
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "vehicle_id": self.vehicle_id,
+            "kind": self.kind,
+            "params": self.params,
+            "state": self.state,
+            "step": self.steps[min(self.step_index, len(self.steps) - 1)].description if self.steps else None,
+            "message": self.message,
+            "created": self.created,
+            "finished": self.finished_at
+        }
+
+
+class JobTracker:
+    """Runs the jobs of one vehicle and completes them from its events.
+
+    Listeners on the watched attributes and on COMMAND_ACK advance or fail the
+    active jobs; nothing here sleeps or polls, and a timer fails any job that
+    has not completed within its timeout.
+    """
+
+    WATCHED = ('armed', 'mode', 'location.global_relative_frame', 'mission')
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._active = []
+        self._vehicle = None
+
+    def attach(self, vehicle):
+        self.detach()
+        for attr_name in self.WATCHED:
+            vehicle.add_attribute_listener(attr_name, self._on_attribute)
+        vehicle.add_message_listener('COMMAND_ACK', self._on_ack)
+        self._vehicle = vehicle
+
+    def detach(self):
+        with self._lock:
+            vehicle, self._vehicle = self._vehicle, None
+            if vehicle is not None:
+                try:
+                    for attr_name in self.WATCHED:
+                        vehicle.remove_attribute_listener(attr_name, self._on_attribute)
+                    vehicle.remove_message_listener('COMMAND_ACK', self._on_ack)
+                except:
+                    pass
+            for job in list(self._active):
+                self._finish(job, FAILED, "Vehicle disconnected")
+
+    def active(self):
+        with self._lock:
+            return list(self._active)
+
+    def cancel_all(self, message):
+        """Finish every running job as cancelled, e.g. when a safety command takes over"""
+        with self._lock:
+            for job in list(self._active):
+                self._finish(job, CANCELLED, message)
+
+    def start(self, job):
+        """Begin a job; returns immediately"""
+        with self._lock:
+            if self._vehicle is None:
+                job.finish(FAILED, "No vehicle connected")
+                return job
+            job.state = RUNNING
+            self._active.append(job)
+            timer = threading.Timer(job.timeout, self._expire, [job])
+            timer.daemon = True
+            timer.start()
+            self._run_step(job)
+        return job
+
+    def _run_step(self, job):
+        vehicle = self._vehicle
+        while job.step_index < len(job.steps):
+            step = job.step
+            if not step.done(vehicle):
+                try:
+                    step.action(vehicle)
+                except Exception as e:
+                    self._finish(job, FAILED, str(e))
+                    return
+                # Actions that complete synchronously fall through to the next step
+                if job.finished or job.step is not step or not step.done(vehicle):
+                    return
+            job.step_index += 1
+        self._finish(job, SUCCEEDED, f"{job.kind} complete")
+
+    def _finish(self, job, state, message):
+        if job in self._active:
+            self._active.remove(job)
+        if not job.finished:
+            job.finish(state, message)
+
+    def _expire(self, job):
+        with self._lock:
+            if not job.finished:
+                self._finish(job, TIMEOUT, f"Timed out after {job.timeout}s waiting for: {job.step.description}")
+
+    def _on_attribute(self, vehicle, attr_name, value):
+        with self._lock:
+            for job in list(self._active):
+                step = job.step
+                if attr_name not in step.watch:
+                    continue
+                error = step.failed(vehicle) if step.failed else None
+                if error:
+                    self._finish(job, FAILED, error)
+                elif step.done(vehicle):
+                    job.step_index += 1
+                    self._run_step(job)
+
+    def _on_ack(self, vehicle, name, msg):
+        if msg.result in (MAV_RESULT_ACCEPTED, MAV_RESULT_IN_PROGRESS):
+            return
+        with self._lock:
+            for job in list(self._active):
+                if msg.command in job.step.ack:
+                    self._finish(job, FAILED, f"{job.step.description} rejected by autopilot (MAV_RESULT {msg.result})")
+
+
+class JobManager:
+    """Index of recent jobs across the fleet, for status queries"""
+
+    def __init__(self, max_jobs=1000):
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()
+        self.max_jobs = max_jobs
+
+    def add(self, job):
+        with self._lock:
+            self._jobs[job.id] = job
+            while len(self._jobs) > self.max_jobs:
+                self._jobs.popitem(last=False)
+        return job
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def for_vehicle(self, vehicle_id):
+        with self._lock:
+            return [job for job in self._jobs.values() if job.vehicle_id == vehicle_id]
+
+
+def mode_step(mode):
+    def action(vehicle):
+        vehicle.mode = VehicleMode(mode)
+    return Step(f"mode {mode}", action, lambda vehicle: vehicle.mode.name == mode,
+                watch=('mode',), ack=MODE_ACK_COMMANDS)
+
+
+def arm_step(armed):
+    def action(vehicle):
+        vehicle.armed = armed
+    return Step("arm" if armed else "disarm", action, lambda vehicle: vehicle.armed == armed,
+                watch=('armed',), ack=(MAV_CMD_COMPONENT_ARM_DISARM,))
+
+
+def arm_job(vehicle_id, timeout=10):
+    return Job(vehicle_id, 'arm', [mode_step('GUIDED'), arm_step(True)], timeout)
+
+
+def disarm_job(vehicle_id, timeout=10):
+    return Job(vehicle_id, 'disarm', [arm_step(False)], timeout)
+
+
+def mode_job(vehicle_id, mode, timeout=5):
+    return Job(vehicle_id, 'mode', [mode_step(mode)], timeout, {"mode": mode})
+
+
+def takeoff_job(vehicle_id, altitude, timeout=60):
+    def reached(vehicle):
+        location = vehicle.location.global_relative_frame
+        return location is not None and location.alt is not None and location.alt >= altitude * 0.95
+
+    climb = Step(f"climb to {altitude}m", lambda vehicle: vehicle.simple_takeoff(altitude), reached,
+                 watch=('location.global_relative_frame',), ack=(MAV_CMD_NAV_TAKEOFF,))
+    return Job(vehicle_id, 'takeoff', [climb], timeout, {"altitude": altitude})
+
+
+def mission_job(vehicle_id, mission, items, refresh=False):
+    """Upload ``items`` through the vehicle's MissionClient; follows its ``mission`` attribute"""
+    transfer = {}
+
+    def start(vehicle):
+        transfer["id"] = mission.upload(items, refresh)
+
+    def outcome(state):
+        result = mission.result
+        return result["transfer"] == transfer.get("id") and result["state"] == state
+
+    upload = Step(f"upload {len(items)} mission items", start, lambda vehicle: outcome('succeeded'),
+                  watch=('mission',), failed=lambda vehicle: outcome('failed') and mission.result["message"])
+    return Job(vehicle_id, 'mission', [upload], 15 + len(items), {"items": len(items), "refresh": refresh})
@@ -0,0 +1,290 @@
+"""
+Prometheus-format metrics, lock timing, per-link MAVLink counters and a sampling profiler
+"""
+import bisect
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter as StackCounter
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+LOCK_BUCKETS = (0.00001, 0.0001, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30)
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + (extra or [])
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+class Metric:
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def header(self):
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._series[labels] = self._series.get(labels, 0) + amount
+
+    def render(self):
+        with self._lock:
+            series = list(self._series.items())
+        return self.header() + [f'{self.name}{_format_labels(self.labels, key)} {value}' for key, value in series]
+
+
+class Gauge(Metric):
+    """A value read when metrics are scraped: ``collect()`` yields (label values, value)"""
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labels=(), collect=None, kind='gauge'):
+        super().__init__(name, documentation, labels)
+        self.collect = collect
+        self.kind = kind
+
+    def render(self):
+        try:
+            series = list(self.collect())
+        except Exception:
+            series = []
+        return self.header() + [f'{self.name}{_format_labels(self.labels, key)} {value}' for key, value in series]
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        with self._lock:
+            series = [(key, list(counts), total, count) for key, (counts, total, count) in self._series.items()]
+        lines = self.header()
+        for key, counts, total, count in series:
+            cumulative = 0
+            for bound, n in zip(self.buckets + ('+Inf',), counts):
+                cumulative += n
+                lines.append(f'{self.name}_bucket{_format_labels(self.labels, key, [("le", bound)])} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labels, key)} {total}')
+            lines.append(f'{self.name}_count{_format_labels(self.labels, key)} {count}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labels=()):
+        return self.register(Counter(name, documentation, labels))
+
+    def histogram(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labels, buckets))
+
+    def gauge(self, name, documentation, labels=(), collect=None, kind='gauge'):
+        return self.register(Gauge(name, documentation, labels, collect, kind))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+REQUEST_SECONDS = REGISTRY.histogram(
+    'utms_http_request_duration_seconds', 'Time to produce a response (first byte for streams)',
+    ('route', 'method', 'status'))
+LOCK_WAIT_SECONDS = REGISTRY.histogram(
+    'utms_lock_wait_seconds', 'Time spent waiting to acquire a lock', ('lock',), LOCK_BUCKETS)
+LOCK_HOLD_SECONDS = REGISTRY.histogram(
+    'utms_lock_hold_seconds', 'Time a lock was held', ('lock',), LOCK_BUCKETS)
+CONNECT_ATTEMPTS = REGISTRY.counter(
+    'utms_connect_attempts_total', 'Connection attempts by outcome', ('vehicle', 'outcome'))
+HEARTBEAT_LOSSES = REGISTRY.counter(
+    'utms_heartbeat_losses_total', 'Times a connected link went silent', ('vehicle',))
+RECONNECTS = REGISTRY.counter(
+    'utms_reconnects_total', 'Links closed and reopened after heartbeat loss', ('vehicle',))
+
+
+class TimedLock:
+    """A Lock that records how long callers wait for it and how long it is held"""
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self._acquired = 0.0
+
+    def acquire(self, blocking=True, timeout=-1):
+        start = time.perf_counter()
+        acquired = self._lock.acquire(blocking, timeout)
+        if acquired:
+            self._acquired = time.perf_counter()
+            LOCK_WAIT_SECONDS.observe(self._acquired - start, self.name)
+        return acquired
+
+    def release(self):
+        held = time.perf_counter() - self._acquired
+        self._lock.release()
+        LOCK_HOLD_SECONDS.observe(held, self.name)
+
+    def locked(self):
+        return self._lock.locked()
+
+    __enter__ = acquire
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class LinkMetrics:
+    """Per-vehicle MAVLink counters, fed by a '*' message listener.
+
+    The listener only bumps a dict entry; it runs on dronekit's receive
+    thread, which is the only writer, so no lock is taken.
+    """
+
+    def __init__(self, vehicle_id):
+        self.vehicle_id = vehicle_id
+        self.messages = {}
+        self._vehicle = None
+
+    def attach(self, vehicle):
+        self.detach()
+        vehicle.add_message_listener('*', self._on_message)
+        self._vehicle = vehicle
+
+    def detach(self):
+        vehicle, self._vehicle = self._vehicle, None
+        if vehicle is not None:
+            try:
+                vehicle.remove_message_listener('*', self._on_message)
+            except:
+                pass
+
+    def _on_message(self, vehicle, name, msg):
+        self.messages[name] = self.messages.get(name, 0) + 1
+
+    def link_counters(self):
+        """pymavlink's byte and packet counters for a real link, else {}"""
+        mav = getattr(getattr(self._vehicle, '_master', None), 'mav', None)
+        if mav is None:
+            return {}
+        return {
+            "bytes_received": getattr(mav, 'total_bytes_received', 0),
+            "bytes_sent": getattr(mav, 'total_bytes_sent', 0),
+            "packets_received": getattr(mav, 'total_packets_received', 0),
+            "receive_errors": getattr(mav, 'total_receive_errors', 0),
+        }
+
+
+def instrument(app, registry=REGISTRY):
+    """Time every Flask request by its URL rule and serve ``registry`` at /metrics"""
+    from flask import Response, g, request
+
+    @app.before_request
+    def start_timer():
+        g.metrics_start = time.perf_counter()
+
+    @app.after_request
+    def record_latency(response):
+        start = getattr(g, 'metrics_start', None)
+        if start is not None:
+            route = request.url_rule.rule if request.url_rule else 'unmatched'
+            REQUEST_SECONDS.observe(time.perf_counter() - start, route, request.method, str(response.status_code))
+        return response
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics_api():
+        return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+
+class SamplingProfiler:
+    """Samples every thread's stack with sys._current_frames while switched on.
+
+    Costs nothing when off. When on, one daemon thread wakes every
+    ``interval`` seconds and counts each thread's innermost ``depth`` frames;
+    ``folded()`` returns them in the collapsed format flame graph tools read.
+    """
+
+    def __init__(self, interval=0.005, depth=30):
+        self.interval = interval
+        self.depth = depth
+        self.samples = 0
+        self.stacks = StackCounter()
+        self.started = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval=None):
+        if self.running:
+            return
+        if interval:
+            self.interval = interval
+        self.samples = 0
+        self.stacks = StackCounter()
+        self.started = time.time()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        own = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            if len(names) != threading.active_count():
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = traceback.extract_stack(frame, limit=self.depth)
+                key = (names.get(ident, str(ident)),) + tuple(
+                    f"{entry.name} ({os.path.basename(entry.filename)}:{entry.lineno})" for entry in stack)
+                self.stacks[key] += 1
+            self.samples += 1
+
+    def top(self, limit=20):
+        return [{"thread": key[0], "stack": list(key[1:]), "samples": count}
+                for key, count in self.stacks.most_common(limit)]
+
+    def folded(self):
+        return '\n'.join(';'.join(key) + f' {count}' for key, count in self.stacks.most_common()) + '\n'
+
+    def stats(self):
+        return {"running": self.running, "interval": self.interval, "samples": self.samples,
+                "started": self.started, "distinct_stacks": len(self.stacks)}
@@ -0,0 +1,331 @@
+"""
+Mission upload over the MAVLink mission protocol, writing only the items that changed
+"""
+import threading
+import time
+from collections import namedtuple
+
+from pymavlink import mavutil
+
+FRAME = mavutil.mavlink.MAV_FRAME_GLOBAL_RELATIVE_ALT_INT
+MISSION_ACCEPTED = mavutil.mavlink.MAV_MISSION_ACCEPTED
+ITEM_TIMEOUT = 1.5
+MAX_RETRIES = 5
+DOWNLOAD_WINDOW = 8
+
+PENDING = 'pending'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+
+MissionItem = namedtuple('MissionItem', 'frame command param1 param2 param3 param4 x y z autocontinue')
+
+# Item 0 is the home position; the autopilot overwrites it, so its content never matters
+HOME_PLACEHOLDER = MissionItem(mavutil.mavlink.MAV_FRAME_GLOBAL, mavutil.mavlink.MAV_CMD_NAV_WAYPOINT,
+                               0, 0, 0, 0, 0, 0, 0, 1)
+
+
+def command_id(command):
+    """MAV_CMD id from an int or a name like "WAYPOINT", "TAKEOFF" or "DO_CHANGE_SPEED" """
+    if isinstance(command, int):
+        return command
+    name = str(command).upper()
+    for prefix in ('MAV_CMD_NAV_', 'MAV_CMD_', ''):
+        value = getattr(mavutil.mavlink, prefix + name, None)
+        if isinstance(value, int):
+            return value
+    raise ValueError(f"Unknown mission command: {command}")
+
+
+def make_item(lat, lon, alt, command='WAYPOINT', params=(0, 0, 0, 0), frame=FRAME):
+    p = (list(params) + [0, 0, 0, 0])[:4]
+    return MissionItem(frame, command_id(command), round(float(p[0]), 4), round(float(p[1]), 4),
+                       round(float(p[2]), 4), round(float(p[3]), 4),
+                       int(round(float(lat) * 1e7)), int(round(float(lon) * 1e7)), round(float(alt), 2), 1)
+
+
+def parse_waypoints(data):
+    """Mission items from [{"lat", "lon", "alt", "command", "params"}, ...] or [[lat, lon, alt], ...]"""
+    items = []
+    for waypoint in data:
+        if isinstance(waypoint, dict):
+            items.append(make_item(waypoint.get('lat', 0), waypoint.get('lon', 0), waypoint.get('alt', 0),
+                                   waypoint.get('command', 'WAYPOINT'), waypoint.get('params', ())))
+        else:
+            items.append(make_item(*waypoint[:3]))
+    return items
+
+
+def item_from_message(msg):
+    """MissionItem from a MISSION_ITEM_INT or MISSION_ITEM message"""
+    if msg.get_type() == 'MISSION_ITEM':
+        x, y = int(round(msg.x * 1e7)), int(round(msg.y * 1e7))
+    else:
+        x, y = msg.x, msg.y
+    return MissionItem(msg.frame, msg.command, round(msg.param1, 4), round(msg.param2, 4),
+                       round(msg.param3, 4), round(msg.param4, 4), x, y, round(msg.z, 2), msg.autocontinue)
+
+
+def item_to_dict(item):
+    return {
+        "command": item.command,
+        "frame": item.frame,
+        "lat": item.x / 1e7,
+        "lon": item.y / 1e7,
+        "alt": item.z,
+        "params": [item.param1, item.param2, item.param3, item.param4]
+    }
+
+
+def plan_upload(current, new):
+    """How to turn the mission ``current`` into ``new`` (both with home at index 0).
+
+    Returns ('unchanged', None, None), ('partial', first, last) when the
+    length is the same and only items first..last differ, or ('full', 0, n - 1).
+    """
+    if current is None or len(current) != len(new):
+        return 'full', 0, len(new) - 1
+    changed = [seq for seq in range(1, len(new)) if current[seq] != new[seq]]
+    if not changed:
+        return 'unchanged', None, None
+    return 'partial', changed[0], changed[-1]
+
+
+class MissionClient:
+    """Mission transfers for one vehicle, driven entirely by its message listeners.
+
+    ``items`` caches the mission on the vehicle (home at index 0) after the
+    last download or upload, so a new upload is diffed against it and only
+    the changed range is written. During an upload every MISSION_REQUEST is
+    answered from the listener with an item encoded up front; downloads keep
+    a window of requests outstanding. A watchdog resends whatever was last
+    sent when the vehicle goes quiet, up to MAX_RETRIES times per item.
+    Progress is announced as the ``mission`` attribute so jobs can follow it.
+    """
+
+    MESSAGES = ('MISSION_COUNT', 'MISSION_ITEM', 'MISSION_ITEM_INT',
+                'MISSION_REQUEST', 'MISSION_REQUEST_INT', 'MISSION_ACK')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._vehicle = None
+        self.items = None
+        self.result = {"transfer": 0, "state": PENDING, "message": ''}
+        self._transfer = 0
+        self._phase = None
+
+    def attach(self, vehicle):
+        self.detach()
+        for name in self.MESSAGES:
+            vehicle.add_message_listener(name, self._on_message)
+        self._vehicle = vehicle
+        self.items = None
+
+    def detach(self):
+        with self._lock:
+            vehicle, self._vehicle = self._vehicle, None
+            if vehicle is not None:
+                try:
+                    for name in self.MESSAGES:
+                        vehicle.remove_message_listener(name, self._on_message)
+                except:
+                    pass
+            finished = self._phase is not None and self._finish(FAILED, "Vehicle disconnected")
+        if finished and vehicle is not None:
+            self._notify(vehicle)
+
+    @staticmethod
+    def supported(vehicle):
+        return hasattr(vehicle, 'message_factory') and hasattr(vehicle, 'send_mavlink')
+
+    # ----- public -----
+    def upload(self, items, refresh=False):
+        """Start writing ``items`` (home excluded); returns the transfer number straight away"""
+        with self._lock:
+            vehicle = self._vehicle
+            if vehicle is None:
+                raise RuntimeError("No vehicle connected")
+            if not self.supported(vehicle):
+                raise RuntimeError("Vehicle does not support missions")
+            if self._phase is not None:
+                raise RuntimeError("Mission transfer already in progress")
+            self._transfer += 1
+            transfer = self._transfer
+            self._target = list(items)
+            self._started = time.monotonic()
+            self._sent = 0
+            self._retries_total = 0
+            self.result = {"transfer": transfer, "state": RUNNING, "message": ''}
+            if self.items is None or refresh:
+                self._start_download()
+            else:
+                self._start_upload()
+            finished = self._phase is None
+        if finished:
+            self._notify(vehicle)
+        else:
+            threading.Thread(target=self._watchdog, args=(transfer,), name="mission-watchdog",
+                             daemon=True).start()
+        return transfer
+
+    def to_dict(self):
+        return {
+            "items": [item_to_dict(item) for item in self.items[1:]] if self.items else [],
+            "cached": self.items is not None,
+            "last_transfer": self.result
+        }
+
+    # ----- protocol -----
+    def _send(self, msg):
+        self._vehicle.send_mavlink(msg)
+        self._sent += 1
+
+    def _progress(self, resend):
+        self._resend = resend
+        self._retries = 0
+        self._last_progress = time.monotonic()
+
+    def _start_download(self):
+        factory = self._vehicle.message_factory
+        self._phase = 'download'
+        self._count = None
+        self._received = {}
+        request_list = factory.mission_request_list_encode(0, 0)
+        self._send(request_list)
+        self._progress(lambda: self._send(request_list))
+
+    def _request_items(self, seqs):
+        factory = self._vehicle.message_factory
+        for seq in seqs:
+            self._send(factory.mission_request_int_encode(0, 0, seq))
+            self._asked[seq] = self._ask_counter = self._ask_counter + 1
+            self._requested = max(self._requested, seq + 1)
+
+    def _resend_missing(self):
+        missing = [seq for seq in range(self._count) if seq not in self._received][:DOWNLOAD_WINDOW]
+        self._request_items(missing)
+
+    def _start_upload(self):
+        factory = self._vehicle.message_factory
+        home = self.items[0] if self.items else HOME_PLACEHOLDER
+        self._new = [home] + self._target
+        mode, first, last = plan_upload(self.items, self._new)
+        if mode == 'unchanged':
+            self._finish(SUCCEEDED, "Mission unchanged")
+            return
+        self._phase = 'upload'
+        self._range = (first, last)
+        self._encoded = {seq: factory.mission_item_int_encode(0, 0, seq, *self._item_fields(self._new[seq]))
+                         for seq in range(first, last + 1)}
+        if mode == 'partial':
+            header = factory.mission_write_partial_list_encode(0, 0, first, last)
+        else:
+            header = factory.mission_count_encode(0, 0, len(self._new))
+        self.result["written"] = last - first + 1
+        self.result["mode"] = mode
+        self._send(header)
+        self._progress(lambda: self._send(header))
+
+    @staticmethod
+    def _item_fields(item):
+        # frame, command, current, autocontinue, params 1-4, x, y, z
+        return (item.frame, item.command, 0, item.autocontinue, item.param1, item.param2,
+                item.param3, item.param4, item.x, item.y, item.z)
+
+    def _on_message(self, vehicle, name, msg):
+        with self._lock:
+            if self._phase is None or vehicle is not self._vehicle:
+                return
+            if getattr(msg, 'mission_type', 0):
+                return
+            if self._phase == 'download':
+                self._on_download(name, msg)
+            else:
+                self._on_upload(name, msg)
+            finished = self._phase is None
+        if finished:
+            self._notify(vehicle)
+
+    def _on_download(self, name, msg):
+        if name == 'MISSION_COUNT' and self._count is None:
+            self._count = msg.count
+            self._requested = 0
+            self._asked = {}
+            self._ask_counter = 0
+            if self._count == 0:
+                self.items = []
+                self._start_upload()
+                return
+            self._request_items(list(range(min(DOWNLOAD_WINDOW, self._count))))
+            self._progress(self._resend_missing)
+        elif name in ('MISSION_ITEM_INT', 'MISSION_ITEM') and self._count is not None:
+            if msg.seq >= self._count or msg.seq in self._received:
+                return
+            self._received[msg.seq] = item_from_message(msg)
+            answered = self._asked.pop(msg.seq, 0)
+            self._progress(self._resend_missing)
+            if len(self._received) == self._count:
+                self._send(self._vehicle.message_factory.mission_ack_encode(0, 0, MISSION_ACCEPTED))
+                self.items = [self._received[seq] for seq in range(self._count)]
+                self._start_upload()
+                return
+            # The link is in order: anything asked for before this item and still missing was lost
+            lost = [seq for seq, asked in self._asked.items() if asked < answered]
+            if self._requested < self._count:
+                lost.append(self._requested)
+            self._request_items(lost)
+
+    def _on_upload(self, name, msg):
+        if name in ('MISSION_REQUEST', 'MISSION_REQUEST_INT'):
+            item = self._encoded.get(msg.seq)
+            if item is None:
+                return
+            self._send(item)
+            self._progress(lambda: self._send(item))
+        elif name == 'MISSION_ACK':
+            if msg.type == MISSION_ACCEPTED:
+                self.items = self._new
+                self._finish(SUCCEEDED, f"Mission uploaded ({self.result['written']} items written)")
+            else:
+                # The vehicle may hold a half-written mission now; download it next time
+                self.items = None
+                result = mavutil.mavlink.enums['MAV_MISSION_RESULT'].get(msg.type)
+                self._finish(FAILED, f"Mission rejected: {result.name if result else msg.type}")
+
+    def _finish(self, state, message):
+        self._phase = None
+        self.result.update({
+            "state": state,
+            "message": message,
+            "messages_sent": self._sent,
+            "retries": self._retries_total,
+            "seconds": round(time.monotonic() - self._started, 3)
+        })
+        return True
+
+    def _notify(self, vehicle):
+        try:
+            vehicle.notify_attribute_listeners('mission', self.result)
+        except:
+            pass
+
+    def _watchdog(self, transfer):
+        while True:
+            time.sleep(ITEM_TIMEOUT / 4)
+            with self._lock:
+                if self._phase is None or self._transfer != transfer:
+                    return
+                if time.monotonic() - self._last_progress < ITEM_TIMEOUT:
+                    continue
+                vehicle = self._vehicle
+                if self._retries >= MAX_RETRIES:
+                    self.items = None
+                    self._finish(FAILED, f"No response from vehicle during mission {self._phase}")
+                else:
+                    self._retries += 1
+                    self._retries_total += 1
+                    self._last_progress = time.monotonic()
+                    self._resend()
+                    continue
+            self._notify(vehicle)
+            return
@@ -1,193 +1,595 @@
-from flask import Flask, jsonify, request
+import argparse
+from contextlib import contextmanager, nullcontext
+
+from flask import Flask, Response, jsonify, request
 from flask_cors import CORS
-from dronekit import connect, VehicleMode, LocationGlobalRelative
-import threading
-import time
+from dronekit import VehicleMode, LocationGlobalRelative
+
+from asyncserver import AsyncServer
+from bulk import ENCODERS, FIELD_TYPES, FIELDS, MSGPACK, collect, msgpack, negotiate
+from deconfliction import AirspaceMonitor
+from dispatcher import CONTROL, NAVIGATION, SAFETY, Command
+from fleet import DEFAULT_VEHICLE_ID, FleetRegistry
+from geofence import DEFAULT_ZONES_FILE, Geofence, parse_zones
+from jobs import CANCELLED, FAILED, SUCCEEDED, JobManager, arm_job, disarm_job, mission_job, mode_job, takeoff_job
+from metrics import REGISTRY, SamplingProfiler, instrument
+from mission import parse_waypoints
+from recorder import COLUMNS, FlightRecorder
+from replay import ReplayVehicle
+from simulator import fleet_from_uri
+from streamrates import POLL_TTL, StreamRateScheduler
+from supervisor import STAGES, ConnectionSupervisor, open_dronekit
+from telemetry import DISCONNECTED_PAYLOAD, TelemetryStream
+from tracks import TrackService
 
 app = Flask(__name__)
 CORS(app)
+instrument(app)
 
-vehicle = None
-vehicle_lock = threading.Lock()
+fleet = FleetRegistry()
+jobs = JobManager()
+recorder = FlightRecorder()
+tracks = TrackService(recorder)
+geofence = Geofence()
+airspace = AirspaceMonitor(geofence=geofence)
+stream_rates = StreamRateScheduler(fleet.entries)
+sim_fleets = []
 
-def connect_vehicle(connection_string='COM6', baud=9600):
-    global vehicle
-    with vehicle_lock:
-        if vehicle:
-            try:
-                vehicle.close()
-            except:
-                pass
-            vehicle = None
+profiler = SamplingProfiler()
+
+REGISTRY.gauge('utms_vehicles_connected', 'Vehicles with a live link',
+               collect=lambda: [((), sum(1 for entry in fleet.entries() if entry.vehicle is not None))])
+REGISTRY.gauge('utms_command_queue_depth', 'Commands waiting in a vehicle dispatcher', ('vehicle',),
+               collect=lambda: [((entry.vehicle_id,), entry.commands.depth())
+                                for entry in fleet.entries() if entry.commands.waits])
+REGISTRY.gauge('utms_mavlink_messages_total', 'MAVLink messages received by type', ('vehicle', 'type'),
+               collect=lambda: [((entry.vehicle_id, name), count) for entry in fleet.entries()
+                                for name, count in list(entry.link.messages.items())], kind='counter')
+for counter in ('bytes_received', 'bytes_sent', 'packets_received', 'receive_errors'):
+    REGISTRY.gauge(f'utms_link_{counter}_total', f'Serial link {counter.replace("_", " ")} since connecting',
+                   ('vehicle',), kind='counter',
+                   collect=lambda counter=counter: [((entry.vehicle_id,), values[counter])
+                                                    for entry in fleet.entries()
+                                                    for values in [entry.link.link_counters()] if values])
+
+# How long a request waits for its command to leave the queue before answering 202
+COMMAND_WAIT = 2.0
+# Gotos are sent at most this often; newer targets replace queued ones meanwhile
+GOTO_INTERVAL = 0.2
+
+def vehicle_route(rule, **options):
+    """Register a view at /vehicles/<vehicle_id><rule> and at the legacy <rule> for the default vehicle"""
+    def decorator(view):
+        app.route(rule, defaults={'vehicle_id': DEFAULT_VEHICLE_ID}, **options)(view)
+        return app.route('/vehicles/<vehicle_id>' + rule, **options)(view)
+    return decorator
+
+def open_vehicle(connection_string, baud, report=lambda stage: None):
+    """Open a dronekit vehicle, or a virtual one for replay:<tlog> and sim: connection strings"""
+    if connection_string.startswith('replay:'):
+        vehicle = ReplayVehicle.from_uri(connection_string)
+    elif connection_string.startswith('sim:'):
+        vehicle = fleet_from_uri(connection_string).vehicles[0]
+    else:
+        return open_dronekit(connection_string, baud, report)
+    for stage in STAGES:
+        report(stage)
+    return vehicle
+
+def close_vehicle(entry):
+    """Detach and close whatever vehicle the entry holds; call with entry.lock held"""
+    old = entry.detach()
+    if old:
         try:
-            vehicle = connect(connection_string, baud=baud, wait_ready=True, timeout=30)
-            print(f"✅ Connected to vehicle on {connection_string} at {baud} baud")
-        except Exception as e:
-            print(f"❌ Connection failed: {str(e)}")
-            raise
-
-@app.route('/connect', methods=['POST'])
-def connect_api():
+            old.close()
+        except:
+            pass
+
+def attach_vehicle(entry, vehicle, port, baud):
+    """Attach a vehicle to its entry and feed it to the recorder and conflict monitor"""
+    entry.attach(vehicle, port, baud)
+    recorder.track(entry.vehicle_id, entry.telemetry)
+    airspace.track(entry.vehicle_id, entry.telemetry)
+    if isinstance(vehicle, ReplayVehicle):
+        # Started only now, so the snapshot and recorder see the log from its first message
+        vehicle.start()
+
+def connect_vehicle(vehicle_id, connection_string='COM6', baud=9600):
+    """Hand the vehicle's link to a new supervisor, which connects in the background"""
+    entry = fleet.get_or_create(vehicle_id)
+    previous = entry.supervisor
+    if previous:
+        previous.stop()
+    # Close the old link first: a serial port (e.g. on a baud change) can only be open once.
+    # An old supervisor still inside its opener holds the port too, so the new one waits for it
+    with entry.lock:
+        close_vehicle(entry)
+    entry.supervisor = ConnectionSupervisor(entry, open_vehicle, attach_vehicle, connection_string, baud,
+                                            previous=previous).start()
+    return entry.supervisor
+
+@app.route('/vehicles', methods=['GET'])
+def vehicles_api():
+    return jsonify({"vehicles": [entry.info() for entry in fleet.entries()]})
+
+@vehicle_route('/connect', methods=['POST'])
+def connect_api(vehicle_id):
     data = request.json
     port = data.get('port', 'COM6')
     baud = data.get('baud', 9600)  # Default changed here
-    try:
-        connect_vehicle(port, baud)
-        return jsonify({"success": True, "message": f"Connected to {port} at {baud} baud"})
-    except Exception as e:
-        return jsonify({"success": False, "message": str(e)}), 500
+    # Returns at once; poll /connection for progress, or pass "wait": seconds to block
+    supervisor = connect_vehicle(vehicle_id, port, baud)
+    wait = data.get('wait')
+    if wait:
+        state = supervisor.wait_connected(min(float(wait), 60))
+        if state == 'connected':
+            return jsonify({"success": True, "message": f"Connected to {port} at {baud} baud", "vehicle_id": vehicle_id,
+                            "connection": supervisor.status()})
+        if state == 'failed':
+            return jsonify({"success": False, "message": supervisor.last_error, "vehicle_id": vehicle_id,
+                            "connection": supervisor.status()}), 500
+    return jsonify({"success": True, "message": f"Connecting to {port} at {baud} baud", "vehicle_id": vehicle_id,
+                    "connection": supervisor.status()}), 202
 
-@app.route('/disconnect', methods=['POST'])
-def disconnect_api():
-    global vehicle
-    with vehicle_lock:
+@vehicle_route('/connection', methods=['GET'])
+def connection_api(vehicle_id):
+    entry = fleet.get(vehicle_id)
+    if entry is None or entry.supervisor is None:
+        return jsonify({"success": False, "message": "No connection for vehicle"}), 404
+    return jsonify(entry.supervisor.status())
+
+@vehicle_route('/disconnect', methods=['POST'])
+def disconnect_api(vehicle_id):
+    entry = fleet.get(vehicle_id)
+    if entry is None:
+        return jsonify({"success": False, "message": "No vehicle connected"}), 400
+    supervisor, entry.supervisor = entry.supervisor, None
+    if supervisor:
+        supervisor.stop()
+    with entry.lock:
+        vehicle = entry.detach()
         if vehicle:
             try:
                 vehicle.close()
-                vehicle = None
                 return jsonify({"success": True, "message": "Disconnected"})
             except Exception as e:
                 return jsonify({"success": False, "message": str(e)}), 500
+        elif supervisor:
+            return jsonify({"success": True, "message": "Connection attempt cancelled"})
         else:
             return jsonify({"success": False, "message": "No vehicle connected"}), 400
 
-@app.route('/telemetry', methods=['GET'])
-def telemetry_api():
-    global vehicle
-    with vehicle_lock:
-        if vehicle is None:
-            return jsonify({"connected": False})
-        try:
-            loc = vehicle.location.global_frame
-            attitude = vehicle.attitude
-            status = {
-                "connected": True,
-                "armed": vehicle.armed,
-                "mode": str(vehicle.mode.name),
-                "lat": loc.lat if loc else 0,
-                "lon": loc.lon if loc else 0,
-                "alt": vehicle.location.global_relative_frame.alt if vehicle.location.global_relative_frame else 0,
-                "groundspeed": vehicle.groundspeed if vehicle.groundspeed else 0,
-                "airspeed": vehicle.airspeed if vehicle.airspeed else 0,
-                "heading": vehicle.heading if vehicle.heading else 0,
-                "battery_voltage": vehicle.battery.voltage if vehicle.battery else 0,
-                "battery_remaining": vehicle.battery.level if vehicle.battery else 0,
-                "gps_fix": vehicle.gps_0.fix_type if vehicle.gps_0 else 0,
-                "satellites": vehicle.gps_0.satellites_visible if vehicle.gps_0 else 0,
-                "roll": attitude.roll if attitude else 0,
-                "pitch": attitude.pitch if attitude else 0,
-                "yaw": attitude.yaw if attitude else 0
-            }
-            return jsonify(status)
-        except Exception as e:
-            return jsonify({"connected": False, "error": str(e)}), 500
-
-@app.route('/arm', methods=['POST'])
-def arm_api():
-    global vehicle
-    with vehicle_lock:
-        if vehicle is None:
-            return jsonify({"success": False, "message": "No vehicle connected"}), 400
-        try:
-            from dronekit import VehicleMode
-            if not vehicle.is_armable:
-                return jsonify({"success": False, "message": "Vehicle not armable yet"})
-            vehicle.mode = VehicleMode("GUIDED")
-            while vehicle.mode.name != "GUIDED":
-                time.sleep(0.5)
-            vehicle.armed = True
-            while not vehicle.armed:
-                time.sleep(0.5)
-            return jsonify({"success": True, "message": "Vehicle armed"})
-        except Exception as e:
-            return jsonify({"success": False, "message": str(e)}), 500
-
-@app.route('/disarm', methods=['POST'])
-def disarm_api():
-    global vehicle
-    with vehicle_lock:
-        if vehicle is None:
-            return jsonify({"success": False, "message": "No vehicle connected"}), 400
+@vehicle_route('/telemetry', methods=['GET'])
+def telemetry_api(vehicle_id):
+    # Served from the listener-maintained snapshot: no vehicle lock, no re-encoding
+    entry = fleet.get(vehicle_id)
+    if entry is None:
+        return Response(DISCONNECTED_PAYLOAD, mimetype='application/json')
+    # Pollers keep their stream rates up by polling; ?fields=&rate= narrow what they need
+    fields = request.args.get('fields')
+    fields = tuple(fields.split(',')) if fields else None
+    entry.streams.demand(('poll', request.remote_addr, fields), fields,
+                         request.args.get('rate', 2, type=float), ttl=POLL_TTL)
+    version, payload = entry.telemetry.payload()
+    etag = f'"{version}"'
+    if request.headers.get('If-None-Match') == etag:
+        return Response(status=304, headers={'ETag': etag})
+    return Response(payload, mimetype='application/json', headers={'ETag': etag})
+
+def open_telemetry_stream(args, vehicle_id):
+    """A subscriber's TelemetryStream, and a context that holds its stream-rate demand while open.
+
+    None for an unknown vehicle; only the default vehicle may be streamed before it connects.
+    """
+    rate = args.get('rate', 10, type=float)
+    fields = args.get('fields')
+    fields = fields.split(',') if fields else None
+    if vehicle_id == DEFAULT_VEHICLE_ID:
+        entry = fleet.get_or_create(vehicle_id)
+    else:
+        entry = fleet.get(vehicle_id)
+        if entry is None:
+            return None
+    stream = TelemetryStream(entry.telemetry, max_rate=rate, fields=fields)
+
+    @contextmanager
+    def hold():
+        entry.streams.demand(id(stream), fields, rate)
         try:
-            vehicle.armed = False
-            while vehicle.armed:
-                time.sleep(0.5)
-            return jsonify({"success": True, "message": "Vehicle disarmed"})
-        except Exception as e:
-            return jsonify({"success": False, "message": str(e)}), 500
-
-@app.route('/takeoff', methods=['POST'])
-def takeoff_api():
-    global vehicle
+            yield
+        finally:
+            entry.streams.release(id(stream))
+
+    return stream, hold()
+
+def sse_response(stream, hold):
+    def frames():
+        with hold:
+            yield from stream.sse()
+
+    return Response(frames(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@vehicle_route('/telemetry/stream', methods=['GET'])
+def telemetry_stream_api(vehicle_id):
+    # One shared snapshot fanned out to every subscriber as SSE delta frames;
+    # ?fields=lat,lon,alt limits the frames and the stream rates requested from the vehicle
+    opened = open_telemetry_stream(request.args, vehicle_id)
+    if opened is None:
+        return jsonify({"success": False, "message": "Unknown vehicle"}), 404
+    return sse_response(*opened)
+
+@app.route('/telemetry/bulk', methods=['GET'])
+def bulk_telemetry_api():
+    # Many vehicles in one response: ?vehicles=a,b (default all) ?fields=lat,lon,alt (default all);
+    # JSON, MessagePack or packed columnar chosen by ?format= or the Accept header
+    content_type = negotiate(request.headers.get('Accept'), request.args.get('format'))
+    if content_type is None:
+        return jsonify({"success": False, "message": "Not acceptable",
+                        "formats": [t for t in ENCODERS if t != MSGPACK or msgpack]}), 406
+    fields = request.args.get('fields')
+    fields = tuple(fields.split(',')) if fields else FIELDS
+    unknown = [name for name in fields if name not in FIELD_TYPES]
+    if unknown:
+        return jsonify({"success": False, "message": f"Unknown fields: {', '.join(unknown)}"}), 400
+    vehicle_ids = request.args.get('vehicles')
+    if vehicle_ids:
+        entries = [entry for entry in map(fleet.get, vehicle_ids.split(',')) if entry is not None]
+    else:
+        entries = fleet.entries()
+    rate = request.args.get('rate', 1, type=float)
+    for entry in entries:
+        entry.streams.demand(('bulk', request.remote_addr, fields), fields, rate, ttl=POLL_TTL)
+    ids, versions, rows = collect(entries, fields)
+    etag = '"%x"' % (hash((content_type, fields, tuple(ids), tuple(versions))) & 0xffffffffffff)
+    if request.headers.get('If-None-Match') == etag:
+        return Response(status=304, headers={'ETag': etag, 'Vary': 'Accept'})
+    return Response(ENCODERS[content_type](ids, versions, rows, fields), mimetype=content_type,
+                    headers={'ETag': etag, 'Vary': 'Accept'})
+
+@vehicle_route('/telemetry/rates', methods=['GET'])
+def telemetry_rates_api(vehicle_id):
+    entry = fleet.get(vehicle_id)
+    if entry is None:
+        return jsonify({"success": False, "message": "Unknown vehicle"}), 404
+    return jsonify(entry.streams.stats())
+
+def connected_entry(vehicle_id):
+    """Return the entry for a connected vehicle, or None"""
+    entry = fleet.get(vehicle_id)
+    if entry is None or entry.vehicle is None:
+        return None
+    return entry
+
+def submit_job(entry, job, priority=CONTROL, coalesce=None):
+    """Queue a job's start on the vehicle's dispatcher and answer 202 with its ID, or 200 if it already finished"""
+    jobs.add(job)
+
+    def start():
+        entry.jobs.start(job)
+        return job.message
+
+    command = entry.commands.submit(Command(job.kind, start, priority, coalesce,
+                                            on_drop=lambda state, reason: job.finish(CANCELLED, reason)))
+    command.wait(COMMAND_WAIT)
+    status = {SUCCEEDED: 200, FAILED: 400, CANCELLED: 409}.get(job.state, 202)
+    return jsonify({"success": status in (200, 202), "message": job.message or f"{job.kind} submitted",
+                    "job_id": job.id, "job": job.to_dict(), "command": command.to_dict()}), status
+
+def submit_command(entry, command):
+    """Queue a direct command and answer with its outcome, or 202 if it is still queued"""
+    entry.commands.submit(command)
+    command.wait(COMMAND_WAIT)
+    status = {'done': 200, 'failed': 500, 'superseded': 409, 'preempted': 409}.get(command.state, 202)
+    message = command.message or f"{command.kind} queued"
+    return jsonify({"success": status in (200, 202), "message": message, "command": command.to_dict()}), status
+
+def mode_command(entry, mode, message):
+    def action():
+        if entry.vehicle is None:
+            raise RuntimeError("No vehicle connected")
+        entry.vehicle.mode = VehicleMode(mode)
+        return message
+    return Command(mode.lower(), action, SAFETY)
+
+def restricted_zones(entry, lat, lon, alt):
+    """Zones the straight path from the vehicle's current position to (lat, lon, alt) enters"""
+    version, fields = entry.telemetry.fields()
+    if not (fields.get("lat") or fields.get("lon")):
+        return geofence.check_point(lat, lon, alt)
+    return geofence.check_segment(fields["lat"], fields["lon"], fields.get("alt") or 0, lat, lon, alt)
+
+def zone_violation(zones):
+    names = ', '.join(zone["name"] or zone["id"] for zone in zones)
+    return jsonify({"success": False, "message": f"Restricted zone: {names}", "zones": zones}), 403
+
+@vehicle_route('/arm', methods=['POST'])
+def arm_api(vehicle_id):
+    entry = connected_entry(vehicle_id)
+    if entry is None:
+        return jsonify({"success": False, "message": "No vehicle connected"}), 400
+    if not entry.vehicle.is_armable:
+        return jsonify({"success": False, "message": "Vehicle not armable yet"})
+    return submit_job(entry, arm_job(vehicle_id))
+
+@vehicle_route('/disarm', methods=['POST'])
+def disarm_api(vehicle_id):
+    entry = connected_entry(vehicle_id)
+    if entry is None:
+        return jsonify({"success": False, "message": "No vehicle connected"}), 400
+    return submit_job(entry, disarm_job(vehicle_id), SAFETY)
+
+@vehicle_route('/takeoff', methods=['POST'])
+def takeoff_api(vehicle_id):
     data = request.json
     altitude = data.get('altitude', 10)
-    with vehicle_lock:
-        if vehicle is None:
-            return jsonify({"success": False, "message": "No vehicle connected"}), 400
-        if not vehicle.armed:
-            return jsonify({"success": False, "message": "Vehicle not armed"}), 400
-        try:
-            vehicle.simple_takeoff(altitude)
-            return jsonify({"success": True, "message": f"Taking off to {altitude}m"})
-        except Exception as e:
-            return jsonify({"success": False, "message": str(e)}), 500
-
-@app.route('/land', methods=['POST'])
-def land_api():
-    global vehicle
-    with vehicle_lock:
-        if vehicle is None:
-            return jsonify({"success": False, "message": "No vehicle connected"}), 400
-        try:
-            from dronekit import VehicleMode
-            vehicle.mode = VehicleMode("LAND")
-            return jsonify({"success": True, "message": "Landing"})
-        except Exception as e:
-            return jsonify({"success": False, "message": str(e)}), 500
-
-@app.route('/mode', methods=['POST'])
-def mode_api():
-    global vehicle
+    entry = connected_entry(vehicle_id)
+    if entry is None:
+        return jsonify({"success": False, "message": "No vehicle connected"}), 400
+    if not entry.vehicle.armed:
+        return jsonify({"success": False, "message": "Vehicle not armed"}), 400
+    version, fields = entry.telemetry.fields()
+    zones = restricted_zones(entry, fields.get("lat", 0), fields.get("lon", 0), altitude)
+    if zones:
+        return zone_violation(zones)
+    return submit_job(entry, takeoff_job(vehicle_id, altitude))
+
+@vehicle_route('/land', methods=['POST'])
+def land_api(vehicle_id):
+    entry = connected_entry(vehicle_id)
+    if entry is None:
+        return jsonify({"success": False, "message": "No vehicle connected"}), 400
+    return submit_command(entry, mode_command(entry, 'LAND', "Landing"))
+
+@vehicle_route('/rtl', methods=['POST'])
+def rtl_api(vehicle_id):
+    entry = connected_entry(vehicle_id)
+    if entry is None:
+        return jsonify({"success": False, "message": "No vehicle connected"}), 400
+    return submit_command(entry, mode_command(entry, 'RTL', "Returning to launch"))
+
+@vehicle_route('/mode', methods=['POST'])
+def mode_api(vehicle_id):
     data = request.json
     mode = data.get('mode', 'GUIDED')
-    with vehicle_lock:
-        if vehicle is None:
-            return jsonify({"success": False, "message": "No vehicle connected"}), 400
-        try:
-            from dronekit import VehicleMode
-            vehicle.mode = VehicleMode(mode)
-            return jsonify({"success": True, "message": f"Mode changed to {mode}"})
-        except Exception as e:
-            return jsonify({"success": False, "message": str(e)}), 500
-
-@app.route('/goto', methods=['POST'])
-def goto_api():
-    global vehicle
+    entry = connected_entry(vehicle_id)
+    if entry is None:
+        return jsonify({"success": False, "message": "No vehicle connected"}), 400
+    # LAND and RTL through /mode preempt like /land and /rtl; other changes coalesce
+    priority = SAFETY if mode in ('LAND', 'RTL') else CONTROL
+    return submit_job(entry, mode_job(vehicle_id, mode), priority, coalesce='mode')
+
+@vehicle_route('/goto', methods=['POST'])
+def goto_api(vehicle_id):
     data = request.json
     lat = data.get('lat')
     lon = data.get('lon')
     alt = data.get('alt', 10)
-    with vehicle_lock:
-        if vehicle is None:
-            return jsonify({"success": False, "message": "No vehicle connected"}), 400
-        try:
-            from dronekit import LocationGlobalRelative
-            point = LocationGlobalRelative(lat, lon, alt)
-            vehicle.simple_goto(point)
-            return jsonify({"success": True, "message": f"Going to {lat}, {lon} @ {alt}m"})
-        except Exception as e:
-            return jsonify({"success": False, "message": str(e)}), 500
+    entry = connected_entry(vehicle_id)
+    if entry is None:
+        return jsonify({"success": False, "message": "No vehicle connected"}), 400
+    if lat is not None and lon is not None:
+        zones = restricted_zones(entry, lat, lon, alt)
+        if zones:
+            return zone_violation(zones)
+
+    def action():
+        if entry.vehicle is None:
+            raise RuntimeError("No vehicle connected")
+        entry.vehicle.simple_goto(LocationGlobalRelative(lat, lon, alt))
+        return f"Going to {lat}, {lon} @ {alt}m"
+
+    return submit_command(entry, Command('goto', action, NAVIGATION, coalesce='goto', min_interval=GOTO_INTERVAL))
+
+@vehicle_route('/mission', methods=['POST'])
+def mission_api(vehicle_id):
+    # Body: {"waypoints": [{"lat", "lon", "alt", "command", "params"}, ...], "refresh": false}
+    data = request.json
+    entry = connected_entry(vehicle_id)
+    if entry is None:
+        return jsonify({"success": False, "message": "No vehicle connected"}), 400
+    try:
+        items = parse_waypoints(data.get('waypoints', []))
+    except Exception as e:
+        return jsonify({"success": False, "message": f"Invalid waypoints: {e}"}), 400
+    version, fields = entry.telemetry.fields()
+    leg = (fields.get("lat", 0), fields.get("lon", 0), fields.get("alt") or 0)
+    for item in items:
+        if not (item.x or item.y):
+            continue
+        point = (item.x / 1e7, item.y / 1e7, item.z)
+        zones = geofence.check_segment(*leg, *point) if leg[0] or leg[1] else geofence.check_point(*point)
+        if zones:
+            return zone_violation(zones)
+        leg = point
+    return submit_job(entry, mission_job(vehicle_id, entry.mission, items, bool(data.get('refresh'))))
+
+@vehicle_route('/mission', methods=['GET'])
+def mission_status_api(vehicle_id):
+    entry = fleet.get(vehicle_id)
+    if entry is None:
+        return jsonify({"success": False, "message": "Unknown vehicle"}), 404
+    return jsonify(entry.mission.to_dict())
+
+@vehicle_route('/history', methods=['GET'])
+def history_api(vehicle_id):
+    # ?start=&end= are unix times; ?fields=lat,lon,alt picks columns; ?max_points strides long ranges
+    start = request.args.get('start', type=float)
+    end = request.args.get('end', type=float)
+    max_points = request.args.get('max_points', 5000, type=int)
+    fields = request.args.get('fields')
+    columns = ['time'] + [c for c in fields.split(',') if c in COLUMNS and c != 'time'] if fields else list(COLUMNS)
+    result = recorder.query(vehicle_id, start, end, columns)
+    if result is None:
+        return jsonify({"success": False, "message": "No flight log for vehicle"}), 404
+    count = len(result['time'])
+    stride = max(1, -(-count // max_points)) if max_points > 0 else 1
+    return jsonify({
+        "vehicle_id": vehicle_id,
+        "count": count,
+        "stride": stride,
+        "columns": {name: values[::stride].tolist() for name, values in result.items()}
+    })
+
+@vehicle_route('/track', methods=['GET'])
+def track_api(vehicle_id):
+    # ?start=&end= are unix times; ?zoom= simplifies to half a pixel at that map zoom (Douglas–Peucker),
+    # ?points= to about that many points (LTTB)
+    start = request.args.get('start', type=float)
+    end = request.args.get('end', type=float)
+    zoom = request.args.get('zoom', type=float)
+    points = request.args.get('points', type=int)
+    if (zoom is None) == (points is None):
+        return jsonify({"success": False, "message": "Pass either zoom or points"}), 400
+    if points is not None and points < 2:
+        return jsonify({"success": False, "message": "points must be at least 2"}), 400
+    result = tracks.track(vehicle_id, start, end, zoom, points)
+    if result is None:
+        return jsonify({"success": False, "message": "No flight log for vehicle"}), 404
+    result["columns"] = {name: values.tolist() for name, values in result["columns"].items()}
+    return jsonify(dict(result, vehicle_id=vehicle_id))
+
+@vehicle_route('/track/stats', methods=['GET'])
+def track_stats_api(vehicle_id):
+    return jsonify(tracks.stats().get(vehicle_id, {}))
+
+@vehicle_route('/history/stats', methods=['GET'])
+def history_stats_api(vehicle_id):
+    log = recorder.log(vehicle_id)
+    if log is None:
+        return jsonify({"success": False, "message": "No flight log for vehicle"}), 404
+    return jsonify(log.stats())
+
+@app.route('/sim/fleet', methods=['POST'])
+def sim_fleet_api():
+    # Registers count simulated vehicles as <prefix>-0000, <prefix>-0001, ...
+    data = request.json
+    count = int(data.get('count', 10))
+    options = '&'.join(f"{key}={data[key]}" for key in ('lat', 'lon', 'spacing', 'rate', 'prefix') if key in data)
+    sim = fleet_from_uri(f"sim:?count={count}&{options}")
+    sim_fleets.append(sim)
+    for vehicle in sim.vehicles:
+        entry = fleet.get_or_create(vehicle.vehicle_id)
+        with entry.lock:
+            close_vehicle(entry)
+            attach_vehicle(entry, vehicle, 'sim', None)
+    return jsonify({"success": True, "message": f"Simulating {count} vehicles",
+                    "vehicle_ids": [vehicle.vehicle_id for vehicle in sim.vehicles]})
+
+@app.route('/sim/fleet', methods=['GET'])
+def sim_fleet_stats_api():
+    return jsonify({"fleets": [sim.stats() for sim in sim_fleets]})
+
+@app.route('/conflicts', methods=['GET'])
+def conflicts_api():
+    version, payload = airspace.feed.payload()
+    return Response(payload, mimetype='application/json', headers={'ETag': f'"{version}"'})
+
+def open_conflicts_stream(args):
+    return TelemetryStream(airspace.feed, max_rate=args.get('rate', 2, type=float)), nullcontext()
+
+@app.route('/conflicts/stream', methods=['GET'])
+def conflicts_stream_api():
+    return sse_response(*open_conflicts_stream(request.args))
+
+@app.route('/conflicts/stats', methods=['GET'])
+def conflicts_stats_api():
+    return jsonify(airspace.stats)
+
+@app.route('/geofence/zones', methods=['GET'])
+def geofence_zones_api():
+    return jsonify({"zones": geofence.index.zones, "stats": geofence.stats()})
+
+@app.route('/geofence/zones', methods=['POST'])
+def geofence_load_api():
+    # Body: {"zones": [...]} or a GeoJSON FeatureCollection; replaces every zone
+    try:
+        zones = parse_zones(request.json)
+    except Exception as e:
+        return jsonify({"success": False, "message": f"Invalid zones: {e}"}), 400
+    geofence.load_async(zones)
+    return jsonify({"success": True, "message": f"Compiling {len(zones)} zones"}), 202
+
+@app.route('/geofence/check', methods=['GET'])
+def geofence_check_api():
+    lat = request.args.get('lat', type=float)
+    lon = request.args.get('lon', type=float)
+    alt = request.args.get('alt', 0, type=float)
+    if lat is None or lon is None:
+        return jsonify({"success": False, "message": "lat and lon required"}), 400
+    return jsonify({"zones": geofence.check_point(lat, lon, alt)})
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_api(job_id):
+    # ?wait=<seconds> long-polls until the job finishes
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"success": False, "message": "Unknown job"}), 404
+    wait = min(request.args.get('wait', 0, type=float), 30)
+    if wait > 0:
+        job.wait(wait)
+    return jsonify(job.to_dict())
+
+@vehicle_route('/commands', methods=['GET'])
+def commands_api(vehicle_id):
+    entry = fleet.get(vehicle_id)
+    if entry is None:
+        return jsonify({"success": False, "message": "Unknown vehicle"}), 404
+    return jsonify(entry.commands.stats())
+
+@vehicle_route('/jobs', methods=['GET'])
+def vehicle_jobs_api(vehicle_id):
+    return jsonify({"jobs": [job.to_dict() for job in jobs.for_vehicle(vehicle_id)]})
+
+@app.route('/metrics/profiler', methods=['GET'])
+def profiler_api():
+    # ?format=folded returns collapsed stacks for flame graph tools
+    if request.args.get('format') == 'folded':
+        return Response(profiler.folded(), mimetype='text/plain')
+    return jsonify({"stats": profiler.stats(), "top": profiler.top(request.args.get('limit', 20, type=int))})
+
+@app.route('/metrics/profiler', methods=['POST'])
+def profiler_control_api():
+    # Body: {"enabled": true, "interval": 0.005}
+    data = request.json
+    if data.get('enabled'):
+        profiler.start(data.get('interval'))
+    else:
+        profiler.stop()
+    return jsonify({"success": True, "stats": profiler.stats()})
 
 @app.route('/health', methods=['GET'])
 def health_api():
-    return jsonify({"status": "ok", "message": "Python backend is running"})
+    return jsonify({"status": "ok", "message": "Python backend is running", "vehicles": len(fleet)})
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='UTMS persistent drone backend')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5555)
+    parser.add_argument('--dev', action='store_true', help="use Flask's development server instead of asyncio")
+    parser.add_argument('--workers', type=int, default=32, help='threads running request handlers')
+    args = parser.parse_args()
     print('')
     print('╔════════════════════════════════════════════╗')
     print('║   🚁 Python Persistent Backend Started 🚁 ║')
     print('╚════════════════════════════════════════════╝')
     print('')
-    print('✅ Flask server running on http://0.0.0.0:5555')
+    print(f'✅ {"Flask development" if args.dev else "Asyncio"} server running on http://{args.host}:{args.port}')
+    print(f'✅ Flight logs in {recorder.directory}')
+    if DEFAULT_ZONES_FILE:
+        geofence.load_file(DEFAULT_ZONES_FILE)
+        print(f'✅ Loaded {len(geofence.index.zones)} geofence zones from {DEFAULT_ZONES_FILE}')
     print('')
-    app.run(host='0.0.0.0', port=5555, debug=False)
+    recorder.start()
+    airspace.start()
+    stream_rates.start()
+    if args.dev:
+        app.run(host=args.host, port=args.port, debug=False, threaded=True)
+    else:
+        server = AsyncServer(app, args.host, args.port, workers=args.workers)
+        server.stream('telemetry_stream_api', open_telemetry_stream)
+        server.stream('conflicts_stream_api', open_conflicts_stream)
+        REGISTRY.gauge('utms_open_connections', 'Open client connections by kind', ('kind',),
+                       collect=lambda: [(('http',), server.connections - server.active_streams),
+                                        (('stream',), server.active_streams)])
+        server.run()
@@ -0,0 +1,289 @@
+"""
+Flight recorder: per-vehicle NumPy ring buffers spilled to append-only columnar files
+"""
+import os
+import re
+import threading
+import time
+
+import numpy as np
+
+# One row per telemetry sample; every column is also one file on disk
+SAMPLE_DTYPE = np.dtype([
+    ("time", "<f8"),
+    ("lat", "<f8"),
+    ("lon", "<f8"),
+    ("alt", "<f4"),
+    ("groundspeed", "<f4"),
+    ("airspeed", "<f4"),
+    ("heading", "<f4"),
+    ("battery_voltage", "<f4"),
+    ("battery_remaining", "<f4"),
+    ("gps_fix", "u1"),
+    ("satellites", "u1"),
+    ("roll", "<f4"),
+    ("pitch", "<f4"),
+    ("yaw", "<f4"),
+    ("armed", "u1"),
+])
+COLUMNS = SAMPLE_DTYPE.names
+SAMPLE_FIELDS = COLUMNS[1:]
+_FIELD_SET = frozenset(SAMPLE_FIELDS)
+
+DEFAULT_DIRECTORY = os.environ.get(
+    "UTMS_FLIGHTLOG_DIR", os.path.join(os.path.expanduser("~"), ".utms", "flightlog"))
+
+
+def _safe_name(vehicle_id):
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", vehicle_id)
+
+
+class VehicleLog:
+    """Ring buffer of recent samples for one vehicle plus its column files.
+
+    ``count`` is the total number of samples ever written and ``flushed``
+    how many of them are on disk; rows ``flushed..count`` live only in the
+    ring. The ring must be spilled before it wraps past ``flushed``.
+    """
+
+    def __init__(self, vehicle_id, directory, capacity):
+        self.vehicle_id = vehicle_id
+        self.path = os.path.join(directory, _safe_name(vehicle_id))
+        os.makedirs(self.path, exist_ok=True)
+        self.capacity = capacity
+        self.ring = np.zeros(capacity, dtype=SAMPLE_DTYPE)
+        self.dropped = 0
+        self.last_time = 0.0
+        # The vehicle's latest values as one row, patched field by field as they change
+        self._current = np.zeros((), dtype=SAMPLE_DTYPE)
+        self._connected = False
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self.flushed = self.count = self._disk_rows()
+        self._maps = None
+
+    def _column_path(self, column):
+        return os.path.join(self.path, column + ".bin")
+
+    def _disk_rows(self):
+        # Columns are appended together; the shortest file bounds the complete rows
+        rows = None
+        for column in COLUMNS:
+            try:
+                size = os.path.getsize(self._column_path(column))
+            except OSError:
+                size = 0
+            column_rows = size // SAMPLE_DTYPE[column].itemsize
+            rows = column_rows if rows is None else min(rows, column_rows)
+        rows = rows or 0
+        # A crash mid-flush leaves some columns longer; cut them back so later appends stay aligned
+        for column in COLUMNS:
+            path = self._column_path(column)
+            length = rows * SAMPLE_DTYPE[column].itemsize
+            if os.path.exists(path) and os.path.getsize(path) > length:
+                os.truncate(path, length)
+        return rows
+
+    def append(self, sample_time, fields):
+        """Write one sample with every field into the ring"""
+        self.record(sample_time, fields, replaced=True)
+
+    def record(self, sample_time, changed, replaced=False):
+        """Patch the changed fields into the current row and append it to the ring.
+
+        Called on the telemetry writer thread with just what changed, so a
+        sample costs one assignment per changed field plus one row copy.
+        Nothing is appended while the vehicle is disconnected.
+        """
+        with self._lock:
+            current = self._current
+            if replaced:
+                current[()] = 0
+                self._connected = False
+            for name, value in changed.items():
+                if name in _FIELD_SET:
+                    current[name] = value or 0
+            if "connected" in changed:
+                self._connected = bool(changed["connected"])
+            if not self._connected:
+                return
+            if self.count - self.flushed >= self.capacity:
+                self.dropped += 1
+                return
+            current["time"] = sample_time
+            self.ring[self.count % self.capacity] = current
+            self.count += 1
+            self.last_time = sample_time
+
+    def flush(self):
+        """Append unflushed ring rows to the column files"""
+        with self._flush_lock:
+            with self._lock:
+                start, end = self.flushed, self.count
+            if start == end:
+                return 0
+            first, last = start % self.capacity, end % self.capacity
+            if first < last:
+                chunks = [self.ring[first:last]]
+            else:
+                chunks = [self.ring[first:], self.ring[:last]]
+            for column in COLUMNS:
+                with open(self._column_path(column), "ab") as f:
+                    for chunk in chunks:
+                        f.write(np.ascontiguousarray(chunk[column]).tobytes())
+            with self._lock:
+                self.flushed = end
+            return end - start
+
+    def _disk_columns(self, rows):
+        maps = self._maps
+        if maps is None or maps[0] != rows:
+            if rows == 0:
+                columns = {column: np.zeros(0, dtype=SAMPLE_DTYPE[column]) for column in COLUMNS}
+            else:
+                columns = {
+                    column: np.memmap(self._column_path(column), dtype=SAMPLE_DTYPE[column],
+                                      mode="r", shape=(rows,))
+                    for column in COLUMNS
+                }
+            maps = (rows, columns)
+            self._maps = maps
+        return maps[1]
+
+    def query(self, start=None, end=None, columns=COLUMNS, with_rows=False):
+        """Return {column: array} for samples with start <= time <= end.
+
+        Rows already on disk are memory-mapped slices (no copy); only rows
+        still waiting in the ring are copied out of it. ``with_rows`` adds a
+        "row" array of sample numbers, as used by ``rows``.
+        """
+        with self._lock:
+            flushed, count = self.flushed, self.count
+            first, last = flushed % self.capacity, count % self.capacity
+            if count == flushed:
+                tail = self.ring[:0].copy()
+            elif first < last:
+                tail = self.ring[first:last].copy()
+            else:
+                tail = np.concatenate([self.ring[first:], self.ring[:last]])
+        disk = self._disk_columns(flushed)
+
+        lo = 0 if start is None else np.searchsorted(disk["time"], start, side="left")
+        hi = flushed if end is None else np.searchsorted(disk["time"], end, side="right")
+        tail_lo = 0 if start is None else np.searchsorted(tail["time"], start, side="left")
+        tail_hi = len(tail) if end is None else np.searchsorted(tail["time"], end, side="right")
+
+        result = {}
+        for column in columns:
+            disk_part = disk[column][lo:hi]
+            if tail_hi > tail_lo:
+                result[column] = np.concatenate([disk_part, tail[column][tail_lo:tail_hi]])
+            else:
+                result[column] = disk_part
+        if with_rows:
+            result["row"] = np.concatenate([np.arange(lo, hi), flushed + np.arange(tail_lo, tail_hi)])
+        return result
+
+    def rows(self, first, last=None, columns=COLUMNS):
+        """Return {column: array} for samples first <= n < last, by sample number since the log began.
+
+        Like ``query``, rows on disk come back as memory-mapped slices when
+        no ring rows are involved.
+        """
+        with self._lock:
+            flushed, count = self.flushed, self.count
+            last = count if last is None else min(last, count)
+            ring_first = max(first, flushed)
+            if ring_first >= last:
+                tail = self.ring[:0].copy()
+            else:
+                start, stop = ring_first % self.capacity, last % self.capacity
+                if start < stop or stop == 0:
+                    tail = self.ring[start:stop or self.capacity].copy()
+                else:
+                    tail = np.concatenate([self.ring[start:], self.ring[:stop]])
+        disk = self._disk_columns(flushed)
+        disk_last = min(last, flushed)
+
+        result = {}
+        for column in columns:
+            disk_part = disk[column][first:disk_last] if first < disk_last else disk[column][:0]
+            result[column] = np.concatenate([disk_part, tail[column]]) if len(tail) else disk_part
+        return result
+
+    def stats(self):
+        return {
+            "vehicle_id": self.vehicle_id,
+            "samples": self.count,
+            "on_disk": self.flushed,
+            "dropped": self.dropped,
+            "last_time": self.last_time
+        }
+
+
+class FlightRecorder:
+    """Records every telemetry snapshot change of every tracked vehicle.
+
+    Sampling happens on the telemetry writer thread and only writes into a
+    preallocated ring row; a single background thread spills all rings to
+    disk every ``flush_interval`` seconds.
+    """
+
+    def __init__(self, directory=DEFAULT_DIRECTORY, capacity=65536, flush_interval=1.0):
+        self.directory = directory
+        self.capacity = capacity
+        self.flush_interval = flush_interval
+        self._logs = {}
+        self._tracked = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="flight-recorder", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self.flush()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        for log in list(self._logs.values()):
+            try:
+                log.flush()
+            except OSError as e:
+                print(f"❌ Flight log flush failed for {log.vehicle_id}: {e}")
+
+    def log(self, vehicle_id):
+        return self._logs.get(vehicle_id)
+
+    def track(self, vehicle_id, snapshot):
+        """Start recording a vehicle's telemetry snapshot"""
+        with self._lock:
+            log = self._logs.get(vehicle_id)
+            if log is None:
+                log = VehicleLog(vehicle_id, self.directory, self.capacity)
+                self._logs[vehicle_id] = log
+            if id(snapshot) in self._tracked:
+                return log
+            self._tracked.add(id(snapshot))
+
+        def record(snapshot, changed, replaced):
+            log.record(time.time(), changed, replaced)
+
+        # Seeded once with every field; after that only changes reach the log
+        snapshot.subscribe(record, changes=True)
+        version, fields = snapshot.fields()
+        log.append(time.time(), fields)
+        return log
+
+    def query(self, vehicle_id, start=None, end=None, columns=COLUMNS):
+        log = self._logs.get(vehicle_id)
+        if log is None:
+            return None
+        return log.query(start, end, columns)
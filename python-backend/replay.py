@@ -0,0 +1,176 @@
+"""
+MAVLink tlog replay as a drop-in vehicle for load and regression testing
+
+Connection strings of the form ``replay:<path.tlog>?speed=4&loop=1`` open a
+ReplayVehicle. ``speed=0`` replays as fast as possible. To make a synthetic
+log without hardware:
+
+    python replay.py synth flight.tlog --duration 600
+"""
+import argparse
+import math
+import struct
+import threading
+import time
+from urllib.parse import parse_qs
+
+from pymavlink import mavutil
+from pymavlink.dialects.v20 import ardupilotmega as mavlink
+
+from virtual_vehicle import VirtualVehicle
+
+
+class ReplayVehicle(VirtualVehicle):
+    """Feeds a recorded tlog through the vehicle interface on its own thread.
+
+    Commands are accepted and ignored: a recording cannot be steered.
+    Nothing is replayed until ``start``, so listeners attached first see the
+    log from its first message. Heartbeat age is measured in log time, so a
+    slowed-down replay does not look like a lost link.
+    """
+
+    def __init__(self, path, speed=1.0, loop=False):
+        super().__init__()
+        self.path = path
+        self.speed = speed
+        self.loop = loop
+        self.messages = 0
+        self.started = None
+        self.finished = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=f"replay-{self.path}", daemon=True)
+            self._thread.start()
+        return self
+
+    @property
+    def last_heartbeat(self):
+        silence = time.monotonic() - self._last_heartbeat
+        return silence * self.speed if self.speed > 0 else silence
+
+    @classmethod
+    def from_uri(cls, uri):
+        """Build from ``replay:<path>?speed=<factor>&loop=<0|1>``"""
+        path, _, query = uri[len('replay:'):].partition('?')
+        options = parse_qs(query)
+        speed = float(options.get('speed', ['1'])[0])
+        loop = options.get('loop', ['0'])[0] in ('1', 'true', 'yes')
+        return cls(path, speed=speed, loop=loop)
+
+    def _run(self):
+        self.started = time.monotonic()
+        while not self._stop.is_set():
+            self._replay_once()
+            if not self.loop:
+                break
+        self.finished.set()
+
+    def _replay_once(self):
+        log = mavutil.mavlink_connection(self.path, dialect='ardupilotmega')
+        try:
+            wall_start = time.monotonic()
+            log_start = None
+            while not self._stop.is_set():
+                msg = log.recv_msg()
+                if msg is None:
+                    return
+                if msg.get_type() == 'BAD_DATA':
+                    continue
+                if self.speed > 0:
+                    if log_start is None:
+                        log_start = msg._timestamp
+                    delay = (msg._timestamp - log_start) / self.speed - (time.monotonic() - wall_start)
+                    if delay > 0 and self._stop.wait(delay):
+                        return
+                self.handle_message(msg)
+                self.messages += 1
+        finally:
+            log.close()
+
+    def stats(self):
+        elapsed = time.monotonic() - self.started if self.started else 0
+        return {
+            "path": self.path,
+            "speed": self.speed,
+            "messages": self.messages,
+            "rate": self.messages / elapsed if elapsed > 0 else 0,
+            "finished": self.finished.is_set()
+        }
+
+    def close(self):
+        self._stop.set()
+        super().close()
+
+
+def write_synthetic_tlog(path, duration=60, lat=28.6139, lon=77.2090, radius=100, alt=20, speed=5):
+    """Write a tlog of a vehicle circling (lat, lon) at a typical ArduCopter stream mix"""
+    mav = mavlink.MAVLink(None, srcSystem=1, srcComponent=1)
+    # message -> rate in Hz
+    rates = {'HEARTBEAT': 1, 'GLOBAL_POSITION_INT': 10, 'ATTITUDE': 10, 'VFR_HUD': 4,
+             'SYS_STATUS': 1, 'GPS_RAW_INT': 2}
+    events = []
+    for name, rate in rates.items():
+        events.extend((i / rate, name) for i in range(int(duration * rate)))
+    events.sort()
+
+    start = time.time()
+    omega = speed / radius
+    meters_per_deg = 111319.5
+    base_mode = (mavutil.mavlink.MAV_MODE_FLAG_CUSTOM_MODE_ENABLED |
+                 mavutil.mavlink.MAV_MODE_FLAG_SAFETY_ARMED)
+    with open(path, 'wb') as f:
+        for t, name in events:
+            angle = omega * t
+            north, east = radius * math.cos(angle), radius * math.sin(angle)
+            lat_e7 = int((lat + north / meters_per_deg) * 1e7)
+            lon_e7 = int((lon + east / (meters_per_deg * math.cos(math.radians(lat)))) * 1e7)
+            heading = (math.degrees(angle) + 90) % 360
+            if name == 'HEARTBEAT':
+                msg = mav.heartbeat_encode(mavutil.mavlink.MAV_TYPE_QUADROTOR,
+                                           mavutil.mavlink.MAV_AUTOPILOT_ARDUPILOTMEGA,
+                                           base_mode, 4, mavutil.mavlink.MAV_STATE_ACTIVE)
+            elif name == 'GLOBAL_POSITION_INT':
+                msg = mav.global_position_int_encode(
+                    int(t * 1000), lat_e7, lon_e7,
+                    int((alt + 200) * 1000), int(alt * 1000),
+                    int(-speed * math.sin(angle) * 100), int(speed * math.cos(angle) * 100), 0,
+                    int(heading * 100))
+            elif name == 'ATTITUDE':
+                msg = mav.attitude_encode(int(t * 1000), 0.05, 0.0, math.radians(heading), 0, 0, omega)
+            elif name == 'VFR_HUD':
+                msg = mav.vfr_hud_encode(speed, speed, int(heading), 50, alt + 200, 0)
+            elif name == 'SYS_STATUS':
+                remaining = max(0, 100 - int(t / duration * 60))
+                msg = mav.sys_status_encode(0, 0, 0, 500, 16000 - int(t * 2), 1500, remaining,
+                                            0, 0, 0, 0, 0, 0)
+            else:
+                msg = mav.gps_raw_int_encode(int(t * 1e6), 3, lat_e7, lon_e7, int(alt * 1000), 80, 120,
+                                             int(speed * 100), int(heading * 100), 14)
+            f.write(struct.pack('>Q', int((start + t) * 1e6)))
+            f.write(msg.pack(mav))
+    return len(events)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Replay or synthesize MAVLink tlogs')
+    sub = parser.add_subparsers(dest='command', required=True)
+    synth = sub.add_parser('synth', help='write a synthetic tlog')
+    synth.add_argument('path')
+    synth.add_argument('--duration', type=float, default=60)
+    synth.add_argument('--lat', type=float, default=28.6139)
+    synth.add_argument('--lon', type=float, default=77.2090)
+    play = sub.add_parser('play', help='replay a tlog and report the message rate')
+    play.add_argument('path')
+    play.add_argument('--speed', type=float, default=0)
+    args = parser.parse_args()
+
+    if args.command == 'synth':
+        count = write_synthetic_tlog(args.path, args.duration, args.lat, args.lon)
+        print(f"✅ Wrote {count} messages to {args.path}")
+    else:
+        vehicle = ReplayVehicle(args.path, speed=args.speed).start()
+        vehicle.finished.wait()
+        print(vehicle.stats())
@@ -0,0 +1,324 @@
+"""
+Vectorized multi-drone simulator for fleet-scale testing
+
+All kinematic state lives in NumPy arrays indexed by vehicle and is advanced
+in one vectorized step per tick. Each aircraft is exposed as a
+SimulatedVehicle with the same interface as a dronekit Vehicle, so the
+fleet registry, jobs and telemetry snapshots treat it like real hardware.
+"""
+import math
+import threading
+import time
+from types import SimpleNamespace
+from urllib.parse import parse_qs
+
+import numpy as np
+from dronekit import (Attitude, Battery, GPSInfo, LocationGlobal,
+                      LocationGlobalRelative, VehicleMode)
+from pymavlink import mavutil
+
+from virtual_vehicle import VirtualVehicle
+
+MODES = ['STABILIZE', 'GUIDED', 'LOITER', 'LAND', 'RTL', 'ALT_HOLD', 'POSHOLD', 'BRAKE']
+MODE_CODES = {name: code for code, name in enumerate(MODES)}
+GUIDED = MODE_CODES['GUIDED']
+LAND = MODE_CODES['LAND']
+RTL = MODE_CODES['RTL']
+
+METERS_PER_DEGREE = 111319.5
+MAX_SPEED = 10.0       # m/s horizontal
+CLIMB_RATE = 2.5       # m/s
+DESCENT_RATE = 1.5     # m/s
+RTL_ALT = 15.0         # m
+IDLE_DRAIN = 0.02      # % per second while armed on the ground
+FLIGHT_DRAIN = 0.08    # % per second while airborne
+
+
+class SimulatedFleet:
+    """Kinematic state of ``count`` vehicles laid out on a grid around (lat, lon)"""
+
+    def __init__(self, count, lat=28.6139, lon=77.2090, spacing=20.0, rate=10, prefix='sim'):
+        self.count = count
+        self.rate = rate
+        self.origin_lat = lat
+        self.origin_lon = lon
+        self._meters_per_lon = METERS_PER_DEGREE * math.cos(math.radians(lat))
+
+        side = int(math.ceil(math.sqrt(count)))
+        index = np.arange(count)
+        self.home_x = (index % side) * spacing
+        self.home_y = (index // side) * spacing
+        self.x = self.home_x.astype(np.float64)
+        self.y = self.home_y.astype(np.float64)
+        self.alt = np.zeros(count)
+        self.target_x = self.x.copy()
+        self.target_y = self.y.copy()
+        self.target_alt = np.zeros(count)
+        self.groundspeed = np.zeros(count)
+        self.heading = np.zeros(count)
+        self.armed = np.zeros(count, dtype=bool)
+        self.mode = np.full(count, MODE_CODES['STABILIZE'], dtype=np.int8)
+        self.battery = np.full(count, 100.0)
+
+        self.lock = threading.Lock()
+        self.vehicles = [SimulatedVehicle(self, i, f"{prefix}-{i:04d}") for i in range(count)]
+        self.ticks = 0
+        self.step_time = 0.0
+        self.publish_time = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    # ----- derived state -----
+    def lat(self):
+        return self.origin_lat + self.y / METERS_PER_DEGREE
+
+    def lon(self):
+        return self.origin_lon + self.x / self._meters_per_lon
+
+    def voltage(self):
+        return 10.5 + 2.1 * self.battery / 100.0
+
+    # ----- simulation -----
+    def step(self, dt):
+        """Advance every vehicle by dt seconds; returns indices that auto-disarmed"""
+        mode = self.mode
+        armed = self.armed
+        airborne = armed & (self.alt > 0.5)
+
+        tx, ty, talt = self.target_x.copy(), self.target_y.copy(), self.target_alt.copy()
+        guided = mode == GUIDED
+        hold = ~guided
+        tx[hold], ty[hold], talt[hold] = self.x[hold], self.y[hold], self.alt[hold]
+
+        land = mode == LAND
+        talt[land] = 0
+
+        rtl = mode == RTL
+        home_dist = np.hypot(self.home_x - self.x, self.home_y - self.y)
+        returning = rtl & (home_dist > 1.0)
+        tx[rtl], ty[rtl] = self.home_x[rtl], self.home_y[rtl]
+        talt[returning] = np.maximum(self.alt[returning], RTL_ALT)
+        talt[rtl & ~returning] = 0
+
+        dx, dy = tx - self.x, ty - self.y
+        dist = np.hypot(dx, dy)
+        move = np.where(airborne, np.minimum(dist, MAX_SPEED * dt), 0.0)
+        moving = move > 0
+        with np.errstate(invalid='ignore', divide='ignore'):
+            ux = np.where(moving, dx / dist, 0.0)
+            uy = np.where(moving, dy / dist, 0.0)
+        self.x += ux * move
+        self.y += uy * move
+        self.groundspeed = move / dt
+        self.heading = np.where(moving, np.degrees(np.arctan2(ux, uy)) % 360, self.heading)
+
+        climb = np.clip(talt - self.alt, -DESCENT_RATE * dt, CLIMB_RATE * dt)
+        self.alt = np.maximum(self.alt + np.where(armed, climb, 0.0), 0.0)
+
+        self.battery = np.maximum(
+            self.battery - dt * (IDLE_DRAIN * armed + FLIGHT_DRAIN * airborne), 0.0)
+
+        landed = np.flatnonzero(armed & (land | rtl) & ~returning & (self.alt <= 0.05))
+        self.armed[landed] = False
+        return landed
+
+    def tick(self, dt):
+        start = time.perf_counter()
+        with self.lock:
+            before = self.armed.copy()
+            landed = self.step(dt)
+        self.step_time = time.perf_counter() - start
+        for i in landed:
+            self.vehicles[i].notify_attribute_listeners('armed', False)
+        self.publish(before | self.armed)
+        self.publish_time = time.perf_counter() - start - self.step_time
+        self.ticks += 1
+
+    def publish(self, mask):
+        """Push one combined update per changed vehicle into its telemetry snapshot"""
+        indices = np.flatnonzero(mask)
+        if len(indices) == 0:
+            return
+        lat = self.lat()[indices].tolist()
+        lon = self.lon()[indices].tolist()
+        alt = self.alt[indices].tolist()
+        gs = self.groundspeed[indices].tolist()
+        heading = self.heading[indices].tolist()
+        voltage = self.voltage()[indices].tolist()
+        battery = self.battery[indices].tolist()
+        pitch = (-0.3 * self.groundspeed[indices] / MAX_SPEED).tolist()
+        yaw = np.radians(self.heading[indices]).tolist()
+        armed = self.armed[indices].tolist()
+        for k, i in enumerate(indices.tolist()):
+            vehicle = self.vehicles[i]
+            snapshot = vehicle.snapshot
+            if snapshot is not None:
+                snapshot.update({
+                    "armed": armed[k],
+                    "lat": lat[k], "lon": lon[k], "alt": alt[k],
+                    "groundspeed": gs[k], "airspeed": gs[k], "heading": heading[k],
+                    "battery_voltage": voltage[k], "battery_remaining": int(battery[k]),
+                    "roll": 0, "pitch": pitch[k], "yaw": yaw[k]
+                })
+            if vehicle._attribute_listeners.get('location.global_relative_frame'):
+                vehicle.notify_attribute_listeners('location.global_relative_frame',
+                                                   vehicle.location.global_relative_frame)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="sim-fleet", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        interval = 1.0 / self.rate
+        next_tick = time.monotonic()
+        while not self._stop.is_set():
+            next_tick += interval
+            self.tick(interval)
+            delay = next_tick - time.monotonic()
+            if delay > 0:
+                self._stop.wait(delay)
+            else:
+                next_tick = time.monotonic()
+
+    def stats(self):
+        return {
+            "count": self.count,
+            "rate": self.rate,
+            "ticks": self.ticks,
+            "armed": int(self.armed.sum()),
+            "airborne": int((self.armed & (self.alt > 0.5)).sum()),
+            "step_ms": self.step_time * 1000,
+            "publish_ms": self.publish_time * 1000
+        }
+
+
+class SimulatedVehicle(VirtualVehicle):
+    """One row of a SimulatedFleet seen through the dronekit Vehicle interface"""
+
+    def __init__(self, fleet, index, vehicle_id):
+        self.fleet = fleet
+        self.index = index
+        self.vehicle_id = vehicle_id
+        self.snapshot = None
+        super().__init__()
+
+    def reset_state(self):
+        self.gps_0 = GPSInfo(80, 120, 3, 12)
+
+    def bind_snapshot(self, snapshot):
+        self.snapshot = snapshot
+
+    @property
+    def location(self):
+        fleet, i = self.fleet, self.index
+        lat = fleet.origin_lat + fleet.y[i] / METERS_PER_DEGREE
+        lon = fleet.origin_lon + fleet.x[i] / fleet._meters_per_lon
+        alt = float(fleet.alt[i])
+        return SimpleNamespace(global_frame=LocationGlobal(lat, lon, alt),
+                               global_relative_frame=LocationGlobalRelative(lat, lon, alt))
+
+    @property
+    def attitude(self):
+        speed = float(self.fleet.groundspeed[self.index])
+        return Attitude(-0.3 * speed / MAX_SPEED, math.radians(self.heading), 0)
+
+    @property
+    def groundspeed(self):
+        return float(self.fleet.groundspeed[self.index])
+
+    @property
+    def airspeed(self):
+        return self.groundspeed
+
+    @property
+    def heading(self):
+        return float(self.fleet.heading[self.index])
+
+    @property
+    def battery(self):
+        level = float(self.fleet.battery[self.index])
+        return Battery((10.5 + 2.1 * level / 100.0) * 1000, -1, int(level))
+
+    @property
+    def _armed(self):
+        return bool(self.fleet.armed[self.index])
+
+    @property
+    def _mode(self):
+        return VehicleMode(MODES[self.fleet.mode[self.index]])
+
+    @property
+    def last_heartbeat(self):
+        return 0.0
+
+    def close(self):
+        super().close()
+        if all(vehicle.closed for vehicle in self.fleet.vehicles):
+            self.fleet.stop()
+
+    def _ack(self, command, accepted):
+        result = mavutil.mavlink.MAV_RESULT_ACCEPTED if accepted else mavutil.mavlink.MAV_RESULT_DENIED
+        self.notify_message_listeners('COMMAND_ACK', SimpleNamespace(command=command, result=result))
+
+    def _command_armed(self, armed):
+        fleet, i = self.fleet, self.index
+        with fleet.lock:
+            on_ground = fleet.alt[i] <= 0.5
+            allowed = on_ground and (not armed or fleet.battery[i] > 5)
+            changed = allowed and bool(fleet.armed[i]) != armed
+            if changed:
+                fleet.armed[i] = armed
+                fleet.target_x[i], fleet.target_y[i], fleet.target_alt[i] = fleet.x[i], fleet.y[i], 0
+        self._ack(mavutil.mavlink.MAV_CMD_COMPONENT_ARM_DISARM, allowed)
+        if changed:
+            self.notify_attribute_listeners('armed', armed)
+            if self.snapshot is not None:
+                self.snapshot.update({"armed": armed})
+
+    def _command_mode(self, name):
+        fleet, i = self.fleet, self.index
+        code = MODE_CODES.get(name)
+        if code is not None:
+            with fleet.lock:
+                changed = fleet.mode[i] != code
+                fleet.mode[i] = code
+                fleet.target_x[i], fleet.target_y[i], fleet.target_alt[i] = fleet.x[i], fleet.y[i], fleet.alt[i]
+        self._ack(mavutil.mavlink.MAV_CMD_DO_SET_MODE, code is not None)
+        if code is not None and changed:
+            self.notify_attribute_listeners('mode', VehicleMode(name))
+            if self.snapshot is not None:
+                self.snapshot.update({"mode": name})
+
+    def simple_takeoff(self, alt):
+        fleet, i = self.fleet, self.index
+        with fleet.lock:
+            accepted = bool(fleet.armed[i]) and fleet.mode[i] == GUIDED
+            if accepted:
+                fleet.target_x[i], fleet.target_y[i], fleet.target_alt[i] = fleet.x[i], fleet.y[i], alt
+        self._ack(mavutil.mavlink.MAV_CMD_NAV_TAKEOFF, accepted)
+
+    def simple_goto(self, location, airspeed=None, groundspeed=None):
+        fleet, i = self.fleet, self.index
+        with fleet.lock:
+            if fleet.mode[i] != GUIDED or not fleet.armed[i]:
+                return
+            fleet.target_x[i] = (location.lon - fleet.origin_lon) * fleet._meters_per_lon
+            fleet.target_y[i] = (location.lat - fleet.origin_lat) * METERS_PER_DEGREE
+            if location.alt is not None:
+                fleet.target_alt[i] = location.alt
+
+
+def fleet_from_uri(uri):
+    """Build and start a fleet from ``sim:?count=1&lat=..&lon=..&rate=10&prefix=sim``"""
+    options = {k: v[0] for k, v in parse_qs(uri.partition('?')[2]).items()}
+    return SimulatedFleet(int(options.get('count', 1)),
+                          lat=float(options.get('lat', 28.6139)),
+                          lon=float(options.get('lon', 77.2090)),
+                          spacing=float(options.get('spacing', 20)),
+                          rate=float(options.get('rate', 10)),
+                          prefix=options.get('prefix', 'sim')).start()
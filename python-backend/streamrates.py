@@ -0,0 +1,296 @@
+"""
+Demand-driven MAVLink stream rates: ask the autopilot only for what subscribers read
+"""
+import threading
+import time
+
+from pymavlink import mavutil
+from pymavlink.dialects.v20 import ardupilotmega as mavlink
+
+MAV_CMD_SET_MESSAGE_INTERVAL = mavutil.mavlink.MAV_CMD_SET_MESSAGE_INTERVAL
+MAV_RESULT_ACCEPTED = mavutil.mavlink.MAV_RESULT_ACCEPTED
+
+# Telemetry field -> MAVLink message that carries it
+FIELD_MESSAGES = {
+    "lat": "GLOBAL_POSITION_INT",
+    "lon": "GLOBAL_POSITION_INT",
+    "alt": "GLOBAL_POSITION_INT",
+    "groundspeed": "VFR_HUD",
+    "airspeed": "VFR_HUD",
+    "heading": "VFR_HUD",
+    "roll": "ATTITUDE",
+    "pitch": "ATTITUDE",
+    "yaw": "ATTITUDE",
+    "battery_voltage": "SYS_STATUS",
+    "battery_remaining": "SYS_STATUS",
+    "gps_fix": "GPS_RAW_INT",
+    "satellites": "GPS_RAW_INT",
+}
+# What the backend itself needs with nobody watching: the recorder and the
+# airspace monitor want position and velocity, status can trickle, and
+# EKF_STATUS_REPORT keeps dronekit's is_armable current for /arm
+BASELINE = {
+    "GLOBAL_POSITION_INT": 1.0,
+    "VFR_HUD": 1.0,
+    "SYS_STATUS": 0.2,
+    "GPS_RAW_INT": 0.2,
+    "EKF_STATUS_REPORT": 0.2,
+    "ATTITUDE": 0.0,
+}
+MAX_RATE = 10.0
+
+MESSAGES = sorted(set(FIELD_MESSAGES.values()) | set(BASELINE))
+MESSAGE_IDS = {name: getattr(mavlink, 'MAVLINK_MSG_ID_' + name) for name in MESSAGES + ['HEARTBEAT']}
+
+# Bytes on the wire per message: payload plus MAVLink 2 header and checksum
+MESSAGE_BYTES = {name: mavlink.mavlink_map[msg_id].unpacker.size + 12 for name, msg_id in MESSAGE_IDS.items()}
+
+# Streamed after dronekit's initialize() asks for MAV_DATA_STREAM_ALL at 4 Hz, but
+# never demanded; seeing one means the autopilot's default streams are still on
+DEFAULT_STREAM_MESSAGES = ("RAW_IMU", "SCALED_PRESSURE", "RC_CHANNELS", "SERVO_OUTPUT_RAW")
+
+# A SET_MESSAGE_INTERVAL with no COMMAND_ACK by then is sent again
+ACK_TIMEOUT = 2.0
+
+# REQUEST_DATA_STREAM groups, for autopilots without SET_MESSAGE_INTERVAL
+DATA_STREAMS = {
+    mavutil.mavlink.MAV_DATA_STREAM_POSITION: ("GLOBAL_POSITION_INT",),
+    mavutil.mavlink.MAV_DATA_STREAM_EXTRA1: ("ATTITUDE",),
+    mavutil.mavlink.MAV_DATA_STREAM_EXTRA2: ("VFR_HUD",),
+    mavutil.mavlink.MAV_DATA_STREAM_EXTENDED_STATUS: ("SYS_STATUS", "GPS_RAW_INT"),
+    mavutil.mavlink.MAV_DATA_STREAM_EXTRA3: ("EKF_STATUS_REPORT",),
+}
+
+POLL_TTL = 5.0
+LINGER = 5.0
+
+
+def link_bytes_per_second(baud):
+    # 8N1 serial: ten bits on the wire per byte
+    return baud / 10.0 if baud else None
+
+
+class StreamRateController:
+    """Stream rates for one vehicle, derived from the demands registered on it.
+
+    A demand is (fields, rate) under a key: SSE subscribers register one for
+    as long as they are connected, pollers refresh one with a TTL on every
+    request. ``tick`` drops expired demands and works out the rate each
+    message needs (at least BASELINE). The autopilot's default streams are
+    switched off first, then SET_MESSAGE_INTERVAL is sent for each message
+    whose rate changed, one at a time: a rate only counts as applied once
+    its COMMAND_ACK is accepted, and is sent again if none arrives. If the
+    autopilot rejects the command it falls back to REQUEST_DATA_STREAM.
+    Every received message is counted to report the rates and link
+    utilization actually achieved.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._vehicle = None
+        self._demands = {}
+        self.baud = None
+        self.method = None
+        self.applied = {}
+        self._inflight = None
+        self._streams_reset = False
+        self._counts = {}
+        self._window_start = time.monotonic()
+        self.measured = {}
+        self._measured_bytes = None
+        self._other_bytes = None
+        self._window_bytes = None
+        self._last_total = None
+
+    def attach(self, vehicle, baud=None):
+        self.detach()
+        self.baud = baud
+        self.method = 'interval' if hasattr(vehicle, 'message_factory') else None
+        self.applied = {}
+        self._inflight = None
+        self._streams_reset = False
+        self._last_total = None
+        vehicle.add_message_listener('*', self._on_message)
+        vehicle.add_message_listener('COMMAND_ACK', self._on_ack)
+        self._vehicle = vehicle
+
+    def detach(self):
+        vehicle, self._vehicle = self._vehicle, None
+        if vehicle is not None:
+            try:
+                vehicle.remove_message_listener('*', self._on_message)
+                vehicle.remove_message_listener('COMMAND_ACK', self._on_ack)
+            except:
+                pass
+
+    # ----- demand -----
+    def demand(self, key, fields=None, rate=1.0, ttl=None):
+        """Register or refresh a need for ``fields`` (None = all) at ``rate`` Hz"""
+        messages = {FIELD_MESSAGES[f] for f in (fields or FIELD_MESSAGES) if f in FIELD_MESSAGES}
+        expires = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._demands[key] = (messages, min(float(rate), MAX_RATE), expires)
+
+    def release(self, key):
+        """Drop a demand after LINGER seconds, so a reconnecting client doesn't cause flapping"""
+        with self._lock:
+            if key in self._demands:
+                messages, rate, expires = self._demands[key]
+                self._demands[key] = (messages, rate, time.monotonic() + LINGER)
+
+    def targets(self):
+        """Rate in Hz each message should be streamed at"""
+        now = time.monotonic()
+        with self._lock:
+            for key in [k for k, (_, _, expires) in self._demands.items() if expires and expires < now]:
+                del self._demands[key]
+            demands = list(self._demands.values())
+        rates = dict(BASELINE)
+        for messages, rate, expires in demands:
+            for name in messages:
+                rates[name] = max(rates.get(name, 0), rate)
+        return rates
+
+    # ----- applying -----
+    def tick(self):
+        vehicle = self._vehicle
+        if vehicle is None:
+            return
+        self._measure(vehicle)
+        if self.method is None:
+            return
+        if not self._streams_reset:
+            # Everything dronekit's initialize() turned on goes off; only demanded messages come back
+            vehicle.send_mavlink(vehicle.message_factory.request_data_stream_encode(
+                0, 0, mavutil.mavlink.MAV_DATA_STREAM_ALL, 0, 0))
+            self._streams_reset = True
+            self.applied = {}
+            self._inflight = None
+        rates = self.targets()
+        if self.method == 'interval':
+            self._send_next(vehicle, rates)
+        else:
+            changed = {}
+            for stream_id, names in DATA_STREAMS.items():
+                # Data streams only take whole Hz; a group runs at its fastest member's rate
+                hz = max(rates[name] for name in names)
+                hz = max(1, int(round(hz))) if hz > 0 else 0
+                if any(self.applied.get(name) != hz for name in names):
+                    vehicle.send_mavlink(vehicle.message_factory.request_data_stream_encode(
+                        0, 0, stream_id, hz, 1 if hz else 0))
+                    changed.update(dict.fromkeys(names, hz))
+            self.applied.update(changed)
+
+    def _send_next(self, vehicle, rates=None):
+        """Send SET_MESSAGE_INTERVAL for the next message off its target, unless one awaits its ACK"""
+        rates = rates or self.targets()
+        now = time.monotonic()
+        with self._lock:
+            if self._inflight and now - self._inflight[2] < ACK_TIMEOUT:
+                return
+            pending = [name for name in MESSAGES if self.applied.get(name) != rates[name]]
+            if not pending:
+                self._inflight = None
+                return
+            name = pending[0]
+            self._inflight = (name, rates[name], now)
+        interval = int(1e6 / rates[name]) if rates[name] > 0 else -1
+        vehicle.send_mavlink(vehicle.message_factory.command_long_encode(
+            0, 0, MAV_CMD_SET_MESSAGE_INTERVAL, 0, MESSAGE_IDS[name], interval, 0, 0, 0, 0, 0))
+
+    def _on_ack(self, vehicle, name, msg):
+        if msg.command != MAV_CMD_SET_MESSAGE_INTERVAL or self.method != 'interval':
+            return
+        with self._lock:
+            inflight, self._inflight = self._inflight, None
+        if inflight is None:
+            return
+        if msg.result == MAV_RESULT_ACCEPTED:
+            self.applied[inflight[0]] = inflight[1]
+            self._send_next(vehicle)
+        else:
+            print(f"⚠️ SET_MESSAGE_INTERVAL rejected ({msg.result}), falling back to REQUEST_DATA_STREAM")
+            self.method = 'data_stream'
+            self.applied = {}
+
+    # ----- measuring -----
+    def _on_message(self, vehicle, name, msg):
+        counts = self._counts.get(name)
+        if counts is None:
+            counts = self._counts[name] = [0, 0]
+        counts[0] += 1
+        try:
+            counts[1] += len(msg.get_msgbuf())
+        except Exception:
+            counts[1] += MESSAGE_BYTES.get(name, 0)
+
+    def _measure(self, vehicle):
+        now = time.monotonic()
+        elapsed = now - self._window_start
+        if elapsed < 5:
+            return
+        counts, self._counts = self._counts, {}
+        self._window_start = now
+        self.measured = {name: round(count / elapsed, 2) for name, (count, _) in counts.items()}
+        self._window_bytes = sum(size for _, size in counts.values()) / elapsed
+        self._other_bytes = sum(size for name, (_, size) in counts.items() if name not in MESSAGE_IDS) / elapsed
+        if self.method and any(name in counts for name in DEFAULT_STREAM_MESSAGES):
+            # The stream reset was lost or undone (e.g. by another ground station): send it again
+            self._streams_reset = False
+        # Real links count every byte received, other traffic included
+        mav = getattr(getattr(vehicle, '_master', None), 'mav', None)
+        total = getattr(mav, 'total_bytes_received', None)
+        if total is not None:
+            last, self._last_total = self._last_total, total
+            self._measured_bytes = (total - last) / elapsed if last is not None else None
+
+    def stats(self):
+        rates = self.targets()
+        capacity = link_bytes_per_second(self.baud)
+        applied = {name: self.applied.get(name, rates[name]) for name in MESSAGES} if self.method else rates
+        # Demanded messages as applied, plus whatever else the last window actually carried
+        estimated = MESSAGE_BYTES['HEARTBEAT'] + sum(applied[name] * MESSAGE_BYTES[name] for name in MESSAGES)
+        estimated += self._other_bytes or 0
+        measured = self._measured_bytes
+        if measured is None:
+            measured = self._window_bytes
+        with self._lock:
+            demands = len(self._demands)
+        return {
+            "method": self.method,
+            "baud": self.baud,
+            "demands": demands,
+            "requested_hz": rates,
+            "applied_hz": dict(self.applied),
+            "measured_hz": self.measured,
+            "estimated_bytes_per_second": round(estimated, 1),
+            "measured_bytes_per_second": round(measured, 1) if measured is not None else None,
+            "estimated_utilization": round(estimated / capacity, 3) if capacity else None,
+            "measured_utilization": round(measured / capacity, 3) if capacity and measured is not None else None
+        }
+
+
+class StreamRateScheduler:
+    """Ticks every vehicle's StreamRateController from one background thread"""
+
+    def __init__(self, entries, interval=1.0):
+        self.entries = entries
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="stream-rates", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            for entry in self.entries():
+                try:
+                    entry.streams.tick()
+                except Exception as e:
+                    print(f"❌ Stream rate update failed for {entry.vehicle_id}: {e}")
@@ -0,0 +1,219 @@
+"""
+Connection supervisor: background connects, heartbeat watchdog and automatic reconnect
+"""
+import threading
+import time
+from collections import deque
+
+from dronekit import connect
+
+from metrics import CONNECT_ATTEMPTS, HEARTBEAT_LOSSES, RECONNECTS
+
+HEARTBEAT_TIMEOUT = 1.5
+RESUME_GRACE = 3.0
+WATCHDOG_INTERVAL = 0.2
+BACKOFF_INITIAL = 1.0
+BACKOFF_MAX = 30.0
+# A link that never came up is given up on after this many attempts
+INITIAL_ATTEMPTS = 3
+
+STAGES = ('port_open', 'heartbeat', 'params_loaded')
+
+CONNECTING = 'connecting'
+CONNECTED = 'connected'
+LOST = 'lost'
+RECONNECTING = 'reconnecting'
+FAILED = 'failed'
+STOPPED = 'stopped'
+
+
+def open_dronekit(connection_string, baud, report, heartbeat_timeout=30, ready_timeout=30):
+    """dronekit's connect(wait_ready=True), split up so each stage can be reported"""
+    vehicle = connect(connection_string, baud=baud, _initialize=False)
+    report('port_open')
+    try:
+        vehicle.initialize(heartbeat_timeout=heartbeat_timeout)
+        report('heartbeat')
+        vehicle.wait_ready(True, timeout=ready_timeout)
+        report('params_loaded')
+    except:
+        vehicle.close()
+        raise
+    return vehicle
+
+
+class ConnectionSupervisor:
+    """Keeps one vehicle connected from a background thread.
+
+    ``opener(connection_string, baud, report)`` opens the link and calls
+    ``report(stage)`` as it passes each of STAGES; ``attach(entry, vehicle,
+    port, baud)`` installs the result on the fleet entry. Once connected, a
+    watchdog polls ``vehicle.last_heartbeat``: after HEARTBEAT_TIMEOUT
+    seconds of silence the entry's telemetry is marked stale but kept, and if
+    heartbeats have not resumed RESUME_GRACE seconds later the link is
+    closed and reopened with exponential backoff until ``stop`` is called.
+    A ``previous`` supervisor for the same vehicle is stopped by the caller;
+    the first open waits for its thread to finish, since it may still hold
+    the port in the middle of its own open.
+    """
+
+    def __init__(self, entry, opener, attach, connection_string, baud, previous=None):
+        self.entry = entry
+        self.opener = opener
+        self.attach = attach
+        self.connection_string = connection_string
+        self.baud = baud
+        self.state = CONNECTING
+        self.stages = {}
+        self.attempts = 0
+        self.last_error = None
+        self.connected_since = None
+        self.events = deque(maxlen=20)
+        self._ever_connected = False
+        self._attempt_started = None
+        self._vehicle = None
+        self._previous = previous
+        self._stop = threading.Event()
+        self._state_changed = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name=f"supervisor-{entry.vehicle_id}", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._set_state(STOPPED)
+
+    def join(self, timeout=None):
+        """Wait for the thread to finish; a stopped supervisor closes whatever it opened before it does"""
+        if self._thread.ident is not None:
+            self._thread.join(timeout)
+
+    def _set_state(self, state, event=None):
+        with self._state_changed:
+            if self.state != STOPPED or state == STOPPED:
+                self.state = state
+            self.events.append({"time": time.time(), "state": state, "event": event or state})
+            self._state_changed.notify_all()
+
+    def wait_connected(self, timeout):
+        """Block until connected, failed or stopped; returns the state"""
+        with self._state_changed:
+            self._state_changed.wait_for(lambda: self.state in (CONNECTED, FAILED, STOPPED), timeout)
+            return self.state
+
+    def _report(self, stage):
+        self.stages[stage] = round(time.monotonic() - self._attempt_started, 3)
+        self.events.append({"time": time.time(), "state": self.state, "event": stage})
+
+    # ----- loop -----
+    def _run(self):
+        if self._previous is not None:
+            self.events.append({"time": time.time(), "state": self.state, "event": "waiting for previous link"})
+            self._previous.join()
+            self._previous = None
+        backoff = BACKOFF_INITIAL
+        while not self._stop.is_set():
+            self.attempts += 1
+            self.stages = {}
+            self._attempt_started = time.monotonic()
+            self._set_state(RECONNECTING if self._ever_connected else CONNECTING, f"attempt {self.attempts}")
+            try:
+                vehicle = self.opener(self.connection_string, self.baud, self._report)
+            except Exception as e:
+                CONNECT_ATTEMPTS.inc(self.entry.vehicle_id, 'failure')
+                self.last_error = str(e)
+                print(f"❌ Connection attempt {self.attempts} for {self.entry.vehicle_id} failed: {e}")
+                if not self._ever_connected and self.attempts >= INITIAL_ATTEMPTS:
+                    self._set_state(FAILED, self.last_error)
+                    return
+                if self._stop.wait(backoff):
+                    return
+                backoff = min(backoff * 2, BACKOFF_MAX)
+                continue
+
+            CONNECT_ATTEMPTS.inc(self.entry.vehicle_id, 'success')
+            with self.entry.lock:
+                # Checked under the lock so a /disconnect can't slip in before the attach
+                # and leave a live vehicle that no supervisor owns
+                if self._stop.is_set():
+                    self._close(vehicle)
+                    return
+                old = self.entry.detach()
+                self.attach(self.entry, vehicle, self.connection_string, self.baud)
+            if old is not None and old is not vehicle:
+                self._close(old)
+            self._vehicle = vehicle
+            self._ever_connected = True
+            self.connected_since = time.time()
+            self.last_error = None
+            backoff = BACKOFF_INITIAL
+            self._set_state(CONNECTED)
+            print(f"✅ Connected to vehicle {self.entry.vehicle_id} on {self.connection_string} at {self.baud} baud")
+
+            self._watch(vehicle)
+            if self._stop.is_set():
+                return
+            # Link is gone: drop the vehicle but keep serving its last telemetry, marked stale
+            RECONNECTS.inc(self.entry.vehicle_id)
+            with self.entry.lock:
+                if self.entry.vehicle is vehicle:
+                    self.entry.detach(keep_telemetry=True)
+            self._close(vehicle)
+            self._vehicle = None
+
+    def _watch(self, vehicle):
+        """Return once the link has been silent past the grace period, or on stop"""
+        lost_since = None
+        while not self._stop.wait(WATCHDOG_INTERVAL):
+            finished = getattr(vehicle, 'finished', None)
+            if finished is not None and finished.is_set():
+                # A replay that ran to its end is not a link failure
+                self._stop.wait()
+                return
+            try:
+                silence = vehicle.last_heartbeat
+            except Exception:
+                silence = None
+            if silence is None:
+                continue
+            if silence > HEARTBEAT_TIMEOUT:
+                if lost_since is None:
+                    lost_since = time.monotonic()
+                    self.entry.telemetry.update({"stale": True})
+                    HEARTBEAT_LOSSES.inc(self.entry.vehicle_id)
+                    self._set_state(LOST, f"no heartbeat for {silence:.1f}s")
+                    print(f"⚠️ Lost heartbeat from {self.entry.vehicle_id}")
+                elif time.monotonic() - lost_since > RESUME_GRACE:
+                    return
+            elif lost_since is not None:
+                lost_since = None
+                self.entry.telemetry.update({"stale": False})
+                self._set_state(CONNECTED, "heartbeat resumed")
+
+    @staticmethod
+    def _close(vehicle):
+        try:
+            vehicle.close()
+        except:
+            pass
+
+    def status(self):
+        vehicle = self._vehicle
+        try:
+            heartbeat_age = round(vehicle.last_heartbeat, 2) if vehicle is not None else None
+        except Exception:
+            heartbeat_age = None
+        return {
+            "vehicle_id": self.entry.vehicle_id,
+            "state": self.state,
+            "connection_string": self.connection_string,
+            "baud": self.baud,
+            "stages": self.stages,
+            "attempts": self.attempts,
+            "last_error": self.last_error,
+            "connected_since": self.connected_since,
+            "heartbeat_age": heartbeat_age,
+            "events": list(self.events)
+        }
@@ -0,0 +1,291 @@
+"""
+Push-based telemetry snapshot kept current by dronekit attribute listeners
+"""
+import json
+import threading
+import time
+
+DISCONNECTED_PAYLOAD = json.dumps({"connected": False}).encode()
+
+
+def _location_fields(location):
+    if not location:
+        return {"lat": 0, "lon": 0}
+    return {"lat": location.lat or 0, "lon": location.lon or 0}
+
+
+def _relative_fields(location):
+    return {"alt": (location.alt or 0) if location else 0}
+
+
+def _battery_fields(battery):
+    return {
+        "battery_voltage": battery.voltage if battery else 0,
+        "battery_remaining": battery.level if battery else 0
+    }
+
+
+def _gps_fields(gps):
+    return {
+        "gps_fix": gps.fix_type if gps else 0,
+        "satellites": gps.satellites_visible if gps else 0
+    }
+
+
+def _attitude_fields(attitude):
+    return {
+        "roll": attitude.roll if attitude else 0,
+        "pitch": attitude.pitch if attitude else 0,
+        "yaw": attitude.yaw if attitude else 0
+    }
+
+
+# dronekit attribute name -> function turning the new value into telemetry fields
+ATTRIBUTE_FIELDS = {
+    "armed": lambda value: {"armed": bool(value)},
+    "mode": lambda value: {"mode": str(value.name) if value else ""},
+    "location.global_frame": _location_fields,
+    "location.global_relative_frame": _relative_fields,
+    "groundspeed": lambda value: {"groundspeed": value or 0},
+    "airspeed": lambda value: {"airspeed": value or 0},
+    "heading": lambda value: {"heading": value or 0},
+    "battery": _battery_fields,
+    "gps_0": _gps_fields,
+    "attitude": _attitude_fields,
+}
+
+
+def read_vehicle(vehicle):
+    """Read every telemetry field from the vehicle in one pass"""
+    fields = {"connected": True}
+    fields.update(ATTRIBUTE_FIELDS["armed"](vehicle.armed))
+    fields.update(ATTRIBUTE_FIELDS["mode"](vehicle.mode))
+    fields.update(_location_fields(vehicle.location.global_frame))
+    fields.update(_relative_fields(vehicle.location.global_relative_frame))
+    fields.update(ATTRIBUTE_FIELDS["groundspeed"](vehicle.groundspeed))
+    fields.update(ATTRIBUTE_FIELDS["airspeed"](vehicle.airspeed))
+    fields.update(ATTRIBUTE_FIELDS["heading"](vehicle.heading))
+    fields.update(_battery_fields(vehicle.battery))
+    fields.update(_gps_fields(vehicle.gps_0))
+    fields.update(_attitude_fields(vehicle.attitude))
+    return fields
+
+
+class TelemetrySnapshot:
+    """Latest telemetry for one vehicle, updated by listeners and served pre-encoded.
+
+    Writers (dronekit's message thread) bump ``version`` on every change.
+    Readers call ``payload()`` which only encodes JSON the first time a new
+    version is requested; after that every reader gets the same bytes
+    without taking any lock.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._fields = {"connected": False}
+        self._vehicle = None
+        self._subscribers = []
+        self._change_subscribers = []
+        self.version = 0
+        # Version of the last replace(), which may have removed fields
+        self.replaced = 0
+        self._encoded = (0, DISCONNECTED_PAYLOAD)
+
+    def subscribe(self, callback, changes=False):
+        """Call ``callback(snapshot)`` after every change, on the writer's thread.
+
+        With ``changes`` it is called as ``callback(snapshot, changed, replaced)``
+        instead, with only the fields that changed; ``replaced`` means every
+        field was replaced and ``changed`` holds them all.
+        """
+        subscribers = self._change_subscribers if changes else self._subscribers
+        if callback not in subscribers:
+            subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        for subscribers in (self._subscribers, self._change_subscribers):
+            if callback in subscribers:
+                subscribers.remove(callback)
+
+    def _notify(self, changed, replaced=False):
+        for callback in self._subscribers:
+            try:
+                callback(self)
+            except Exception:
+                pass
+        for callback in self._change_subscribers:
+            try:
+                callback(self, changed, replaced)
+            except Exception:
+                pass
+
+    def attach(self, vehicle):
+        """Seed the snapshot from the vehicle and subscribe to its attributes"""
+        self.detach()
+        fields = read_vehicle(vehicle)
+        # Explicit, so stream clients merging deltas see a reconnect clear a kept-stale snapshot
+        fields["stale"] = False
+        if hasattr(vehicle, 'bind_snapshot'):
+            # Simulated fleets push all fields of a vehicle in one update per tick
+            vehicle.bind_snapshot(self)
+        else:
+            for attr_name in ATTRIBUTE_FIELDS:
+                vehicle.add_attribute_listener(attr_name, self._on_attribute)
+        self._vehicle = vehicle
+        self.replace(fields)
+
+    def detach(self, keep=False):
+        """Unsubscribe from the current vehicle and mark the snapshot disconnected.
+
+        With ``keep`` the last fields stay readable, flagged ``stale``.
+        """
+        vehicle, self._vehicle = self._vehicle, None
+        if vehicle is not None and hasattr(vehicle, 'bind_snapshot'):
+            vehicle.bind_snapshot(None)
+        elif vehicle is not None:
+            for attr_name in ATTRIBUTE_FIELDS:
+                try:
+                    vehicle.remove_attribute_listener(attr_name, self._on_attribute)
+                except:
+                    pass
+        if keep:
+            self.update({"stale": True})
+        else:
+            self.replace({"connected": False})
+
+    def _on_attribute(self, vehicle, attr_name, value):
+        try:
+            self.update(ATTRIBUTE_FIELDS[attr_name](value))
+        except Exception:
+            pass
+
+    def update(self, fields):
+        """Merge changed fields; bumps the version only if something differs"""
+        with self._lock:
+            current = self._fields
+            changed = {k: v for k, v in fields.items() if current.get(k) != v}
+            if not changed:
+                return False
+            current.update(changed)
+            self.version += 1
+            self._changed.notify_all()
+        self._notify(changed)
+        return True
+
+    def replace(self, fields):
+        """Replace all fields at once (connect / disconnect)"""
+        with self._lock:
+            self._fields = dict(fields)
+            self.version += 1
+            self.replaced = self.version
+            self._changed.notify_all()
+        self._notify(fields, replaced=True)
+
+    def fields(self):
+        """Return (version, copy of the fields)"""
+        with self._lock:
+            return self.version, dict(self._fields)
+
+    def payload(self):
+        """Return (version, JSON bytes) for the latest state"""
+        encoded = self._encoded
+        if encoded[0] == self.version:
+            return encoded
+        version, fields = self.fields()
+        encoded = (version, json.dumps(fields).encode())
+        self._encoded = encoded
+        return encoded
+
+    def wait_for_change(self, version, timeout):
+        """Block until the version differs from ``version`` or the timeout expires"""
+        with self._changed:
+            return self._changed.wait_for(lambda: self.version != version, timeout)
+
+
+class TelemetryStream:
+    """One subscriber of a snapshot, producing a full frame then delta frames.
+
+    Frames are JSON objects carrying ``seq`` (the snapshot version). The first
+    frame is ``{"seq", "full": true, "data"}``; later frames are
+    ``{"seq", "prev", "delta"}`` with only the fields that changed since
+    ``prev``. A client that misses a frame reconnects to get a full one.
+    A delta can't remove a field, so once the snapshot has been replaced
+    (connect / disconnect) the next frame is a full one again.
+    With ``fields``, frames only carry those fields (plus ``connected``) and
+    changes to other fields send nothing.
+    """
+
+    KEEPALIVE = 15
+
+    def __init__(self, snapshot, max_rate=10, fields=None):
+        self.snapshot = snapshot
+        self.min_interval = 1.0 / max_rate if max_rate > 0 else 0
+        self.fields = set(fields) | {"connected"} if fields else None
+        self._sent = None
+        self._seq = None
+        self._seen = None
+
+    def _select(self, fields):
+        if self.fields is None:
+            return fields
+        return {k: v for k, v in fields.items() if k in self.fields}
+
+    def full_frame(self):
+        if self.fields is None:
+            version, payload = self.snapshot.payload()
+            _, self._sent = self.snapshot.fields()
+        else:
+            version, fields = self.snapshot.fields()
+            self._sent = self._select(fields)
+            payload = json.dumps(self._sent).encode()
+        self._seq = self._seen = version
+        return version, b'{"seq": %d, "full": true, "data": %s}' % (version, payload)
+
+    def poll_frame(self):
+        """Return (seq, frame bytes) if there is something new to send, else None without waiting"""
+        if self._sent is None:
+            return self.full_frame()
+        version, fields = self.snapshot.fields()
+        if version == self._seen:
+            return None
+        if self.snapshot.replaced > self._seq:
+            return self.full_frame()
+        self._seen = version
+        fields = self._select(fields)
+        delta = {k: v for k, v in fields.items() if self._sent.get(k) != v}
+        if not delta and self.fields is not None:
+            # Only unselected fields changed: nothing to send for this version
+            return None
+        frame = {"seq": version, "prev": self._seq, "delta": delta}
+        self._sent, self._seq = fields, version
+        return version, json.dumps(frame).encode()
+
+    def next_frame(self, timeout=None):
+        """Wait for a change and return (seq, frame bytes), or None on timeout"""
+        deadline = time.monotonic() + (timeout or self.KEEPALIVE)
+        while True:
+            frame = self.poll_frame()
+            if frame is not None:
+                return frame
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not self.snapshot.wait_for_change(self._seen, remaining):
+                return None
+
+    def sse(self):
+        """Generate Server-Sent Events, never faster than the subscriber's max rate"""
+        next_send = 0
+        while True:
+            delay = next_send - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            frame = self.next_frame()
+            if frame is None:
+                yield b': keepalive\n\n'
+                continue
+            yield sse_event(*frame)
+            next_send = time.monotonic() + self.min_interval
+
+
+def sse_event(seq, data):
+    return b'id: %d\ndata: %s\n\n' % (seq, data)
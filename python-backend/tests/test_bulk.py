@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+from bulk import (BOOL_MISSING, COLUMNAR, CODE_MISSING, INT_MISSING, JSON, decode_columnar,
+                  encode_columnar, negotiate)
+
+
+@pytest.mark.parametrize("accept, expected", [
+    (None, JSON),
+    ("", JSON),
+    ("*/*", JSON),
+    ("application/json", JSON),
+    ("Application/JSON", JSON),
+    ("application/octet-stream", COLUMNAR),
+    ("application/json;q=0.5, application/vnd.utms.columnar", COLUMNAR),
+    ("application/json ; q=0.9, APPLICATION/VND.UTMS.COLUMNAR;Q=0.1", JSON),
+    ("application/vnd.utms.columnar;q=0, application/json", JSON),
+    ("text/html", None),
+])
+def test_negotiate(accept, expected):
+    assert negotiate(accept) == expected
+
+
+def test_requested_format_wins():
+    assert negotiate("application/json", "columnar") == COLUMNAR
+    assert negotiate(None, "xml") is None
+
+
+def test_columnar_round_trip():
+    fields = ("connected", "mode", "lat", "alt", "satellites")
+    rows = [
+        {"connected": True, "mode": "GUIDED", "lat": 28.6139123, "alt": 12.5, "satellites": 9},
+        {"connected": None, "mode": None, "lat": None, "alt": None, "satellites": None},
+        {"connected": False, "mode": "LAND", "lat": -1.0, "alt": 0.0, "satellites": 0},
+    ]
+    header, columns = decode_columnar(encode_columnar(["a", "b", "c"], [1, 2, 3], rows, fields))
+
+    assert header["vehicles"] == ["a", "b", "c"]
+    assert columns["seq"].tolist() == [1, 2, 3]
+    assert columns["connected"].tolist() == [1, BOOL_MISSING, 0]
+    modes = next(c for c in header["columns"] if c["name"] == "mode")["values"]
+    assert [modes[code] if code != CODE_MISSING else None for code in columns["mode"]] == ["GUIDED", None, "LAND"]
+    # lat stays float64, so it keeps its full precision
+    assert columns["lat"][0] == 28.6139123
+    assert np.isnan(columns["lat"][1]) and np.isnan(columns["alt"][1])
+    assert columns["satellites"].tolist() == [9, INT_MISSING, 0]
+
+
+def test_columns_are_8_byte_aligned():
+    frame = encode_columnar(["a"], [1], [{"alt": 1.0}], ("alt",))
+    header, _ = decode_columnar(frame)
+    length = int.from_bytes(frame[4:8], "little")
+    assert (8 + length) % 8 == 0
+    assert all(column["offset"] % 8 == 0 for column in header["columns"])
+
+
+def test_decode_rejects_other_frames():
+    with pytest.raises(ValueError):
+        decode_columnar(b'{"not": "columnar"}')
@@ -0,0 +1,80 @@
+import itertools
+import math
+
+import numpy as np
+
+from deconfliction import METERS_PER_DEGREE, ConflictDetector
+
+LAT, LON = 28.6, 77.2
+
+
+def place(detector, vehicle_id, north, east, alt=20, speed=0, heading=0, armed=True):
+    detector.update(vehicle_id, {
+        "connected": True, "armed": armed,
+        "lat": LAT + north / METERS_PER_DEGREE,
+        "lon": LON + east / (METERS_PER_DEGREE * math.cos(math.radians(LAT))),
+        "alt": alt, "groundspeed": speed, "heading": heading
+    })
+
+
+def pairs(conflicts):
+    return sorted(tuple(c["vehicles"]) for c in conflicts)
+
+
+def test_head_on_conflict_predicted():
+    detector = ConflictDetector()
+    place(detector, "a", 0, 0, speed=10, heading=90)
+    place(detector, "b", 0, 400, speed=10, heading=270)
+    conflicts, stats = detector.check()
+    assert pairs(conflicts) == [("a", "b")]
+    conflict = conflicts[0]
+    assert not conflict["loss_of_separation"]
+    assert conflict["time_to_cpa"] == 20.0
+    assert conflict["cpa_distance"] == 0.0
+
+
+def test_current_loss_of_separation_reported_first():
+    detector = ConflictDetector()
+    place(detector, "a", 0, 0, speed=10, heading=90)
+    place(detector, "b", 0, 400, speed=10, heading=270)
+    place(detector, "c", 1000, 0)
+    place(detector, "d", 1000, 20)
+    conflicts, _ = detector.check()
+    assert conflicts[0]["vehicles"] == ["c", "d"] and conflicts[0]["loss_of_separation"]
+
+
+def test_vertical_separation_and_disarmed_vehicles_ignored():
+    detector = ConflictDetector()
+    place(detector, "a", 0, 0, alt=20)
+    place(detector, "b", 0, 10, alt=60)
+    place(detector, "c", 0, 5, armed=False)
+    assert detector.check()[0] == []
+
+
+def test_matches_brute_force():
+    rng = np.random.default_rng(7)
+    detector = ConflictDetector(horizontal_separation=50, vertical_separation=15, horizon=30)
+    for n in range(300):
+        place(detector, f"v{n:03d}", rng.uniform(0, 3000), rng.uniform(0, 3000), alt=rng.uniform(10, 60),
+              speed=rng.uniform(0, 25), heading=rng.uniform(0, 360))
+    conflicts, _ = detector.check()
+
+    ids, lat, lon, alt = detector.positions()
+    lat0 = lat.mean()
+    x = (lon - lon.mean()) * METERS_PER_DEGREE * math.cos(math.radians(lat0))
+    y = (lat - lat0) * METERS_PER_DEGREE
+    rows = detector._index
+    heading = np.radians([detector.heading[rows[v]] for v in ids])
+    speed = np.array([detector.speed[rows[v]] for v in ids])
+    vx, vy = speed * np.sin(heading), speed * np.cos(heading)
+    expected = []
+    for i, j in itertools.combinations(range(len(ids)), 2):
+        if abs(alt[i] - alt[j]) >= 15:
+            continue
+        px, py, rvx, rvy = x[j] - x[i], y[j] - y[i], vx[j] - vx[i], vy[j] - vy[i]
+        closing = rvx * rvx + rvy * rvy
+        t = min(max(-(px * rvx + py * rvy) / closing if closing > 1e-9 else 0.0, 0.0), 30)
+        if math.hypot(px + rvx * t, py + rvy * t) < 50:
+            expected.append(tuple(sorted((ids[i], ids[j]))))
+    assert pairs(conflicts) == sorted(expected)
+    assert expected
@@ -0,0 +1,71 @@
+import threading
+
+import pytest
+
+from dispatcher import (CONTROL, DONE, NAVIGATION, PREEMPTED, SAFETY, SUPERSEDED, Command,
+                        CommandDispatcher)
+
+
+@pytest.fixture
+def blocked():
+    """A dispatcher whose thread is busy until ``release`` is set, so submits stay queued"""
+    dispatcher = CommandDispatcher('test')
+    release, running = threading.Event(), threading.Event()
+
+    def block():
+        running.set()
+        release.wait(5)
+
+    dispatcher.submit(Command('block', block, CONTROL))
+    assert running.wait(5)
+    yield dispatcher, release
+    release.set()
+
+
+def test_runs_in_priority_order(blocked):
+    dispatcher, release = blocked
+    ran = []
+    goto = dispatcher.submit(Command('goto', lambda: ran.append('goto'), NAVIGATION))
+    arm = dispatcher.submit(Command('arm', lambda: ran.append('arm'), CONTROL))
+    release.set()
+    assert goto.wait(5) and arm.wait(5)
+    assert ran == ['arm', 'goto']
+
+
+def test_safety_preempts_queued_commands(blocked):
+    dispatcher, release = blocked
+    goto = dispatcher.submit(Command('goto', lambda: None, NAVIGATION))
+    land = dispatcher.submit(Command('land', lambda: None, SAFETY))
+    release.set()
+    assert land.wait(5)
+    assert goto.state == PREEMPTED
+    assert land.state == DONE
+
+
+def test_queued_commands_coalesce(blocked):
+    dispatcher, release = blocked
+    first = dispatcher.submit(Command('goto', lambda: 'first', NAVIGATION, coalesce='goto'))
+    second = dispatcher.submit(Command('goto', lambda: 'second', NAVIGATION, coalesce='goto'))
+    release.set()
+    assert second.wait(5)
+    assert first.state == SUPERSEDED
+    assert second.message == 'second'
+
+
+def test_lower_priority_never_supersedes_safety(blocked):
+    dispatcher, release = blocked
+    land = dispatcher.submit(Command('mode', lambda: 'LAND', SAFETY, coalesce='mode'))
+    guided = dispatcher.submit(Command('mode', lambda: 'GUIDED', CONTROL, coalesce='mode'))
+    release.set()
+    assert land.wait(5) and guided.wait(5)
+    assert land.state == DONE and land.message == 'LAND'
+    assert guided.state == DONE
+
+
+def test_drop_callback(blocked):
+    dispatcher, release = blocked
+    dropped = []
+    dispatcher.submit(Command('goto', lambda: None, NAVIGATION, coalesce='goto',
+                              on_drop=lambda state, reason: dropped.append(state)))
+    dispatcher.submit(Command('goto', lambda: None, NAVIGATION, coalesce='goto'))
+    assert dropped == [SUPERSEDED]
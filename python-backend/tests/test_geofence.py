@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+
+from geofence import GeofenceIndex, triangulate, _signed_area
+
+
+def zone(zone_id, polygon, floor=0, ceiling=50):
+    return {"id": zone_id, "name": "", "polygon": polygon, "floor": floor, "ceiling": ceiling}
+
+
+SQUARE_A = zone("A", [[0, 0], [0, 1], [1, 1], [1, 0]])
+SQUARE_B = zone("B", [[0, 2], [0, 3], [1, 3], [1, 2]])
+# A U opening towards +lat: two arms joined along lat 0..0.5
+U_SHAPE = zone("U", [[0, 0], [0, 3], [1, 3], [1, 2], [0.5, 2], [0.5, 1], [1, 1], [1, 0]])
+
+
+def ids(zones):
+    return [z["id"] for z in zones]
+
+
+@pytest.fixture
+def index():
+    return GeofenceIndex([SQUARE_A, SQUARE_B])
+
+
+def test_segment_into_zone(index):
+    assert ids(index.check_segment(0.5, 1.5, 10, 0.5, 0.5, 10)) == ["A"]
+
+
+def test_segment_across_zone(index):
+    assert ids(index.check_segment(0.5, -1, 10, 0.5, 1.5, 10)) == ["A"]
+
+
+def test_segment_above_ceiling(index):
+    assert index.check_segment(0.5, -1, 60, 0.5, 1.5, 60) == []
+
+
+def test_leaving_the_start_zone_is_allowed(index):
+    assert index.check_segment(0.5, 0.5, 10, 0.5, 1.5, 10) == []
+
+
+def test_climbing_out_of_the_start_zone_is_allowed(index):
+    assert index.check_segment(0.5, 0.5, 10, 0.5, 0.5, 100) == []
+
+
+def test_moving_within_the_start_zone_is_rejected(index):
+    assert ids(index.check_segment(0.2, 0.2, 10, 0.8, 0.8, 10)) == ["A"]
+
+
+def test_leaving_the_start_zone_into_another(index):
+    assert ids(index.check_segment(0.5, 0.5, 10, 0.5, 2.5, 10)) == ["B"]
+
+
+def test_leaving_through_a_corner_is_one_crossing(index):
+    assert index.check_segment(0.5, 0.5, 10, 1.5, 1.5, 10) == []
+
+
+def test_reentering_the_start_zone_is_rejected():
+    index = GeofenceIndex([U_SHAPE])
+    assert index.check_segment(0.8, 0.5, 10, 0.8, 1.5, 10) == []
+    assert ids(index.check_segment(0.8, 0.5, 10, 0.8, 2.5, 10)) == ["U"]
+
+
+def test_triangulation_covers_a_non_convex_ring():
+    ring = np.array(U_SHAPE["polygon"], dtype=float)
+    triangles = triangulate(ring)
+    assert len(triangles) == len(ring) - 2
+    total = sum(abs(_signed_area(ring[list(t)])) for t in triangles)
+    assert total == pytest.approx(abs(_signed_area(ring)))
+
+
+def test_triangulation_drops_repeated_and_collinear_vertices():
+    ring = np.array([[0, 0], [0, 0], [1, 0], [2, 0], [2, 2], [2, 2], [0, 2]], dtype=float)
+    triangles = triangulate(ring)
+    assert len(triangles) == 2
+    assert sum(abs(_signed_area(ring[list(t)])) for t in triangles) == pytest.approx(4)
+
+
+@pytest.mark.parametrize("ring", [
+    [[0, 0], [1, 1], [1, 0], [0, 1]],
+    [[0, 0], [4, 0], [4, 4], [2, 0], [0, 4]],
+])
+def test_self_intersecting_ring_is_rejected(ring):
+    with pytest.raises(ValueError):
+        triangulate(np.array(ring, dtype=float))
@@ -0,0 +1,52 @@
+import pytest
+
+from mission import HOME_PLACEHOLDER, FRAME, command_id, make_item, parse_waypoints, plan_upload
+
+
+def mission(*points):
+    return [HOME_PLACEHOLDER] + parse_waypoints(points)
+
+
+def test_parse_waypoints_accepts_lists_and_dicts():
+    items = parse_waypoints([[28.1, 77.2, 10], {"lat": 28.1, "lon": 77.2, "alt": 10}])
+    assert items[0] == items[1]
+    assert items[0].x == 281000000 and items[0].frame == FRAME
+    assert items[0].command == command_id("WAYPOINT")
+
+
+def test_unknown_command_is_rejected():
+    with pytest.raises(ValueError):
+        command_id("NOT_A_COMMAND")
+
+
+def test_unchanged_mission_writes_nothing():
+    current = mission([1, 2, 10], [1.1, 2, 10])
+    assert plan_upload(current, mission([1, 2, 10], [1.1, 2, 10])) == ('unchanged', None, None)
+
+
+def test_changed_range_is_written_partially():
+    current = mission([1, 2, 10], [1.1, 2, 10], [1.2, 2, 10], [1.3, 2, 10])
+    new = mission([1, 2, 10], [1.15, 2, 10], [1.2, 2, 12], [1.3, 2, 10])
+    assert plan_upload(current, new) == ('partial', 2, 3)
+
+
+@pytest.mark.parametrize("changed", [
+    {"command": "LOITER_UNLIM"},
+    {"params": [0, 0, 5, 0]},
+])
+def test_command_and_params_count_as_changes(changed):
+    current = mission([1, 2, 10], [1.1, 2, 10])
+    new = mission([1, 2, 10], dict({"lat": 1.1, "lon": 2, "alt": 10}, **changed))
+    assert plan_upload(current, new) == ('partial', 2, 2)
+
+
+def test_frame_counts_as_a_change():
+    current = mission([1, 2, 10])
+    new = [HOME_PLACEHOLDER, make_item(1, 2, 10, frame=0)]
+    assert plan_upload(current, new) == ('partial', 1, 1)
+
+
+def test_length_change_or_no_cache_writes_everything():
+    new = mission([1, 2, 10], [1.1, 2, 10])
+    assert plan_upload(None, new) == ('full', 0, 2)
+    assert plan_upload(mission([1, 2, 10]), new) == ('full', 0, 2)
@@ -0,0 +1,55 @@
+import os
+
+import numpy as np
+
+from recorder import COLUMNS, VehicleLog
+
+
+def record(log, n, **fields):
+    log.record(float(n), dict({"connected": True, "lat": 1.0 + n, "lon": 2.0}, **fields), replaced=(n == 0))
+
+
+def test_query_spans_disk_and_ring(tmp_path):
+    log = VehicleLog("v", str(tmp_path), 64)
+    for n in range(10):
+        record(log, n)
+    assert log.flush() == 10
+    for n in range(10, 15):
+        record(log, n)
+    result = log.query(3, 12, ("time", "lat"), with_rows=True)
+    assert result["time"].tolist() == [float(n) for n in range(3, 13)]
+    assert result["row"].tolist() == list(range(3, 13))
+    assert log.rows(8, 11, ("time",))["time"].tolist() == [8.0, 9.0, 10.0]
+
+
+def test_only_changed_fields_are_patched(tmp_path):
+    log = VehicleLog("v", str(tmp_path), 64)
+    record(log, 0, alt=5.0)
+    log.record(1.0, {"lat": 7.0})
+    rows = log.rows(0, None, ("lat", "lon", "alt"))
+    assert rows["lat"].tolist() == [1.0, 7.0]
+    assert rows["alt"].tolist() == [5.0, 5.0]
+
+
+def test_nothing_is_recorded_while_disconnected(tmp_path):
+    log = VehicleLog("v", str(tmp_path), 64)
+    record(log, 0)
+    log.record(1.0, {"connected": False}, replaced=True)
+    log.record(2.0, {"lat": 3.0})
+    assert log.count == 1
+
+
+def test_reopen_truncates_a_torn_flush(tmp_path):
+    log = VehicleLog("v", str(tmp_path), 64)
+    for n in range(3):
+        record(log, n)
+    log.flush()
+    # A crash mid-flush leaves one column file a row longer than the others
+    with open(os.path.join(log.path, COLUMNS[0] + ".bin"), "ab") as f:
+        f.write(np.zeros(1, dtype="<f8").tobytes())
+
+    reopened = VehicleLog("v", str(tmp_path), 64)
+    assert reopened.count == 3
+    record(reopened, 3)
+    reopened.flush()
+    assert reopened.query(None, None, ("time",))["time"].tolist() == [0.0, 1.0, 2.0, 3.0]
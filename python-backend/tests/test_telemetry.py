@@ -0,0 +1,64 @@
+import json
+
+from telemetry import TelemetrySnapshot, TelemetryStream
+
+
+def frame(stream):
+    result = stream.poll_frame()
+    return None if result is None else json.loads(result[1])
+
+
+def connected_snapshot():
+    snapshot = TelemetrySnapshot()
+    snapshot.replace({"connected": True, "lat": 1.0, "lon": 2.0, "mode": "GUIDED"})
+    return snapshot
+
+
+def test_full_frame_then_deltas():
+    snapshot = connected_snapshot()
+    stream = TelemetryStream(snapshot)
+    first = frame(stream)
+    assert first["full"] and first["data"]["lat"] == 1.0
+    assert frame(stream) is None
+
+    snapshot.update({"lat": 1.5, "mode": "GUIDED"})
+    delta = frame(stream)
+    assert delta == {"seq": first["seq"] + 1, "prev": first["seq"], "delta": {"lat": 1.5}}
+
+
+def test_unchanged_update_sends_nothing():
+    snapshot = connected_snapshot()
+    stream = TelemetryStream(snapshot)
+    frame(stream)
+    snapshot.update({"lat": 1.0})
+    assert frame(stream) is None
+
+
+def test_selected_fields_only():
+    snapshot = connected_snapshot()
+    stream = TelemetryStream(snapshot, fields=["lat"])
+    assert frame(stream)["data"] == {"connected": True, "lat": 1.0}
+    snapshot.update({"mode": "LAND"})
+    assert frame(stream) is None
+    snapshot.update({"lat": 3.0})
+    assert frame(stream)["delta"] == {"lat": 3.0}
+
+
+def test_replace_sends_a_full_frame():
+    snapshot = connected_snapshot()
+    stream = TelemetryStream(snapshot)
+    frame(stream)
+    snapshot.replace({"connected": False})
+    replaced = frame(stream)
+    # A delta could not remove lat/lon/mode
+    assert replaced["full"] and replaced["data"] == {"connected": False}
+    snapshot.update({"stale": True})
+    assert frame(stream)["delta"] == {"stale": True}
+
+
+def test_payload_is_cached_per_version():
+    snapshot = connected_snapshot()
+    version, payload = snapshot.payload()
+    assert snapshot.payload()[1] is payload
+    snapshot.update({"lat": 9.0})
+    assert snapshot.payload()[0] == version + 1
@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+from recorder import VehicleLog
+from tracks import VehicleTracks, douglas_peucker, lttb
+
+
+def test_douglas_peucker_drops_collinear_points():
+    x = np.arange(10, dtype=float)
+    assert douglas_peucker(x, 2 * x, 0.1).tolist() == [0, 9]
+
+
+def test_douglas_peucker_keeps_corners():
+    x = np.array([0, 1, 2, 3, 4], dtype=float)
+    y = np.array([0, 0, 5, 0, 0], dtype=float)
+    assert douglas_peucker(x, y, 0.5).tolist() == [0, 1, 2, 3, 4]
+    assert 2 in douglas_peucker(x, y, 4.0).tolist()
+
+
+def test_lttb_keeps_endpoints_and_one_point_per_bucket():
+    x = np.arange(102, dtype=float)
+    y = np.sin(x)
+    kept = lttb(x, y, 10)
+    assert kept[0] == 0 and kept[-1] == 101
+    assert len(kept) == 2 + 10
+    assert np.all(np.diff(kept) > 0)
+
+
+def zigzag_log(directory, samples, per_tick):
+    """A log whose samples alternate sides, ``per_tick`` of them sharing each timestamp"""
+    log = VehicleLog("v", str(directory), 1 << 16)
+    for n in range(samples):
+        log.record(1000 + (n // per_tick) * 0.016,
+                   {"connected": True, "lat": 28 + n * 1e-5, "lon": 77 + (n % 2) * 1e-4, "alt": 10},
+                   replaced=(n == 0))
+    return log
+
+
+@pytest.mark.parametrize("start, end", [(None, None), (1000.5, 1030.3), (1005.0, None)])
+def test_windows_keep_samples_sharing_a_timestamp(tmp_path, start, end):
+    log = zigzag_log(tmp_path, 10000, per_tick=4)
+    log.flush()
+    track = VehicleTracks(log).track(start, end, zoom=24)
+    columns = track["columns"]
+    # At the deepest zoom every zigzag point is a corner and survives simplification
+    assert len(columns["time"]) == track["count"]
+    assert np.all(np.diff(columns["lat"]) > 0)
+    assert sorted(columns) == ["alt", "lat", "lon", "time"]
+
+
+def test_point_budget_uses_lttb(tmp_path):
+    log = zigzag_log(tmp_path, 5000, per_tick=1)
+    track = VehicleTracks(log).track(points=500)
+    assert track["method"] == "lttb"
+    assert len(track["columns"]["time"]) <= 500
+
+
+def test_short_window_is_returned_raw(tmp_path):
+    log = zigzag_log(tmp_path, 50, per_tick=1)
+    track = VehicleTracks(log).track(points=500)
+    assert track["method"] == "raw"
+    assert len(track["columns"]["time"]) == 50
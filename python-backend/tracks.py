@@ -0,0 +1,289 @@
+"""
+Simplified flight tracks for the map: Douglas–Peucker by zoom level or LTTB by point budget, cached per tier
+"""
+import math
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+TRACK_COLUMNS = ("time", "lat", "lon", "alt")
+# Cached points also carry their sample number, since timestamps can repeat
+POINT_COLUMNS = TRACK_COLUMNS + ("row",)
+MAX_ZOOM = 24
+# Douglas–Peucker keeps every sample within this many screen pixels of the drawn line
+TOLERANCE_PX = 0.5
+DP_CHUNK = 4096
+LTTB_BUCKETS_PER_CHUNK = 256
+MAX_TIERS = 16
+MERCATOR_MAX_LAT = 85.05112878
+
+
+def mercator(lat, lon):
+    """Web Mercator pixel coordinates at zoom 0, where the world is 256 px wide.
+
+    At zoom z a screen pixel is 2**-z of these units, so a pixel tolerance
+    maps to one number whatever the latitude.
+    """
+    x = (lon + 180.0) / 360.0 * 256.0
+    phi = np.radians(np.clip(lat, -MERCATOR_MAX_LAT, MERCATOR_MAX_LAT))
+    y = (1.0 - np.log(np.tan(phi) + 1.0 / np.cos(phi)) / np.pi) / 2.0 * 256.0
+    return x, y
+
+
+def douglas_peucker(x, y, tolerance):
+    """Indices of the points Douglas–Peucker keeps, endpoints included.
+
+    Rather than recursing per segment, each pass measures every point
+    against its segment's chord at once and splits every segment whose
+    farthest point is over ``tolerance``, so the work is a few array
+    operations per level of the recursion.
+    """
+    n = len(x)
+    if n < 3:
+        return np.arange(n)
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    starts = np.array([0])
+    ends = np.array([n - 1])
+    limit = tolerance * tolerance
+    while len(starts):
+        lengths = ends - starts - 1
+        open_segments = lengths > 0
+        starts, ends, lengths = starts[open_segments], ends[open_segments], lengths[open_segments]
+        if not len(starts):
+            break
+        first = np.cumsum(lengths) - lengths
+        segment = np.repeat(np.arange(len(starts)), lengths)
+        index = np.arange(lengths.sum()) - first[segment] + starts[segment] + 1
+
+        ax, ay = x[starts][segment], y[starts][segment]
+        dx, dy = x[ends][segment] - ax, y[ends][segment] - ay
+        px, py = x[index] - ax, y[index] - ay
+        # Distance to the segment rather than its line, so doubling back is caught
+        length2 = dx * dx + dy * dy
+        t = np.clip(np.divide(px * dx + py * dy, length2, out=np.zeros_like(px), where=length2 > 0), 0, 1)
+        distance2 = (px - t * dx) ** 2 + (py - t * dy) ** 2
+
+        farthest = np.maximum.reduceat(distance2, first)
+        split = farthest > limit
+        hits = np.flatnonzero(distance2 == farthest[segment])
+        _, first_hit = np.unique(segment[hits], return_index=True)
+        pivots = index[hits[first_hit]][split]
+        keep[pivots] = True
+        starts, ends = np.concatenate([starts[split], pivots]), np.concatenate([pivots, ends[split]])
+    return np.flatnonzero(keep)
+
+
+def lttb(x, y, bucket):
+    """Indices Largest-Triangle-Three-Buckets picks with ``bucket`` points per bucket, endpoints included.
+
+    Buckets have a fixed size rather than a fixed count, so a chunk of a log
+    always splits the same way. Each bucket keeps the point making the
+    largest triangle with the point kept before it and the next bucket's
+    centroid. That area is linear in the previous point, so everything but
+    the argmax per bucket is computed up front.
+    """
+    n = len(x)
+    if bucket <= 1 or n <= 2:
+        return np.arange(n)
+    interior = n - 2
+    buckets = -(-interior // bucket)
+    index = 1 + np.arange(buckets * bucket)
+    real = index < n - 1
+    index = np.where(real, index, n - 2)
+    X = np.where(real, x[index], 0.0).reshape(buckets, bucket)
+    Y = np.where(real, y[index], 0.0).reshape(buckets, bucket)
+    sizes = real.reshape(buckets, bucket).sum(axis=1)
+    cx = np.append((X.sum(axis=1) / sizes)[1:], x[-1])[:, None]
+    cy = np.append((Y.sum(axis=1) / sizes)[1:], y[-1])[:, None]
+    # Twice the triangle area is |ax * P + ay * Q + R|; padding has P = Q = R = 0 and never wins
+    mask = real.reshape(buckets, bucket)
+    P = np.where(mask, Y - cy, 0.0)
+    Q = np.where(mask, cx - X, 0.0)
+    R = np.where(mask, X * cy - cx * Y, 0.0)
+
+    chosen = np.empty(buckets, dtype=np.int64)
+    ax, ay = x[0], y[0]
+    for b in range(buckets):
+        j = int(np.abs(ax * P[b] + ay * Q[b] + R[b]).argmax())
+        chosen[b] = j
+        ax, ay = X[b, j], Y[b, j]
+    return np.concatenate([[0], 1 + np.arange(buckets) * bucket + chosen, [n - 1]])
+
+
+def _reduce(columns, reducer):
+    """Indices into ``columns`` that ``reducer(x, y)`` keeps, skipping samples with no position"""
+    lat, lon = columns["lat"], columns["lon"]
+    valid = np.flatnonzero((lat != 0) | (lon != 0))
+    if len(valid) == 0:
+        return valid
+    x, y = mercator(lat[valid].astype(np.float64), lon[valid].astype(np.float64))
+    return valid[reducer(x, y)]
+
+
+def _take(columns, index):
+    return {name: np.asarray(values)[index] for name, values in columns.items()}
+
+
+def _empty():
+    return {name: np.zeros(0, dtype=np.int64 if name == "row" else np.float64) for name in POINT_COLUMNS}
+
+
+def _public(columns):
+    return {name: columns[name] for name in TRACK_COLUMNS}
+
+
+def _rows(log, first, last=None):
+    """``log.rows`` with a "row" array of the sample numbers"""
+    rows = log.rows(first, last, TRACK_COLUMNS)
+    rows["row"] = first + np.arange(len(rows["time"]))
+    return rows
+
+
+class TrackTier:
+    """One resolution of a vehicle's track, simplified a whole chunk at a time.
+
+    Samples are split into fixed chunks by sample number. A chunk is
+    simplified once it is full and its points are kept; rows after the last
+    full chunk are simplified on every request. Chunks are independent
+    (both endpoints kept), so the error bound holds across their joins and
+    new telemetry only ever adds chunks.
+    """
+
+    def __init__(self, reducer, chunk):
+        self.reducer = reducer
+        self.chunk = chunk
+        self.next = 0
+        self.points = _empty()
+        self._lock = threading.Lock()
+
+    def update(self, log):
+        """Simplify any chunks that have filled since the last call; returns the rows still open"""
+        with self._lock:
+            full = (log.count // self.chunk) * self.chunk
+            if full > self.next:
+                rows = _rows(log, self.next, full)
+                parts = [self.points]
+                for offset in range(0, full - self.next, self.chunk):
+                    chunk = {name: values[offset:offset + self.chunk] for name, values in rows.items()}
+                    parts.append(_take(chunk, _reduce(chunk, self.reducer)))
+                self.points = {name: np.concatenate([part[name] for part in parts]) for name in POINT_COLUMNS}
+                self.next = full
+            points, next_row = self.points, self.next
+        tail = _rows(log, next_row)
+        return points, _take(tail, _reduce(tail, self.reducer))
+
+    def size(self):
+        return len(self.points["time"])
+
+
+class VehicleTracks:
+    """The cached tiers of one vehicle's flight log, least recently used evicted past MAX_TIERS"""
+
+    def __init__(self, log):
+        self.log = log
+        self._tiers = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _tier(self, key, reducer, chunk):
+        with self._lock:
+            tier = self._tiers.get(key)
+            if tier is None:
+                tier = self._tiers[key] = TrackTier(reducer, chunk)
+                while len(self._tiers) > MAX_TIERS:
+                    self._tiers.popitem(last=False)
+            self._tiers.move_to_end(key)
+            return tier
+
+    def track(self, start=None, end=None, zoom=None, points=None):
+        window = self.log.query(start, end, TRACK_COLUMNS, with_rows=True)
+        count = len(window["time"])
+        result = {"count": count}
+        if zoom is not None:
+            zoom = min(max(int(math.ceil(zoom)), 0), MAX_ZOOM)
+            tolerance = TOLERANCE_PX / 2 ** zoom
+            reducer = lambda x, y: douglas_peucker(x, y, tolerance)
+            tier = self._tier(('dp', zoom), reducer, DP_CHUNK)
+            result.update(method="douglas-peucker", zoom=zoom, tolerance_px=TOLERANCE_PX)
+        else:
+            if count <= points:
+                reduced = _take(window, _reduce(window, lambda x, y: np.arange(len(x))))
+                return dict(result, method="raw", columns=_public(reduced))
+            # Endpoints come on top of one point per bucket
+            bucket = 2 ** int(math.ceil(math.log2(count / max(points - 2, 1))))
+            reducer = lambda x, y: lttb(x, y, bucket)
+            tier = self._tier(('lttb', bucket), reducer, bucket * LTTB_BUCKETS_PER_CHUNK)
+            result.update(method="lttb", bucket=bucket)
+
+        cached, open_rows = tier.update(self.log)
+        core = {name: np.concatenate([cached[name], open_rows[name]]) for name in POINT_COLUMNS}
+        # The window is a contiguous run of samples, so the cached points inside it are picked by row
+        first, last = (window["row"][0], window["row"][-1]) if count else (0, -1)
+        lo = np.searchsorted(core["row"], first, side="left")
+        hi = np.searchsorted(core["row"], last, side="right")
+        core = {name: values[lo:hi] for name, values in core.items()}
+        result["columns"] = _public(self._with_edges(window, core, reducer))
+        return result
+
+    @staticmethod
+    def _with_edges(window, core, reducer):
+        """Join the window's own first and last samples to the cached points inside it.
+
+        The stretches between a window edge and the nearest cached point are
+        re-simplified from the raw samples, since the cached segment that
+        covered them started or ended outside the window.
+        """
+        rows = window["row"]
+        if not len(rows):
+            return _empty()
+        if not len(core["row"]):
+            return _take(window, _reduce(window, reducer))
+        head_end = np.searchsorted(rows, core["row"][0], side="right")
+        tail_start = np.searchsorted(rows, core["row"][-1], side="left")
+        head = {name: values[:head_end] for name, values in window.items()}
+        tail = {name: values[tail_start:] for name, values in window.items()}
+        parts = [_take(head, _reduce(head, reducer)), core, _take(tail, _reduce(tail, reducer))]
+        joined = {name: np.concatenate([part[name] for part in parts]) for name in POINT_COLUMNS}
+        # Edge stretches share their inner endpoint with the core; drop the repeats by sample
+        # number, since samples on a coarse clock can share a timestamp
+        r = joined["row"]
+        unique = np.concatenate([[True], r[1:] > r[:-1]])
+        return {name: values[unique] for name, values in joined.items()}
+
+    def stats(self):
+        with self._lock:
+            tiers = list(self._tiers.items())
+        return {f"{kind}-{value}": {"points": tier.size(), "finalized_samples": tier.next}
+                for (kind, value), tier in tiers}
+
+
+class TrackService:
+    """Simplified tracks for every vehicle the flight recorder logs"""
+
+    def __init__(self, recorder):
+        self.recorder = recorder
+        self._vehicles = {}
+        self._lock = threading.Lock()
+
+    def _vehicle(self, vehicle_id):
+        log = self.recorder.log(vehicle_id)
+        if log is None:
+            return None
+        with self._lock:
+            tracks = self._vehicles.get(vehicle_id)
+            if tracks is None or tracks.log is not log:
+                tracks = self._vehicles[vehicle_id] = VehicleTracks(log)
+            return tracks
+
+    def track(self, vehicle_id, start=None, end=None, zoom=None, points=None):
+        """{"count", "method", "columns": {time, lat, lon, alt}, ...} or None without a flight log"""
+        tracks = self._vehicle(vehicle_id)
+        if tracks is None:
+            return None
+        return tracks.track(start, end, zoom, points)
+
+    def stats(self):
+        with self._lock:
+            vehicles = list(self._vehicles.items())
+        return {vehicle_id: tracks.stats() for vehicle_id, tracks in vehicles}
@@ -0,0 +1,159 @@
+"""
+In-process stand-in for dronekit.Vehicle, shared by the replay and simulator sources
+"""
+import time
+
+from dronekit import (Attitude, Battery, GPSInfo, LocationGlobal,
+                      LocationGlobalRelative, VehicleMode)
+from pymavlink import mavutil
+
+
+class VirtualLocations:
+    def __init__(self):
+        self.global_frame = LocationGlobal(0, 0, 0)
+        self.global_relative_frame = LocationGlobalRelative(0, 0, 0)
+
+
+class VirtualVehicle:
+    """The subset of the dronekit Vehicle interface the backend relies on.
+
+    State lives in plain dronekit value objects and listeners are notified
+    with the same attribute and message names dronekit uses, so the
+    telemetry snapshot, job tracker and recorder work unchanged. Commands
+    (``mode``, ``armed``, ``simple_goto``...) go to the ``_command_*`` hooks,
+    which subclasses override; the default ignores them.
+    """
+
+    def __init__(self):
+        self._attribute_listeners = {}
+        self._message_listeners = {}
+        self.closed = False
+        self.reset_state()
+
+    def reset_state(self):
+        self._armed = False
+        self._mode = VehicleMode('STABILIZE')
+        self._last_heartbeat = time.monotonic()
+        self.location = VirtualLocations()
+        self.attitude = Attitude(0, 0, 0)
+        self.groundspeed = 0
+        self.airspeed = 0
+        self.heading = 0
+        self.battery = Battery(0, -1, -1)
+        self.gps_0 = GPSInfo(None, None, 0, 0)
+
+    # ----- listeners -----
+    def add_attribute_listener(self, attr_name, observer):
+        self._attribute_listeners.setdefault(attr_name, []).append(observer)
+
+    def remove_attribute_listener(self, attr_name, observer):
+        listeners = self._attribute_listeners.get(attr_name, [])
+        if observer in listeners:
+            listeners.remove(observer)
+
+    def notify_attribute_listeners(self, attr_name, value):
+        for fn in list(self._attribute_listeners.get(attr_name, ())):
+            fn(self, attr_name, value)
+        for fn in list(self._attribute_listeners.get('*', ())):
+            fn(self, attr_name, value)
+
+    def add_message_listener(self, name, fn):
+        self._message_listeners.setdefault(name, []).append(fn)
+
+    def remove_message_listener(self, name, fn):
+        listeners = self._message_listeners.get(name, [])
+        if fn in listeners:
+            listeners.remove(fn)
+
+    def notify_message_listeners(self, name, msg):
+        for fn in list(self._message_listeners.get(name, ())):
+            fn(self, name, msg)
+        for fn in list(self._message_listeners.get('*', ())):
+            fn(self, name, msg)
+
+    # ----- state -----
+    @property
+    def armed(self):
+        return self._armed
+
+    @armed.setter
+    def armed(self, value):
+        self._command_armed(bool(value))
+
+    @property
+    def mode(self):
+        return self._mode
+
+    @mode.setter
+    def mode(self, value):
+        self._command_mode(value.name if isinstance(value, VehicleMode) else str(value))
+
+    @property
+    def is_armable(self):
+        return self._mode.name != 'INITIALISING' and (self.gps_0.fix_type or 0) > 1
+
+    @property
+    def last_heartbeat(self):
+        return time.monotonic() - self._last_heartbeat
+
+    def set_armed(self, armed):
+        if armed != self._armed:
+            self._armed = armed
+            self.notify_attribute_listeners('armed', armed)
+
+    def set_mode(self, name):
+        if name != self._mode.name:
+            self._mode = VehicleMode(name)
+            self.notify_attribute_listeners('mode', self._mode)
+
+    def set_position(self, lat, lon, alt, relative_alt):
+        self.location.global_frame = LocationGlobal(lat, lon, alt)
+        self.location.global_relative_frame = LocationGlobalRelative(lat, lon, relative_alt)
+        self.notify_attribute_listeners('location.global_frame', self.location.global_frame)
+        self.notify_attribute_listeners('location.global_relative_frame', self.location.global_relative_frame)
+        self.notify_attribute_listeners('location', self.location)
+
+    def handle_message(self, msg):
+        """Apply a MAVLink message the way dronekit's handlers do"""
+        name = msg.get_type()
+        if name == 'GLOBAL_POSITION_INT':
+            self.set_position(msg.lat / 1.0e7, msg.lon / 1.0e7, msg.alt / 1000.0, msg.relative_alt / 1000.0)
+        elif name == 'ATTITUDE':
+            self.attitude = Attitude(msg.pitch, msg.yaw, msg.roll)
+            self.notify_attribute_listeners('attitude', self.attitude)
+        elif name == 'VFR_HUD':
+            self.heading = msg.heading
+            self.airspeed = msg.airspeed
+            self.groundspeed = msg.groundspeed
+            self.notify_attribute_listeners('heading', self.heading)
+            self.notify_attribute_listeners('airspeed', self.airspeed)
+            self.notify_attribute_listeners('groundspeed', self.groundspeed)
+        elif name == 'SYS_STATUS':
+            self.battery = Battery(msg.voltage_battery, msg.current_battery, msg.battery_remaining)
+            self.notify_attribute_listeners('battery', self.battery)
+        elif name == 'GPS_RAW_INT':
+            self.gps_0 = GPSInfo(msg.eph, msg.epv, msg.fix_type, msg.satellites_visible)
+            self.notify_attribute_listeners('gps_0', self.gps_0)
+        elif name == 'HEARTBEAT':
+            if msg.type == mavutil.mavlink.MAV_TYPE_GCS:
+                return
+            self._last_heartbeat = time.monotonic()
+            self.set_armed(bool(msg.base_mode & mavutil.mavlink.MAV_MODE_FLAG_SAFETY_ARMED))
+            self.set_mode(mavutil.mode_string_v10(msg))
+        self.notify_message_listeners(name, msg)
+
+    # ----- commands -----
+    def _command_armed(self, armed):
+        pass
+
+    def _command_mode(self, name):
+        pass
+
+    def simple_takeoff(self, alt):
+        pass
+
+    def simple_goto(self, location, airspeed=None, groundspeed=None):
+        pass
+
+    def close(self):
+        self.closed = True
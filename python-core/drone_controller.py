@@ -2,110 +2,146 @@
 """
 UTMS Drone Controller with USB Port Scanning (Mission Planner style)
 """
+import os
 import sys
 import json
+import threading
 import time
-from serial.tools import list_ports
 
-# Try to import dronekit
-try:
-    from dronekit import connect, VehicleMode, LocationGlobalRelative, Command
-    from pymavlink import mavutil
-    DRONEKIT_AVAILABLE = True
-except ImportError:
-    DRONEKIT_AVAILABLE = False
+from port_inventory import PortInventory
+from port_probe import BAUD_RATES, probe_ports
+
+# dronekit/pymavlink are imported on first use so scan_ports and the daemon start fast
+DRONEKIT_AVAILABLE = None
+# The mission protocol client is shared with the persistent backend
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'python-backend')
+# Longest a mission upload is waited for; the client gives up on a silent vehicle well before
+MISSION_TIMEOUT = 120
+
+def dronekit_available():
+    """Import dronekit on first call; False means MOCK MODE"""
+    global DRONEKIT_AVAILABLE, connect, VehicleMode, LocationGlobalRelative, Command, mavutil, mission_protocol
+    if DRONEKIT_AVAILABLE is None:
+        try:
+            from dronekit import connect, VehicleMode, LocationGlobalRelative, Command
+            from pymavlink import mavutil
+            if BACKEND_DIR not in sys.path:
+                sys.path.append(BACKEND_DIR)
+            import mission as mission_protocol
+            DRONEKIT_AVAILABLE = True
+        except ImportError:
+            DRONEKIT_AVAILABLE = False
+    return DRONEKIT_AVAILABLE
+
+DEFAULT_VEHICLE_ID = 'default'
 
 class DroneController:
-    def __init__(self):
+    def __init__(self, vehicle_id=DEFAULT_VEHICLE_ID, inventory=None):
+        self.vehicle_id = vehicle_id
         self.vehicle = None
         self.connected = False
         self.current_port = None
+        self.lock = threading.Lock()
+        self.inventory = inventory if inventory is not None else PortInventory()
+        self.port_cache = self.inventory.cache
+        # Created on the first upload; caches the vehicle's mission for as long as the link lasts
+        self.mission = None
+        self._mission_vehicle = None
         
     # ===== PORT SCANNING (Like Mission Planner) =====
     def scan_ports(self):
-        """Scan all available COM ports and identify drone ports"""
+        """List COM ports from the port inventory, tagging known autopilots and radios"""
         try:
-            ports = list_ports.comports()
-            port_list = []
-            
-            for port in ports:
-                port_info = {
-                    "port": port.device,
-                    "description": port.description,
-                    "manufacturer": port.manufacturer,
-                    "vid": port.vid,
-                    "pid": port.pid
-                }
-                port_list.append(port_info)
-                print(f"Found: {port.device} - {port.description}", file=sys.stderr)
-            
-            if len(port_list) == 0:
-                return {"success": False, "message": "No COM ports found", "ports": []}
+            snapshot = self.inventory.snapshot()
+            ports = snapshot["ports"]
+            if len(ports) == 0:
+                return {"success": False, "message": "No COM ports found", "ports": [],
+                        "version": snapshot["version"]}
             
-            return {"success": True, "ports": port_list, "count": len(port_list)}
+            return {"success": True, "ports": ports, "count": len(ports), "version": snapshot["version"]}
         except Exception as e:
             return {"success": False, "message": str(e), "ports": []}
     
+    def port_events(self, since=0):
+        """Ports added, removed or probed since inventory version ``since``"""
+        events = self.inventory.events(since)
+        return {"success": True, "version": self.inventory.version, "events": events}
+    
     def auto_connect(self):
         """Auto-detect and connect to drone (like Mission Planner 'Auto' button)"""
         try:
-            # Get all ports
-            ports = list_ports.comports()
+            ports = self.inventory.ports()
             
             if len(ports) == 0:
                 return {"success": False, "message": "No COM ports found"}
             
-            # Try each port with standard drone baud rates
-            baud_rates = [57600,115200, 9600]
+            if not dronekit_available():
+                # Mock mode
+                port = ports[0]
+                self.vehicle = None
+                self.connected = True
+                self.current_port = port.device
+                return {
+                    "success": True, 
+                    "message": f"Connected to {port.device} (MOCK MODE)",
+                    "port": port.device,
+                    "baud": BAUD_RATES[0]
+                }
             
-            for port in ports:
-                for baud in baud_rates:
-                    try:
-                        print(f"Trying {port.device} at {baud} baud...", file=sys.stderr)
-                        
-                        if not DRONEKIT_AVAILABLE:
-                            # Mock mode
-                            self.vehicle = None
-                            self.connected = True
-                            self.current_port = port.device
-                            return {
-                                "success": True, 
-                                "message": f"Connected to {port.device} (MOCK MODE)",
-                                "port": port.device,
-                                "baud": baud
-                            }
-                        
-                        # Real DroneKit connection
-                        vehicle = connect(
-                            port.device,
-                            wait_ready=False,
-                            baud=baud,
-                            timeout=10
-                        )
-                        vehicle.wait_ready(True, raise_exception=False, timeout=5)
-                        
-                        self.vehicle = vehicle
-                        self.connected = True
-                        self.current_port = port.device
-                        
-                        return {
-                            "success": True,
-                            "message": f"Auto-connected to {port.device}",
-                            "port": port.device,
-                            "baud": baud,
-                            "vehicle_type": str(self.vehicle.vehicle_type) if self.vehicle else "Unknown"
-                        }
-                    except Exception as e:
-                        continue
+            # A port the inventory already heard a HEARTBEAT on needs no probe;
+            # otherwise sniff every port in parallel, then connect only to the winner
+            detected = self.inventory.detected()
+            found = detected or probe_ports(ports, self.port_cache)
+            if found is None:
+                return {"success": False, "message": "Could not connect to any port"}
+            port, baud, heartbeat = found
             
-            return {"success": False, "message": "Could not connect to any port"}
+            try:
+                vehicle = self._open_autopilot(port, baud)
+            except Exception:
+                if not detected:
+                    raise
+                # The earlier detection is stale (unplugged, re-enumerated or busy): forget it and probe afresh
+                self.inventory.forget(port.device)
+                self.inventory.refresh()
+                found = probe_ports(self.inventory.ports(), self.port_cache)
+                if found is None:
+                    return {"success": False, "message": "Could not connect to any port"}
+                port, baud, heartbeat = found
+                vehicle = self._open_autopilot(port, baud)
+            
+            self.vehicle = vehicle
+            self.connected = True
+            self.current_port = port.device
+            
+            return {
+                "success": True,
+                "message": f"Auto-connected to {port.device}",
+                "port": port.device,
+                "baud": baud,
+                "system_id": heartbeat["system_id"],
+                "vehicle_type": str(self.vehicle.vehicle_type) if self.vehicle else "Unknown"
+            }
         except Exception as e:
             return {"success": False, "message": str(e)}
     
+    @staticmethod
+    def _open_autopilot(port, baud):
+        vehicle = connect(
+            port.device,
+            wait_ready=False,
+            baud=baud,
+            timeout=10
+        )
+        vehicle.wait_ready(True, raise_exception=False, timeout=5)
+        return vehicle
+    
     def connect_vehicle(self, connection_string, baud=57600):
         """Connect to vehicle via specific serial port"""
         try:
-            if not DRONEKIT_AVAILABLE:
+            # The port may have just been plugged in and still be sniffed in the background
+            self.inventory.release(connection_string)
+            if not dronekit_available():
                 self.connected = True
                 self.current_port = connection_string
                 return {
@@ -136,6 +172,9 @@ class DroneController:
     
     def disconnect_vehicle(self):
         """Disconnect from vehicle"""
+        if self.mission is not None:
+            self.mission.detach()
+            self._mission_vehicle = None
         if self.vehicle:
             try:
                 self.vehicle.close()
@@ -165,7 +204,8 @@ class DroneController:
                 "roll": 0,
                 "pitch": 0,
                 "yaw": 0,
-                "port": self.current_port
+                "port": self.current_port,
+                "vehicle_id": self.vehicle_id
             }
         
         try:
@@ -189,34 +229,48 @@ class DroneController:
                 "roll": attitude.roll if attitude else 0,
                 "pitch": attitude.pitch if attitude else 0,
                 "yaw": attitude.yaw if attitude else 0,
-                "port": self.current_port
+                "port": self.current_port,
+                "vehicle_id": self.vehicle_id
             }
         except Exception as e:
             return {"connected": False, "error": str(e)}
     
+    def _wait_for(self, attr_name, condition, timeout):
+        """Wait until condition() holds, re-checking on each change of attr_name; False on timeout"""
+        changed = threading.Event()
+        def listener(vehicle, name, value):
+            changed.set()
+        self.vehicle.add_attribute_listener(attr_name, listener)
+        try:
+            deadline = time.monotonic() + timeout
+            while not condition():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not changed.wait(remaining):
+                    return condition()
+                changed.clear()
+            return True
+        finally:
+            self.vehicle.remove_attribute_listener(attr_name, listener)
+    
     def arm_vehicle(self):
         """Arm the vehicle"""
-        if not DRONEKIT_AVAILABLE:
+        if not dronekit_available():
             return {"success": True, "message": "Armed (MOCK MODE)"}
         
         if not self.vehicle:
             return {"success": False, "message": "Not connected"}
         try:
-            timeout = 30
-            start = time.time()
-            while not self.vehicle.is_armable and (time.time() - start) < timeout:
-                time.sleep(2)
-            
-            if not self.vehicle.is_armable:
+            # is_armable depends on several attributes, so watch all of them
+            if not self._wait_for('*', lambda: self.vehicle.is_armable, 30):
                 return {"success": False, "message": "Vehicle not armable"}
             
             self.vehicle.mode = VehicleMode("GUIDED")
-            while self.vehicle.mode.name != 'GUIDED':
-                time.sleep(0.5)
+            if not self._wait_for('mode', lambda: self.vehicle.mode.name == 'GUIDED', 5):
+                return {"success": False, "message": "Timed out changing mode to GUIDED"}
             
             self.vehicle.armed = True
-            while not self.vehicle.armed:
-                time.sleep(0.5)
+            if not self._wait_for('armed', lambda: self.vehicle.armed, 10):
+                return {"success": False, "message": "Timed out waiting for arm"}
             
             return {"success": True, "message": "Armed"}
         except Exception as e:
@@ -224,22 +278,22 @@ class DroneController:
     
     def disarm_vehicle(self):
         """Disarm the vehicle"""
-        if not DRONEKIT_AVAILABLE:
+        if not dronekit_available():
             return {"success": True, "message": "Disarmed (MOCK MODE)"}
         
         if not self.vehicle:
             return {"success": False, "message": "Not connected"}
         try:
             self.vehicle.armed = False
-            while self.vehicle.armed:
-                time.sleep(0.5)
+            if not self._wait_for('armed', lambda: not self.vehicle.armed, 10):
+                return {"success": False, "message": "Timed out waiting for disarm"}
             return {"success": True, "message": "Disarmed"}
         except Exception as e:
             return {"success": False, "message": str(e)}
     
     def change_mode(self, mode_name):
         """Change flight mode"""
-        if not DRONEKIT_AVAILABLE:
+        if not dronekit_available():
             return {"success": True, "message": f"Mode changed to {mode_name} (MOCK MODE)"}
         
         if not self.vehicle:
@@ -252,7 +306,7 @@ class DroneController:
     
     def takeoff(self, altitude):
         """Takeoff to specified altitude"""
-        if not DRONEKIT_AVAILABLE:
+        if not dronekit_available():
             return {"success": True, "message": f"Taking off to {altitude}m (MOCK MODE)"}
         
         if not self.vehicle or not self.vehicle.armed:
@@ -265,7 +319,7 @@ class DroneController:
     
     def land(self):
         """Land the vehicle"""
-        if not DRONEKIT_AVAILABLE:
+        if not dronekit_available():
             return {"success": True, "message": "Landing (MOCK MODE)"}
         
         if not self.vehicle:
@@ -278,7 +332,7 @@ class DroneController:
     
     def goto_position(self, lat, lon, alt):
         """Go to GPS position"""
-        if not DRONEKIT_AVAILABLE:
+        if not dronekit_available():
             return {"success": True, "message": f"Going to {lat}, {lon} @ {alt}m (MOCK MODE)"}
         
         if not self.vehicle:
@@ -290,60 +344,186 @@ class DroneController:
         except Exception as e:
             return {"success": False, "message": str(e)}
 
+    def upload_mission(self, waypoints):
+        """Upload a waypoint list ([lat, lon, alt] or {"lat", "lon", "alt", "command", "params"}).
+
+        Uses the backend's MissionClient, so only the items that differ from
+        the mission on the vehicle (command, frame, params or position) are
+        written, with MISSION_WRITE_PARTIAL_LIST when the length is unchanged.
+        """
+        if not dronekit_available():
+            return {"success": True, "message": f"Uploaded {len(waypoints)} waypoints (MOCK MODE)"}
+        
+        if not self.vehicle:
+            return {"success": False, "message": "Not connected"}
+        try:
+            items = mission_protocol.parse_waypoints(waypoints)
+            if self.mission is None:
+                self.mission = mission_protocol.MissionClient()
+            if self._mission_vehicle is not self.vehicle:
+                self.mission.attach(self.vehicle)
+                self._mission_vehicle = self.vehicle
+            client = self.mission
+            transfer = client.upload(items)
+            finished = lambda: (client.result["transfer"] != transfer
+                                or client.result["state"] != mission_protocol.RUNNING)
+            if not self._wait_for('mission', finished, MISSION_TIMEOUT):
+                return {"success": False, "message": "Timed out uploading mission"}
+            result = dict(client.result)
+            return {"success": result["state"] == mission_protocol.SUCCEEDED, "message": result["message"],
+                    "mode": result.get("mode", "unchanged"), "written": result.get("written", 0)}
+        except Exception as e:
+            return {"success": False, "message": str(e)}
+
+class DroneFleet:
+    """DroneController instances keyed by vehicle ID, one connection and lock each"""
+    def __init__(self, inventory=None):
+        self._lock = threading.Lock()
+        self._controllers = {}
+        self.inventory = inventory
+
+    def get(self, vehicle_id=DEFAULT_VEHICLE_ID):
+        """Return the controller for a vehicle, creating it on first use"""
+        with self._lock:
+            controller = self._controllers.get(vehicle_id)
+            if controller is None:
+                controller = DroneController(vehicle_id, self.inventory)
+                self._controllers[vehicle_id] = controller
+            return controller
+
+    def remove(self, vehicle_id):
+        with self._lock:
+            return self._controllers.pop(vehicle_id, None)
+
+    def vehicle_ids(self):
+        with self._lock:
+            return list(self._controllers)
+
+    def ports_in_use(self):
+        with self._lock:
+            return {c.current_port for c in self._controllers.values() if c.connected and c.current_port}
+
+# Command table shared by the one-shot CLI and the daemon
+COMMANDS = {
+    "scan_ports": lambda c, a: c.scan_ports(),
+    "port_events": lambda c, a: c.port_events(int(a.get("since", 0))),
+    "auto_connect": lambda c, a: c.auto_connect(),
+    "connect": lambda c, a: c.connect_vehicle(a.get("port", "COM3"), int(a.get("baud", 57600))),
+    "disconnect": lambda c, a: c.disconnect_vehicle(),
+    "telemetry": lambda c, a: c.get_telemetry(),
+    "arm": lambda c, a: c.arm_vehicle(),
+    "disarm": lambda c, a: c.disarm_vehicle(),
+    "mode": lambda c, a: c.change_mode(a.get("mode", "GUIDED")),
+    "takeoff": lambda c, a: c.takeoff(float(a.get("altitude", 10))),
+    "land": lambda c, a: c.land(),
+    "goto": lambda c, a: c.goto_position(float(a["lat"]), float(a["lon"]), float(a["alt"])),
+    "mission": lambda c, a: c.upload_mission(
+        json.loads(a["waypoints"]) if isinstance(a["waypoints"], str) else a["waypoints"]),
+}
+
+# Commands that don't touch the connection and may run beside others
+UNLOCKED_COMMANDS = {"scan_ports", "port_events", "telemetry"}
+
+def run_command(controller, command, args):
+    """Execute one command against a controller and return its result dict"""
+    handler = COMMANDS.get(command)
+    if handler is None:
+        return {
+            "error": f"Unknown command: {command}",
+            "available_commands": [
+                "scan_ports",      # NEW: Scan USB ports
+                "port_events",     # Ports plugged in or removed since a version
+                "auto_connect",    # NEW: Auto-detect and connect
+                "connect",         # Manual connect with port
+                "disconnect",
+                "telemetry",
+                "arm",
+                "disarm",
+                "mode",
+                "takeoff",
+                "land",
+                "goto",
+                "mission"
+            ]
+        }
+    if command in UNLOCKED_COMMANDS:
+        return handler(controller, args)
+    with controller.lock:
+        return handler(controller, args)
+
+def cli_args(command, argv):
+    """Map positional CLI arguments onto the named arguments used by COMMANDS"""
+    names = {
+        "connect": ["port", "baud"],
+        "port_events": ["since"],
+        "mode": ["mode"],
+        "takeoff": ["altitude"],
+        "goto": ["lat", "lon", "alt"],
+        "mission": ["waypoints"],
+    }.get(command, [])
+    return dict(zip(names, argv))
+
+def serve(infile=sys.stdin, outfile=sys.stdout, max_workers=8):
+    """Daemon mode: newline-delimited JSON requests in, JSON responses out.
+
+    Request:  {"id": 1, "command": "connect", "args": {"port": "COM6"}, "vehicle_id": "default"}
+    Response: {"id": 1, "result": {...}} or {"id": 1, "error": "..."}
+
+    Requests are pipelined: each runs on a worker thread and responses are
+    written as soon as they finish, so they may arrive out of order. Commands
+    for one vehicle are serialized by that controller's lock.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    # One inventory for every vehicle: ports are enumerated once, then watched,
+    # and drones plugged in while the daemon runs are probed in the background
+    inventory = PortInventory(auto_probe=True)
+    fleet = DroneFleet(inventory)
+    inventory.busy = fleet.ports_in_use
+    inventory.start()
+    write_lock = threading.Lock()
+
+    def respond(response):
+        line = json.dumps(response)
+        with write_lock:
+            outfile.write(line + "\n")
+            outfile.flush()
+
+    def handle(request):
+        request_id = request.get("id")
+        try:
+            controller = fleet.get(request.get("vehicle_id", DEFAULT_VEHICLE_ID))
+            result = run_command(controller, request.get("command"), request.get("args") or {})
+            respond({"id": request_id, "result": result})
+        except Exception as e:
+            respond({"id": request_id, "error": str(e)})
+
+    print("drone_controller daemon ready", file=sys.stderr)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for line in infile:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                request = json.loads(line)
+            except ValueError as e:
+                respond({"id": None, "error": f"Invalid JSON: {e}"})
+                continue
+            pool.submit(handle, request)
+
 # Main execution
 if __name__ == '__main__':
-    controller = DroneController()
-    
     command = sys.argv[1] if len(sys.argv) > 1 else 'telemetry'
+
+    if command == 'daemon':
+        serve()
+        sys.exit(0)
+
+    controller = DroneController()
     result = {}
     
     try:
-        if command == 'scan_ports':
-            result = controller.scan_ports()
-        elif command == 'auto_connect':
-            result = controller.auto_connect()
-        elif command == 'connect':
-            port = sys.argv[2] if len(sys.argv) > 2 else 'COM3'
-            baud = int(sys.argv[3]) if len(sys.argv) > 3 else 57600
-            result = controller.connect_vehicle(port, baud)
-        elif command == 'disconnect':
-            result = controller.disconnect_vehicle()
-        elif command == 'telemetry':
-            result = controller.get_telemetry()
-        elif command == 'arm':
-            result = controller.arm_vehicle()
-        elif command == 'disarm':
-            result = controller.disarm_vehicle()
-        elif command == 'mode':
-            mode = sys.argv[2] if len(sys.argv) > 2 else 'GUIDED'
-            result = controller.change_mode(mode)
-        elif command == 'takeoff':
-            alt = float(sys.argv[2]) if len(sys.argv) > 2 else 10
-            result = controller.takeoff(alt)
-        elif command == 'land':
-            result = controller.land()
-        elif command == 'goto':
-            lat = float(sys.argv[2])
-            lon = float(sys.argv[3])
-            alt = float(sys.argv[4])
-            result = controller.goto_position(lat, lon, alt)
-        else:
-            result = {
-                "error": f"Unknown command: {command}",
-                "available_commands": [
-                    "scan_ports",      # NEW: Scan USB ports
-                    "auto_connect",    # NEW: Auto-detect and connect
-                    "connect",         # Manual connect with port
-                    "disconnect",
-                    "telemetry",
-                    "arm",
-                    "disarm",
-                    "mode",
-                    "takeoff",
-                    "land",
-                    "goto"
-                ]
-            }
+        result = run_command(controller, command, cli_args(command, sys.argv[2:]))
     except Exception as e:
         result = {"error": str(e)}
     
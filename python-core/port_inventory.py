@@ -0,0 +1,239 @@
+"""
+Serial port inventory: enumerated once, kept current by watching for hotplug, known autopilots tagged
+"""
+import sys
+import threading
+import time
+from collections import deque
+
+from serial.tools import list_ports
+
+from port_probe import BAUD_RATES, LISTEN_TIMEOUT, PortCache, probe_ports, usb_key
+
+# A plug or unplug is noticed within this many seconds
+POLL_INTERVAL = 1.0
+MAX_EVENTS = 256
+# Longest a single-port probe can take: every baud rate heard out in turn
+PROBE_SECONDS = len(BAUD_RATES) * LISTEN_TIMEOUT
+
+# (USB VID, PID) -> (kind, label); a PID of None matches any product from that vendor
+KNOWN_DEVICES = {
+    (0x2DAE, None): ("autopilot", "CubePilot"),
+    (0x26AC, None): ("autopilot", "3DR / PX4 FMU"),
+    (0x3162, None): ("autopilot", "Holybro"),
+    (0x1209, 0x5740): ("autopilot", "ArduPilot ChibiOS"),
+    (0x1209, 0x5741): ("autopilot", "ArduPilot ChibiOS bootloader"),
+    (0x0483, 0x5740): ("autopilot", "STM32 virtual COM port"),
+    (0x0403, 0x6001): ("radio", "FTDI serial (telemetry radio)"),
+    (0x0403, 0x6015): ("radio", "FTDI serial (telemetry radio)"),
+    (0x10C4, 0xEA60): ("radio", "CP210x serial (telemetry radio)"),
+}
+
+
+def identify(port):
+    """(kind, label) for a known autopilot or telemetry radio, else (None, None)"""
+    if port.vid is None:
+        return None, None
+    return KNOWN_DEVICES.get((port.vid, port.pid)) or KNOWN_DEVICES.get((port.vid, None)) or (None, None)
+
+
+def describe(port):
+    kind, label = identify(port)
+    return {
+        "port": port.device,
+        "description": port.description,
+        "manufacturer": port.manufacturer,
+        "vid": port.vid,
+        "pid": port.pid,
+        "serial_number": port.serial_number,
+        "kind": kind,
+        "label": label,
+        "autopilot": kind == "autopilot",
+        "probe_state": None
+    }
+
+
+def same_device(a, b):
+    """Whether two enumerations of one device name are the same attached hardware"""
+    return usb_key(a) == usb_key(b) and a.serial_number == b.serial_number
+
+
+class PortInventory:
+    """The attached serial ports, enumerated once and then watched for hotplug.
+
+    ``start`` runs a background thread that re-enumerates every ``interval``
+    seconds and applies only the difference, so readers get the last list
+    without touching the OS. Polling rather than udev keeps one code path for
+    Linux /dev/tty* and Windows COM ports. Each change bumps ``version`` and is
+    recorded as an event. With ``auto_probe``, every newly attached port that
+    ``busy()`` does not claim is sniffed for a HEARTBEAT in the background and
+    its entry updated with the baud and system ID found.
+    """
+
+    def __init__(self, cache=None, interval=POLL_INTERVAL, auto_probe=False, busy=None):
+        self.cache = cache if cache is not None else PortCache()
+        self.interval = interval
+        self.auto_probe = auto_probe
+        self.busy = busy
+        self.version = 0
+        self._ports = {}
+        self._entries = {}
+        self._snapshot = None
+        self._events = deque(maxlen=MAX_EVENTS)
+        # device -> Event that cancels its background probe
+        self._probing = {}
+        self._lock = threading.Lock()
+        self._probed = threading.Condition(self._lock)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Enumerate now and keep watching from a daemon thread"""
+        if self._thread is None:
+            self.refresh()
+            self._thread = threading.Thread(target=self._watch, name='port-inventory', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _watch(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"⚠️ Port enumeration failed: {e}", file=sys.stderr)
+
+    # ----- reads -----
+    def snapshot(self):
+        """{"ports", "version", "updated_at"}, shared and not to be modified; enumerates only on first use"""
+        snapshot = self._snapshot
+        if snapshot is None:
+            self.refresh()
+            snapshot = self._snapshot
+        return snapshot
+
+    def ports(self):
+        """The attached ports as serial.tools ListPortInfo objects"""
+        self.snapshot()
+        with self._lock:
+            return list(self._ports.values())
+
+    def events(self, since=0):
+        """Events after version ``since``, oldest first"""
+        with self._lock:
+            return [event for event in self._events if event["version"] > since]
+
+    def detected(self, timeout=PROBE_SECONDS):
+        """(port, baud, heartbeat) for a free port whose probe heard an autopilot, or None.
+
+        Waits up to ``timeout`` for probes still running, so a caller never
+        opens a port the inventory is sniffing.
+        """
+        busy = self.busy() if self.busy else ()
+        with self._probed:
+            self._probed.wait_for(lambda: not self._probing, timeout)
+            for device, entry in self._entries.items():
+                if entry["probe_state"] == "found" and device not in busy:
+                    return self._ports[device], entry["baud"], entry["heartbeat"]
+        return None
+
+    def release(self, device, timeout=PROBE_SECONDS):
+        """Cancel any background probe of ``device`` and wait until it has closed the port"""
+        with self._probed:
+            stop = self._probing.get(device)
+            if stop is None:
+                return
+            stop.set()
+            self._probed.wait_for(lambda: device not in self._probing, timeout)
+
+    def forget(self, device):
+        """Drop what a probe found on ``device``, e.g. after connecting to it failed"""
+        with self._lock:
+            entry = self._entries.get(device)
+            if entry is None or entry["probe_state"] != "found":
+                return
+            self._entries[device] = dict(entry, probe_state=None, baud=None, heartbeat=None)
+            self._publish(time.time())
+
+    # ----- updates -----
+    def refresh(self):
+        """Enumerate once and apply what changed; returns the events recorded"""
+        current = {port.device: port for port in list_ports.comports()}
+        now = time.time()
+        initial = self._snapshot is None
+        probe = []
+        with self._lock:
+            busy = self.busy() if self.auto_probe and self.busy else ()
+            events = []
+            for device, port in list(self._ports.items()):
+                if device not in current or not same_device(current[device], port):
+                    del self._ports[device]
+                    stop = self._probing.pop(device, None)
+                    if stop is not None:
+                        stop.set()
+                    events.append(self._record("removed", self._entries.pop(device), now))
+            for device, port in current.items():
+                if device not in self._ports:
+                    entry = self._entries[device] = describe(port)
+                    self._ports[device] = port
+                    if initial:
+                        continue
+                    # Ports present at start-up may already be in use, so only new arrivals are probed
+                    if self.auto_probe and device not in busy:
+                        entry["probe_state"] = "probing"
+                        self._probing[device] = threading.Event()
+                        probe.append((port, self._probing[device]))
+                    events.append(self._record("added", entry, now))
+            if events or initial:
+                self._publish(now)
+                self._probed.notify_all()
+
+        for event in events:
+            entry = event["port"]
+            icon = "🔌" if event["event"] == "added" else "⏏️"
+            print(f"{icon} Port {event['event']}: {entry['port']} - {entry['label'] or entry['description']}",
+                  file=sys.stderr)
+        for port, stop in probe:
+            threading.Thread(target=self._probe, args=(port, stop), name=f'probe-{port.device}', daemon=True).start()
+        return events
+
+    def _probe(self, port, stop):
+        found = None
+        try:
+            import pymavlink
+            found = probe_ports([port], self.cache, stop=stop)
+        except ImportError:
+            self.auto_probe = False
+        except Exception as e:
+            print(f"⚠️ Probe of {port.device} failed: {e}", file=sys.stderr)
+        now = time.time()
+        with self._probed:
+            if self._probing.get(port.device) is stop:
+                del self._probing[port.device]
+            if self._ports.get(port.device) is port:
+                entry = dict(self._entries[port.device], probe_state=None)
+                if found:
+                    entry.update(probe_state="found", baud=found[1], heartbeat=found[2])
+                elif self.auto_probe and not stop.is_set():
+                    # A cancelled probe proves nothing, so the port is left unprobed
+                    entry["probe_state"] = "silent"
+                self._entries[port.device] = entry
+                if entry["probe_state"]:
+                    self._record("probed", entry, now)
+                self._publish(now)
+            self._probed.notify_all()
+        if found:
+            print(f"✅ Autopilot on {port.device} at {found[1]} baud (system {found[2]['system_id']})",
+                  file=sys.stderr)
+
+    def _record(self, kind, entry, now):
+        self.version += 1
+        event = {"version": self.version, "event": kind, "time": now, "port": entry}
+        self._events.append(event)
+        return event
+
+    def _publish(self, now):
+        # Readers take the snapshot without the lock, so it is replaced, never changed in place
+        self._snapshot = {"ports": list(self._entries.values()), "version": self.version, "updated_at": now}
@@ -0,0 +1,130 @@
+"""
+Parallel MAVLink heartbeat probe with a remembered port/baud cache
+"""
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BAUD_RATES = [57600, 115200, 9600]
+CACHE_PATH = os.path.join(os.path.expanduser('~'), '.utms', 'port_cache.json')
+
+# Time to listen on one port/baud pair; autopilots send HEARTBEAT at 1 Hz
+LISTEN_TIMEOUT = 1.5
+
+
+def usb_key(port):
+    """Identify a port by USB VID:PID when available, otherwise by device name"""
+    if port.vid is not None and port.pid is not None:
+        return f"{port.vid:04X}:{port.pid:04X}"
+    return port.device
+
+
+class PortCache:
+    """Last successful port/baud per USB VID:PID, persisted as JSON"""
+    def __init__(self, path=CACHE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            with open(path) as f:
+                self._entries = json.load(f)
+        except (OSError, ValueError):
+            self._entries = {}
+
+    def lookup(self, port):
+        entry = self._entries.get(usb_key(port))
+        return entry.get("baud") if entry else None
+
+    def remember(self, port, baud):
+        with self._lock:
+            self._entries[usb_key(port)] = {"port": port.device, "baud": baud}
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                with open(self.path, 'w') as f:
+                    json.dump(self._entries, f, indent=2)
+            except OSError as e:
+                print(f"Could not save port cache: {e}", file=sys.stderr)
+
+
+def sniff_heartbeat(device, baud, timeout=LISTEN_TIMEOUT, stop=None):
+    """Open device at baud just long enough to see an autopilot HEARTBEAT.
+
+    Returns a dict describing the heartbeat, or None.
+    """
+    from pymavlink import mavutil
+
+    try:
+        conn = mavutil.mavlink_connection(device, baud=baud)
+    except Exception:
+        return None
+    try:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline and not (stop and stop.is_set()):
+            msg = conn.recv_match(type='HEARTBEAT', blocking=True, timeout=0.2)
+            if msg is None:
+                continue
+            # Ignore other ground stations sharing the link
+            if msg.type == mavutil.mavlink.MAV_TYPE_GCS:
+                continue
+            if msg.autopilot == mavutil.mavlink.MAV_AUTOPILOT_INVALID:
+                continue
+            return {
+                "system_id": msg.get_srcSystem(),
+                "vehicle_type": msg.type,
+                "autopilot": msg.autopilot
+            }
+        return None
+    except Exception:
+        return None
+    finally:
+        try:
+            conn.close()
+        except:
+            pass
+
+
+def probe_ports(ports, cache=None, baud_rates=BAUD_RATES, timeout=LISTEN_TIMEOUT, stop=None):
+    """Probe all ports concurrently and return (port, baud, heartbeat) for the first autopilot.
+
+    A serial device can only be opened once, so bauds for one port are tried
+    in turn (cached baud first) while all ports are probed in parallel.
+    Setting ``stop`` cancels the probe. Returns None if no port produced a
+    heartbeat.
+    """
+    if not ports:
+        return None
+    stop = stop or threading.Event()
+    found = []
+    found_lock = threading.Lock()
+
+    def probe(port):
+        bauds = list(baud_rates)
+        cached = cache.lookup(port) if cache else None
+        if cached in bauds:
+            bauds.remove(cached)
+        if cached:
+            bauds.insert(0, cached)
+        for baud in bauds:
+            if stop.is_set():
+                return
+            print(f"Probing {port.device} at {baud} baud...", file=sys.stderr)
+            heartbeat = sniff_heartbeat(port.device, baud, timeout, stop)
+            if heartbeat:
+                with found_lock:
+                    if not found:
+                        found.append((port, baud, heartbeat))
+                stop.set()
+                return
+
+    with ThreadPoolExecutor(max_workers=len(ports)) as pool:
+        for port in ports:
+            pool.submit(probe, port)
+
+    if not found:
+        return None
+    port, baud, heartbeat = found[0]
+    if cache:
+        cache.remember(port, baud)
+    return port, baud, heartbeat